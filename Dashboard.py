@@ -3,20 +3,19 @@
 # load packages
 import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
 from streamlit_folium import folium_static
-import geopandas as gpd
 
 # functions
-from modules.openMeteo_API import refresh_data_if_needed
-from modules.preprocessing import preprocess_weather_data, scaling
-from modules.model_forecast import load_model, predict_energy_production
-from modules.geopredictions import geo_pred
-from modules.offshore import create_offshore_dataframe
-from modules.folium_map import create_map
+from modules.pipeline import load_latest_snapshot
+from modules.scheduler import start_background_scheduler
+from modules.folium_map import create_map, render_dynamic_map
 from modules.fed_state_bokeh import create_fed_state_production_plot
 from modules.bokeh_plot import generate_energy_forecast_plot
 from modules.co2_visual import saved_emissions
 from modules.household_calc import household
+from modules.consumption import load_consumption_lookup
+from modules.offshore import farm_names
 
 # Set page configuration
 st.set_page_config(
@@ -37,56 +36,42 @@ st.sidebar.markdown("Use the controls below to filter the data:")
 # Main title
 st.title("Renewable Electricity Outlook: Wind & Solar Forecast", anchor='left', help='Predictions for renewable electricity.')
 
-# checks if the weather data is up to date or if needs to be reloaded because a date change
-# it saves the output 'weather_data' of the openMeteo API as dataframe in streamlit session_state
-# standard setting is to fetch 7 predicted and 3 past days of weather conditions   
-# see openMeteo_API.py for more information
-refresh_data_if_needed()
-
-weather_data = st.session_state.weather_data
-
-# check if preprocessed data 'prep' is already in session_state; if not, calculate and store it in session_state
-# preprocess the weather data
-# see preprocessing.py for more information
-if 'prep' not in st.session_state:
-    prep = preprocess_weather_data(weather_data)
-    st.session_state.prep = prep
-
-# use the pretrained scaler on the preprocessed weather data
-# see preprocessing.py for more information
-prep_data = scaling(st.session_state.prep)
-
-# load trained model
-# see model_forecast.py for more information
-model = load_model()
-
-# predict energy production
-target_columns = ['windpower', 'solar_pv']
-
-# check if predictions are in session_state; if not, calculate and store them
-# check if prediction data 'predictions' is already in session_state; if not, calculate and store it in session_state
-# see model_forecast.py for more information
-if 'predictions' not in st.session_state:
-    predictions = predict_energy_production(model, prep_data, target_columns)
-    st.session_state.predictions = predictions
-
-#Create a DataFrame for predicted energy production
-predictions_df = pd.DataFrame(st.session_state.predictions, columns=target_columns, index=prep_data.index)
-
-# check if consumption data 'consumption_df' is already in session_state; if not, load and store it in session_state
-# only needed for a reference value presented in the dashboard, not for predictions 
-# Load consumption data
-if 'consumption_df' not in st.session_state:
-    consumption_df = pd.read_csv('data/consumption.csv', sep=',')
-    st.session_state.consumption_df = consumption_df
-
-# Load GeoJSON file and the nominal installed capacity for federal states in germany (as of november 2024)
-gdf = gpd.read_file('data/nominal_production_geo.geojson')
-# calculates contributions of wind and pv electricity per federal state in germany based on nominal installed capacities 
+# the forecast pipeline (weather data, preprocessing, scaling, predictions, geo and offshore contributions)
+# runs in a background scheduler ahead of the users and publishes versioned snapshots, the dashboard only reads them
+# the scheduler can also run as a standalone process: python -m modules.scheduler
+# see pipeline.py and scheduler.py for more information
+scheduler = start_background_scheduler()
+snapshot = load_latest_snapshot()
+if snapshot is None:
+    # only on the very first start, wait until the scheduler published its first snapshot
+    with st.spinner('Calculating predictions, please wait...'):
+        scheduler.ready.wait()
+    snapshot = load_latest_snapshot()
+    if snapshot is None:
+        st.error('The forecast could not be calculated. Please try again later.')
+        st.stop()
+
+# preprocessed weather data (used for the weather icons)
+prep = snapshot['prep']
+# predicted energy production
+predictions_df = snapshot['predictions_df']
+# federal state geometries (GeoJSON with the nominal installed capacity for federal states in germany as of november 2024)
+gdf = snapshot['gdf']
+# simplified geometries for the maps (snapshots of older versions only have the full resolution)
+map_gdf = snapshot.get('map_gdf', gdf)
+# contributions of wind and pv electricity per federal state and day in germany based on nominal installed capacities 
 # and the electricity predictions. This is an approximation to present the possibilities of the dashboard 
-# if regional data would be accessible to train the model
+# if regional data would be accessible to train the model. The geometry is only joined when rendering the map
 # see geopredictions.py for more information
-geo_df = geo_pred(gdf, predictions_df)
+contributions = snapshot['contributions']
+# offshore contributions, this data was not considered in the federal state contributions and needs to be added manually
+# see offshore.py for more information
+df_offshore = snapshot['df_offshore']
+
+# average consumption per calendar day, loaded once per process as lookup array
+# only needed for a reference value presented in the dashboard, not for predictions 
+# see consumption.py for more information
+consumption_lookup = load_consumption_lookup()
 
 ################ STREAMLIT APP #######################
 
@@ -97,9 +82,20 @@ date_choice = st.sidebar.selectbox(label='Select a day', options=predictions_df.
 st.sidebar.markdown("<p style='font-size: 12px; color: grey;'>Select a date to view the predicted electricity production and weather conditions for that day.</p>", unsafe_allow_html=True)
 
 st.sidebar.markdown("<hr>", unsafe_allow_html=True)
-state_choice = st.sidebar.selectbox(label='Select a state', options=geo_df['GEN'].tolist() + ['North Sea', 'Baltic Sea'])
+# offshore regions are selected by their key and shown with their display name (see offshore.py)
+offshore_names = farm_names(df_offshore)
+state_choice = st.sidebar.selectbox(label='Select a state', options=gdf['GEN'].tolist() + list(offshore_names), format_func=lambda region: offshore_names.get(region, region))
+state_label = offshore_names.get(state_choice, state_choice)
 st.sidebar.markdown("<p style='font-size: 12px; color: grey;'>Choose a federal state or offshore region to view the corresponding electricity production forecast.</p>", unsafe_allow_html=True)
 
+# embed all days and regions in the charts and switch them in the browser (no rerun of the dashboard)
+client_side = st.sidebar.checkbox(label='Switch charts in the browser', value=False)
+st.sidebar.markdown("<p style='font-size: 12px; color: grey;'>Adds a selector to the map, the CO2 and the state charts which changes the day or region directly in the chart.</p>", unsafe_allow_html=True)
+
+# quantiles of perturbed weather scenarios (snapshots of older versions have none)
+show_uncertainty = st.sidebar.checkbox(label='Show uncertainty bands', value=True, disabled='scenario_quantiles' not in snapshot)
+st.sidebar.markdown("<p style='font-size: 12px; color: grey;'>Shades the range of the production forecast for 200 scenarios with stronger or weaker wind and radiation.</p>", unsafe_allow_html=True)
+
 st.sidebar.markdown("<hr>", unsafe_allow_html=True)
 
 # Download options for data in the sidebar
@@ -109,21 +105,13 @@ selected_download = st.sidebar.selectbox(label='Choose data to download', option
 if selected_download == 'Predictions Data':
     st.sidebar.download_button(label='Download Predictions Data', data=predictions_df.to_csv(), file_name='predictions_data.csv', mime='text/csv')
 elif selected_download == 'Geo Data':
-    st.sidebar.download_button(label='Download Geo Data', data=geo_df.to_csv(), file_name='geo_data.csv', mime='text/csv')
-
-
-# load offshore data and save in session_state
-# this data was not considered in geo_df and needs to be added manually
-# see offshore.py for more information
-if 'df_offshore' not in st.session_state:
-    df_offshore = create_offshore_dataframe(predictions_df)
-    st.session_state.df_offshore = df_offshore
+    st.sidebar.download_button(label='Download Geo Data', data=contributions.to_csv(), file_name='geo_data.csv', mime='text/csv')
 
 
 ######## Weather ICONS ########
 # create weather icons from the loaded open meteo weather data
 # this is only for dashboard design and completeness but not needed for the model predictions
-weather = st.session_state.prep.reset_index()
+weather = prep.reset_index()
 df = pd.DataFrame(weather)
 df['date'] = pd.to_datetime(df['date'])
 
@@ -256,7 +244,7 @@ st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
 
 # print selected date and state
 st.markdown(f"**Currently Selected Date:** {date_choice}")
-st.markdown(f"**Currently Selected State/Region:** {state_choice}")
+st.markdown(f"**Currently Selected State/Region:** {state_label}")
 st.markdown("<hr>", unsafe_allow_html=True)
 
 # Creating the columns layout for the UI with adjusted ratios for responsiveness
@@ -282,7 +270,9 @@ col1, col2 = st.columns([1.8, 1], vertical_alignment="center")
 with col1:
     # create bokeh electricity production plot
     # see bokeh_plot.py for more information
-    pred_cons = generate_energy_forecast_plot(predictions_df, st.session_state.consumption_df)
+    pred_cons = generate_energy_forecast_plot(
+        predictions_df, consumption_lookup, snapshot.get('scenario_quantiles') if show_uncertainty else None
+    )
     st.bokeh_chart(pred_cons, use_container_width=True)
 
 
@@ -329,14 +319,25 @@ with col2:
 col1, col2 = st.columns([1.8, 1], vertical_alignment="center")
     
 with col1:
-    # add selected date
-    st.markdown(f"**Currently Selected Date:** {date_choice}")
+    # add selected date (the map in the browser has its own day selector)
+    if client_side:
+        st.markdown("**Select the date on the map**")
+    else:
+        st.markdown(f"**Currently Selected Date:** {date_choice}")
     # create the map and add spinner for loading time
     # see folium_map.py for more information
     with st.spinner('Calculating predictions, please wait...'):
-        m = create_map(geo_df, date_choice, st.session_state.df_offshore)
+        if client_side:
+            # all days in one map, the day is switched on the map itself (rendered once per snapshot,
+            # independent of the sidebar day, so changing it does not send the map again)
+            map_html = render_dynamic_map(snapshot['version'], map_gdf, contributions, df_offshore)
+        else:
+            m = create_map(map_gdf, contributions, date_choice, df_offshore)
     # this activates the map
-    folium_static(m, width=500, height=500) # , width=500, height=500
+    if client_side:
+        components.html(map_html, width=500, height=510)
+    else:
+        folium_static(m, width=500, height=500) # , width=500, height=500
 
 with col2:
     # add selected date
@@ -344,7 +345,7 @@ with col2:
     # create the co2 savings plot and add spinner for loading time
     # see co2_visual.py for more information
     with st.spinner('Calculating predictions, please wait...'):
-        emissions = saved_emissions(predictions_df, date_choice)
+        emissions = saved_emissions(predictions_df, date_choice, client_side)
     st.bokeh_chart(emissions, use_container_width=True)
 
 st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
@@ -354,9 +355,9 @@ st.markdown("<hr>", unsafe_allow_html=True)
 st.markdown("### Daily Electricity Production by State")
 st.markdown("Electricity production for all predicted days and the chosen federal state or offshore location.")
 # add selected federal state 'state_choice'
-st.markdown(f"**Currently Selected State/Region:** {state_choice}")
+st.markdown(f"**Currently Selected State/Region:** {state_label}")
 # create the federal state contribution plot and add spinner for loading time
 # see fed_state_bokeh.py for more information
 with st.spinner('Calculating predictions, please wait...'):
-    fed_plot = create_fed_state_production_plot(geo_df, state_choice, st.session_state.df_offshore)
+    fed_plot = create_fed_state_production_plot(contributions, state_choice, df_offshore, client_side)
 st.bokeh_chart(fed_plot, use_container_width=True)
\ No newline at end of file
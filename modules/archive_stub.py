@@ -0,0 +1,149 @@
+## local stand-in for the Open-Meteo archive (and forecast) endpoint
+#
+# usage: python -m modules.archive_stub [--port 8765]
+#        python -m modules.historical --start 2022-01-01 --end 2023-12-31 --url http://127.0.0.1:8765/v1/archive
+#
+# Answers the JSON requests of `fetch_locations_batched` and `fetch_location` (daily variables,
+# comma-separated coordinates, start_date/end_date or forecast_days/past_days) with synthetic but
+# plausible weather: seasonal cycles plus noise which only depends on location and date, so every
+# request for the same day returns the same values. No network access is needed.
+
+# load packages
+import json
+import argparse
+import datetime
+import threading
+import numpy as np
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# functions
+from modules.weather_store import local_today
+
+
+def synthetic_daily(latitude, longitude, dates, variables):
+    """Returns deterministic synthetic daily weather of one location.
+
+    Args:
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+        dates (list): Days (datetime.date).
+        variables (list): Requested daily variables.
+
+    Returns:
+        dict: Open-Meteo 'daily' object with `time` and one list per variable.
+    """
+    day_of_year = np.array([date.timetuple().tm_yday for date in dates])
+    season = np.cos(2 * np.pi * (day_of_year - 172) / 365.25)  # 1 at midsummer, -1 at midwinter
+    # noise seeded by location and day
+    noise = np.array([
+        np.random.default_rng([round(latitude * 1000) % 2**32, round(longitude * 1000) % 2**32, date.toordinal()]).standard_normal(6)
+        for date in dates
+    ])
+
+    daylight = 3600 * (12 + 4.2 * season * latitude / 52)
+    cloudiness = np.clip(0.55 - 0.1 * season + 0.2 * noise[:, 0], 0.05, 1)
+    temperature = 9.5 + 9 * season - 0.3 * (latitude - 51) + 3 * noise[:, 1]
+    spread = 5 + 5 * (1 - cloudiness)
+    wind = np.clip(4.5 + 0.8 * (latitude - 51) - 1.2 * season + 2 * noise[:, 2], 0.3, None) * (1.5 if latitude > 54.3 else 1)
+    precipitation_hours = np.clip(np.round(24 * cloudiness * (0.5 + 0.3 * noise[:, 3])), 0, 24)
+
+    values = {
+        'temperature_2m_max': temperature + spread / 2,
+        'temperature_2m_min': temperature - spread / 2,
+        'apparent_temperature_max': temperature + spread / 2 - 0.1 * wind,
+        'apparent_temperature_min': temperature - spread / 2 - 0.15 * wind,
+        'daylight_duration': daylight,
+        'sunshine_duration': daylight * (1 - cloudiness) * 0.9,
+        'precipitation_sum': precipitation_hours * np.abs(0.6 + 0.4 * noise[:, 4]),
+        'precipitation_hours': precipitation_hours,
+        'snowfall_sum': np.where(temperature < 0, 0.3 * precipitation_hours, 0),
+        'wind_speed_10m_max': wind,
+        'wind_gusts_10m_max': wind * (2 + 0.2 * np.abs(noise[:, 5])),
+        'wind_direction_10m_dominant': (220 + 80 * noise[:, 5]) % 360,
+        'shortwave_radiation_sum': np.clip(daylight / 3600 * (1 - 0.75 * cloudiness) * (0.6 + 0.6 * (season + 1)), 0.2, None),
+    }
+    daily = {'time': [date.isoformat() for date in dates]}
+    for variable in variables:
+        daily[variable] = np.round(values[variable], 2).tolist() if variable in values else [None] * len(dates)
+    return daily
+
+
+def requested_dates(query):
+    """Returns the days of a request (start_date/end_date or past_days/forecast_days around today in the requested time zone)."""
+    if 'start_date' in query:
+        start = datetime.date.fromisoformat(query['start_date'][0])
+        end = datetime.date.fromisoformat(query['end_date'][0])
+    else:
+        today = local_today(query.get('timezone', ['GMT'])[0])
+        start = today - datetime.timedelta(days=int(query.get('past_days', ['0'])[0]))
+        end = today + datetime.timedelta(days=int(query.get('forecast_days', ['7'])[0]) - 1)
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Answers GET /v1/archive and /v1/forecast with synthetic daily weather (JSON)."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in ('/v1/archive', '/v1/forecast'):
+            self.send_error(404, 'Unknown endpoint')
+            return
+        query = parse_qs(url.query)
+        try:
+            latitudes = [float(value) for value in query['latitude'][0].split(',')]
+            longitudes = [float(value) for value in query['longitude'][0].split(',')]
+            variables = ','.join(query.get('daily', [])).split(',')
+            dates = requested_dates(query)
+        except (KeyError, ValueError) as e:
+            self.send_error(400, f'Invalid request: {e}')
+            return
+
+        results = [
+            {'latitude': latitude, 'longitude': longitude, 'timezone': query.get('timezone', ['GMT'])[0],
+             'daily': synthetic_daily(latitude, longitude, dates, variables)}
+            for latitude, longitude in zip(latitudes, longitudes)
+        ]
+        # a single location is answered with an object, several with a list (like Open-Meteo)
+        body = json.dumps(results[0] if len(results) == 1 else results).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_in_thread(host='127.0.0.1', port=0):
+    """Starts the stand-in server in a background thread.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port, 0 for a free one.
+
+    Returns:
+        tuple: The server (call `shutdown()` to stop it) and the archive URL.
+    """
+    server = ThreadingHTTPServer((host, port), ArchiveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/v1/archive'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Open-Meteo archive and forecast endpoint.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), ArchiveHandler)
+    print(f"Serving http://{args.host}:{args.port}/v1/archive and /v1/forecast")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+## rolling-origin backtest (walk-forward evaluation) on the daily modeling data
+#
+# usage: python -m modules.backtest [--versions current <version>] [--window expanding|sliding]
+#                                   [--initial-days 365] [--horizon-days 30] [--workers 4]
+#
+# Every fold trains on the days before its origin (all of them or a sliding window) and predicts
+# the following `horizon` days, so the model never sees the future like with the random split of
+# the notebook. The model of a registry version is refitted (unfitted copy with the same
+# hyperparameters) per fold, the folds run in parallel in a process pool. The fitted scaler and the
+# scaled features of every fold are cached on disk. The errors are reported per target and month
+# of the year, `--output` writes the predictions of every fold.
+
+# load packages
+import os
+import pickle
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tabulate import tabulate
+from sklearn.base import clone
+from sklearn.exceptions import NotFittedError
+from sklearn.preprocessing import RobustScaler
+from sklearn.utils.validation import check_is_fitted
+
+# functions
+from modules.model_registry import current_version, load_bundle
+from modules.train import DATA_PATH, load_modeling_data
+
+
+# folder of the cached scalers and scaled features per fold
+BACKTEST_CACHE_DIR = 'data/backtest_cache'
+INITIAL_DAYS = 365
+HORIZON_DAYS = 30
+
+
+def rolling_origin_folds(dates, initial_days=INITIAL_DAYS, horizon_days=HORIZON_DAYS, step_days=None, window='expanding', window_days=None):
+    """Splits daily data into walk-forward folds.
+
+    The first origin is `initial_days` after the first date, every following origin `step_days`
+    later. A fold trains on the days before its origin and tests on the `horizon_days` from it.
+
+    Args:
+        dates (pd.Series): Date of every row.
+        initial_days (int): Days of the first training period.
+        horizon_days (int): Days predicted per fold.
+        step_days (int, optional): Days between two origins, defaults to `horizon_days` (no overlap).
+        window (str): 'expanding' (all days before the origin) or 'sliding' (the last `window_days`).
+        window_days (int, optional): Training days of a sliding window, defaults to `initial_days`.
+
+    Returns:
+        list: (origin, train row indices, test row indices) per fold.
+
+    Raises:
+        ValueError: If the window type is unknown or the data is too short for one fold.
+    """
+    if window not in ('expanding', 'sliding'):
+        raise ValueError(f"Unknown window '{window}', expected 'expanding' or 'sliding'.")
+    step = pd.Timedelta(days=step_days or horizon_days)
+    horizon = pd.Timedelta(days=horizon_days)
+    training = pd.Timedelta(days=window_days or initial_days)
+
+    dates = pd.to_datetime(pd.Series(dates)).reset_index(drop=True)
+    folds = []
+    origin = dates.min() + pd.Timedelta(days=initial_days)
+    while origin <= dates.max():
+        train = dates < origin
+        if window == 'sliding':
+            train &= dates >= origin - training
+        test = (dates >= origin) & (dates < origin + horizon)
+        if train.any() and test.any():
+            folds.append((origin, np.flatnonzero(train), np.flatnonzero(test)))
+        origin += step
+
+    if not folds:
+        raise ValueError(f"The data ({dates.min().date()} to {dates.max().date()}) is too short for a fold after {initial_days} days.")
+    return folds
+
+
+def unfitted_copy(model):
+    """Returns an unfitted copy of a model with the same hyperparameters (the model refitted per fold).
+
+    Works for sklearn estimators like `MultiOutputRegressor(StackingRegressor)` and `MultiOutputStack`
+    (see native_stack.py).
+
+    Args:
+        model (object): Fitted or unfitted model of a registry version.
+
+    Returns:
+        object: Unfitted model of the same type.
+
+    Raises:
+        ValueError: If the model cannot be copied without its fitted state (e.g. a compiled model,
+            see fast_inference.py) or the copy differs in type or hyperparameters.
+    """
+    try:
+        copy = clone(model)
+    except TypeError as e:
+        raise ValueError(f"{type(model).__name__} has no hyperparameters to refit it per fold, "
+                         f"backtest the sklearn model instead: {e}")
+
+    params = model.get_params(deep=True)
+    copy_params = copy.get_params(deep=True)
+    simple = (str, int, float, bool, type(None))
+    if (type(copy) is not type(model) or params.keys() != copy_params.keys()
+            or any(value != copy_params[key] and not pd.isna(value) for key, value in params.items() if isinstance(value, simple))):
+        raise ValueError(f"The unfitted copy of {type(model).__name__} does not have the same type and hyperparameters.")
+    try:
+        check_is_fitted(copy)
+    except NotFittedError:
+        return copy
+    raise ValueError(f"The copy of {type(model).__name__} is still fitted, it cannot be refitted per fold.")
+
+
+def fold_features(X_train, X_test, cache_dir=BACKTEST_CACHE_DIR):
+    """Fits the scaler on the training rows of a fold and scales both parts, cached on disk by content.
+
+    Args:
+        X_train (np.ndarray): Unscaled training features.
+        X_test (np.ndarray): Unscaled test features.
+        cache_dir (str, optional): Folder of the cache, None to disable it.
+
+    Returns:
+        tuple: Fitted scaler, scaled training and test features.
+    """
+    path = None
+    if cache_dir is not None:
+        digest = hashlib.sha256()
+        for array in (X_train, X_test):
+            digest.update(str(array.shape).encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        path = os.path.join(cache_dir, f'{digest.hexdigest()[:24]}.pkl')
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+
+    scaler = RobustScaler()
+    result = (scaler, scaler.fit_transform(X_train), scaler.transform(X_test))
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # unique temporary name, parallel folds may write the same entry
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    return result
+
+
+def run_fold(model, X, y, train, test, cache_dir=BACKTEST_CACHE_DIR):
+    """Scales the features of one fold, fits a copy of the model and predicts the test rows (runs in a worker process).
+
+    Returns:
+        np.ndarray: Predictions of the test rows with shape (rows, targets).
+    """
+    _, X_train, X_test = fold_features(X[train], X[test], cache_dir)
+    fitted = clone(model).fit(X_train, y[train])
+    return np.asarray(fitted.predict(X_test)).reshape(len(test), -1)
+
+
+def error_table(predictions, by):
+    """Aggregates the errors of the backtest predictions.
+
+    Args:
+        predictions (pd.DataFrame): Long table with `target`, `actual`, `predicted` and the grouping columns.
+        by (list): Grouping columns (e.g. ['target', 'month']).
+
+    Returns:
+        pd.DataFrame: Number of days, MAE, RMSE, bias (mean of predicted - actual) and MAPE in % per group.
+    """
+    error = predictions['predicted'] - predictions['actual']
+    frame = predictions[by].assign(
+        error=error,
+        abs_error=error.abs(),
+        squared_error=error ** 2,
+        # days without production have no percentage error
+        ape=(error.abs() / predictions['actual'].abs()).where(predictions['actual'] != 0) * 100,
+    )
+    grouped = frame.groupby(by)
+    return pd.DataFrame({
+        'days': grouped['error'].size(),
+        'mae': grouped['abs_error'].mean(),
+        'rmse': np.sqrt(grouped['squared_error'].mean()),
+        'bias': grouped['error'].mean(),
+        'mape': grouped['ape'].mean(),
+    })
+
+
+def backtest(model, data, features, targets, folds, workers=None, cache_dir=BACKTEST_CACHE_DIR):
+    """Runs the walk-forward evaluation of a model.
+
+    Args:
+        model (object): Fitted or unfitted model, an unfitted copy is trained per fold (see `unfitted_copy`).
+        data (pd.DataFrame): Daily data with `date`, features and targets (see `load_modeling_data`).
+        features (list): Features in the order of the model.
+        targets (list): Targets in the order of the model.
+        folds (list): Folds of `rolling_origin_folds`.
+        workers (int, optional): Processes of the pool, defaults to the number of cores.
+        cache_dir (str, optional): Folder of the scaler/feature cache, None to disable it.
+
+    Returns:
+        pd.DataFrame: One row per test day and target with `fold`, `origin`, `date`, `month`, `target`, `actual` and `predicted`.
+
+    Raises:
+        ValueError: If the model cannot be refitted (see `unfitted_copy`).
+    """
+    X = data[features].to_numpy(dtype=np.float64)
+    y = data[targets].to_numpy(dtype=np.float64)
+    dates = pd.to_datetime(data['date']).to_numpy()
+
+    # only the hyperparameters are sent to the workers, not the fitted trees
+    model = unfitted_copy(model)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_fold, model, X, y, train, test, cache_dir) for _, train, test in folds]
+        results = [future.result() for future in futures]
+
+    frames = []
+    for fold, ((origin, _, test), prediction) in enumerate(zip(folds, results)):
+        for i, target in enumerate(targets):
+            frames.append(pd.DataFrame({
+                'fold': fold,
+                'origin': origin,
+                'date': dates[test],
+                'target': target,
+                'actual': y[test, i],
+                'predicted': prediction[:, i],
+            }))
+    predictions = pd.concat(frames, ignore_index=True)
+    predictions['month'] = predictions['date'].dt.month
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Walk-forward evaluation of registry model versions on the modeling data.')
+    parser.add_argument('--versions', nargs='+', default=['current'], help="registry versions ('current', 'legacy' or a version)")
+    parser.add_argument('--data', default=DATA_PATH, help='CSV with the features and targets')
+    parser.add_argument('--window', choices=['expanding', 'sliding'], default='expanding', help='training window of the folds')
+    parser.add_argument('--initial-days', type=int, default=INITIAL_DAYS, help='days of the first training period (and of a sliding window)')
+    parser.add_argument('--horizon-days', type=int, default=HORIZON_DAYS, help='days predicted per fold')
+    parser.add_argument('--step-days', type=int, help='days between two origins (default: horizon)')
+    parser.add_argument('--workers', type=int, help='processes of the pool (default: cores)')
+    parser.add_argument('--no-cache', action='store_true', help='do not cache the scalers and scaled features')
+    parser.add_argument('--output', help='CSV for the predictions of all folds')
+    args = parser.parse_args()
+
+    summaries, results = {}, []
+    for version in args.versions:
+        version = current_version() if version == 'current' else version
+        bundle = load_bundle(version)
+
+        data = load_modeling_data(args.data, bundle.col_order, bundle.target_columns)
+        folds = rolling_origin_folds(data['date'], args.initial_days, args.horizon_days, args.step_days, args.window)
+        print(f"Backtest of {version}: {len(folds)} folds ({args.window} window), {folds[0][0].date()} to {data['date'].max().date()}")
+
+        predictions = backtest(
+            bundle.model, data, bundle.col_order, bundle.target_columns, folds, args.workers,
+            None if args.no_cache else BACKTEST_CACHE_DIR
+        )
+        print(tabulate(error_table(predictions, ['target', 'month']).reset_index(), headers='keys', tablefmt='simple', floatfmt='.2f', showindex=False))
+        summaries[version] = error_table(predictions, ['target'])
+        results.append(predictions.assign(version=version))
+
+    print("\nPer target:")
+    summary = pd.concat(summaries, names=['version']).reset_index()
+    print(tabulate(summary, headers='keys', tablefmt='simple', floatfmt='.2f', showindex=False))
+
+    if args.output:
+        pd.concat(results, ignore_index=True).to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+## headless batch forecast without streamlit
+#
+# usage: python -m modules.batch_forecast --output predictions.csv
+#        python -m modules.batch_forecast --output predictions.parquet --geo-output states.json --offshore-output offshore.csv
+
+# load packages
+import os
+import argparse
+import pandas as pd
+
+# functions
+from modules.pipeline import run_pipeline
+from modules.geometry import GEOJSON_PATH
+
+
+FORMATS = ('csv', 'parquet', 'json')
+
+
+def write_table(df, path, file_format=None):
+    """Writes a DataFrame as CSV, Parquet or JSON.
+
+    Args:
+        df (pd.DataFrame): Data to write. Geometry columns are dropped.
+        path (str): Output file.
+        file_format (str, optional): 'csv', 'parquet' or 'json'. Defaults to the file extension of `path`.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if file_format is None:
+        file_format = os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported format '{file_format}', expected one of {FORMATS}.")
+
+    # plain DataFrame without geometry
+    df = pd.DataFrame(df.drop(columns='geometry', errors='ignore'))
+
+    if file_format == 'csv':
+        df.to_csv(path)
+    elif file_format == 'parquet':
+        df.to_parquet(path)
+    else:
+        df.to_json(path, orient='table', date_format='iso', indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict wind and solar electricity in germany without the dashboard.')
+    parser.add_argument('--output', required=True, help='file for the national predictions (.csv, .parquet or .json)')
+    parser.add_argument('--geo-output', help='file for the contributions per federal state')
+    parser.add_argument('--offshore-output', help='file for the offshore contributions')
+    parser.add_argument('--format', choices=FORMATS, help='output format (defaults to the file extension)')
+    parser.add_argument('--days', type=int, default=7, help='number of forecast days')
+    parser.add_argument('--past-days', type=int, default=3, help='number of past days')
+    parser.add_argument('--geojson', default=GEOJSON_PATH, help='nominal installed capacity per federal state')
+    parser.add_argument('--offshore-farms', help='CSV of offshore wind farms (region key, optional display name, latitude, longitude, windpower capacity in MW)')
+    args = parser.parse_args()
+
+    offshore_farms = pd.read_csv(args.offshore_farms) if args.offshore_farms else None
+    result = run_pipeline(args.days, args.past_days, args.geojson, offshore_farms)
+
+    write_table(result['predictions_df'], args.output, args.format)
+    if args.geo_output:
+        write_table(result['contributions'], args.geo_output, args.format)
+    if args.offshore_output:
+        write_table(result['df_offshore'], args.offshore_output, args.format)
+
+
+if __name__ == '__main__':
+    main()
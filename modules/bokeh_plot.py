@@ -2,50 +2,60 @@ import pandas as pd
 from bokeh.plotting import figure, curdoc
 from bokeh.models import ColumnDataSource, HoverTool, Span, DatetimeTickFormatter, DaysTicker
 from bokeh.palettes import Viridis256
-from bokeh.colors import RGB
-import matplotlib.cm as colormaps
+
+from modules.consumption import consumption_for_dates
+from modules.palette import WIND_COLOR, SOLAR_COLOR
+from modules.figure_cache import memoize_data
+from modules.scenarios import quantile_column
 # from bokeh.io import output_notebook
 # only needed for depictions in jupyter notebooks not for python scripts
 # output_notebook()
 
-def generate_energy_forecast_plot(predictions_df, consumption_df):
+@memoize_data()
+def _forecast_plot_data(predictions_df, consumption_lookup, quantiles_df=None):
+    """Returns the data source columns of the forecast plot and the quantile bands (low, high)."""
+    predictions_df = predictions_df.reset_index()
+    predictions_df['date'] = pd.to_datetime(predictions_df['date'])
+
+    # Extract corresponding average consumption (weekday or weekend value of the calendar day)
+    predictions_df['avg_consumption'] = consumption_for_dates(consumption_lookup, predictions_df['date'])
+
+    # Prepare data for Bokeh plot
+    predictions_df['total_renewable'] = predictions_df['windpower'] + predictions_df['solar_pv']
+
+    # outer quantiles (and the next inner ones) of the scenarios as bands
+    bands = []
+    if quantiles_df is not None:
+        quantiles = sorted({float(column.rsplit('_p', 1)[1]) / 100 for column in quantiles_df.columns})
+        bands = [(quantiles[i], quantiles[-1 - i]) for i in range(min(2, len(quantiles) // 2))]
+        quantiles_df = quantiles_df.reset_index()
+        quantiles_df['date'] = pd.to_datetime(quantiles_df['date'])
+        predictions_df = predictions_df.merge(quantiles_df, on='date', how='left')
+
+    return {column: predictions_df[column].to_numpy() for column in predictions_df.columns}, bands
+
+
+def generate_energy_forecast_plot(predictions_df, consumption_lookup, quantiles_df=None):
     """Creates a Bokeh plot showing renewable electricity production forecasts against average electricity consumption.
 
     Args:
         predictions_df (pd.DataFrame): Forecast data with 'windpower', 'solar_pv', and 'date' columns.
-        consumption_df (pd.DataFrame): Approximation of average consumption data with 'calendar_day' and weekday/weekend values.
+        consumption_lookup (np.ndarray): Approximation of average consumption per calendar day and weekday/weekend 
+                                         (see `load_consumption_lookup` in consumption.py).
+        quantiles_df (pd.DataFrame, optional): Scenario quantiles by date (see `predict_scenarios` in scenarios.py), 
+                                               drawn as uncertainty bands of windpower and the total.
 
     Returns:
         bokeh.plotting.figure: Bokeh plot visualizing production and consumption with surplus/deficit shading.
     """
 
-    predictions_df = predictions_df.reset_index()
-    predictions_df['date'] = pd.to_datetime(predictions_df['date'])
-
-    # Determine if prediction dates are weekends or weekdays
-    predictions_df['day_of_week'] = predictions_df['date'].dt.weekday
-    predictions_df['is_weekend'] = predictions_df['day_of_week'] >= 5
-
-    # Extract corresponding average consumption
-    avg_consumptions = []
-    for date in predictions_df['date']:
-        calendar_day = date.strftime('%m-%d')
-        avg_row = consumption_df[consumption_df['calendar_day'] == calendar_day]
-        if not avg_row.empty:
-            if predictions_df.loc[predictions_df['date'] == date, 'is_weekend'].values[0]:
-                avg_consumptions.append(avg_row['avg_weekend_consumption'].values[0])
-            else:
-                avg_consumptions.append(avg_row['avg_weekday_consumption'].values[0])
-        else:
-            avg_consumptions.append(None)
-    predictions_df['avg_consumption'] = avg_consumptions
+    # columns prepared once per forecast (shared by all sessions), the figure is built per session
+    data, bands = _forecast_plot_data(predictions_df, consumption_lookup, quantiles_df)
 
     # Set theme for the plot - deactivate because of interference with streamlit
     curdoc().theme = None #'dark_minimal'
 
-    # Prepare data for Bokeh plot
-    predictions_df['total_renewable'] = predictions_df['windpower'] + predictions_df['solar_pv']
-    source = ColumnDataSource(predictions_df)
+    source = ColumnDataSource(data=dict(data))
 
     # Create the Bokeh plot
     p = figure(
@@ -59,16 +69,16 @@ def generate_energy_forecast_plot(predictions_df, consumption_df):
         outline_line_color=None
     )
 
-    # Convert 'cividis' colormap to RGB colors for Bokeh usage
-    cividis_cmap = colormaps.get_cmap('cividis')
-    solar_color = cividis_cmap(0.8)  # Yellowish tone
-    wind_color = cividis_cmap(0.2)  # Blueish tone
-    bokeh_solar_color = RGB(int(solar_color[0] * 255), int(solar_color[1] * 255), int(solar_color[2] * 255))
-    bokeh_wind_color = RGB(int(wind_color[0] * 255), int(wind_color[1] * 255), int(wind_color[2] * 255))
-
     # Plot windpower and solar production
-    p.varea(x='date', y1=0, y2='windpower', source=source, fill_color=bokeh_wind_color, alpha=0.8, legend_label='Windpower') #Viridis256[100]
-    p.varea(x='date', y1='windpower', y2='total_renewable', source=source, fill_color=bokeh_solar_color, alpha=0.8, legend_label='Solar PV') #Viridis256[150]
+    p.varea(x='date', y1=0, y2='windpower', source=source, fill_color=WIND_COLOR, alpha=0.8, legend_label='Windpower') #Viridis256[100]
+    p.varea(x='date', y1='windpower', y2='total_renewable', source=source, fill_color=SOLAR_COLOR, alpha=0.8, legend_label='Solar PV') #Viridis256[150]
+
+    # Plot uncertainty bands of windpower and the total (outer band lighter)
+    for band, (low, high) in enumerate(bands):
+        label = f'Uncertainty ({low:.0%}-{high:.0%})'
+        for target in ['windpower', 'total_renewable']:
+            p.varea(x='date', y1=quantile_column(target, low), y2=quantile_column(target, high), source=source,
+                    fill_color='white', fill_alpha=0.15 + 0.1 * band, legend_label=label)
 
     # Plot average consumption
     p.line(x='date', y='avg_consumption', source=source, color='black', line_dash='dashed', line_width=2, legend_label='Average Consumption')
@@ -82,13 +92,17 @@ def generate_energy_forecast_plot(predictions_df, consumption_df):
             fill_color=surplus_color, fill_alpha=0.2, legend_label='Surplus/Deficit', hatch_pattern='xx') #surplus_color
 
     # Add hover tool
-    hover = HoverTool(tooltips=[
+    tooltips = [
         # ('Date', '@date{%F}'),
         ('Windpower', '@windpower{0.0} GWh'),
         ('Solar PV', '@solar_pv{0.0} GWh'),
         ('Total Renewable', '@total_renewable{0.0} GWh'),
         ('Avg Consumption', '@avg_consumption{0.0} GWh')
-    ], formatters={'@date': 'datetime'})
+    ]
+    if bands:
+        low, high = (quantile_column('total_renewable', q) for q in bands[0])
+        tooltips.insert(3, (f'Total {bands[0][0]:.0%}-{bands[0][1]:.0%}', f'@{low}{{0.0}} - @{high}{{0.0}} GWh'))
+    hover = HoverTool(tooltips=tooltips, formatters={'@date': 'datetime'})
     p.add_tools(hover)
 
     # Additional formatting
@@ -104,7 +118,7 @@ def generate_energy_forecast_plot(predictions_df, consumption_df):
     p.legend.border_line_alpha = 0
 
     # Add a dashed vertical line for "Today"
-    today_date = predictions_df['date'].iloc[3]
+    today_date = pd.Timestamp(data['date'][3])
     vline_today = Span(location=today_date.timestamp() * 1000, 
                        dimension='height', line_color='white', line_dash='dashed', line_width=1)
     p.add_layout(vline_today)
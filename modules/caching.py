@@ -0,0 +1,74 @@
+## pluggable caching decorators for the dashboard and headless runs
+
+# load packages
+import os
+import sys
+import functools
+import threading
+
+
+# 'streamlit' uses st.cache_data / st.cache_resource, 'memory' a plain in-process cache.
+# Without setting RE_CACHE_BACKEND streamlit is only used if it was already imported (e.g. by Dashboard.py),
+# so headless scripts never import it.
+CACHE_BACKEND = os.environ.get('RE_CACHE_BACKEND') or ('streamlit' if 'streamlit' in sys.modules else 'memory')
+
+
+def _memoize(func):
+    """Caches the results of `func` for hashable arguments, other calls are computed every time."""
+    cache = {}
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. DataFrames as arguments
+            return func(*args, **kwargs)
+
+        with lock:
+            if key in cache:
+                return cache[key]
+        value = func(*args, **kwargs)
+        with lock:
+            cache[key] = value
+        return value
+
+    wrapper.clear = cache.clear
+    return wrapper
+
+
+def _decorator(streamlit_name, func, kwargs):
+    if CACHE_BACKEND == 'streamlit':
+        import streamlit as st
+        streamlit_decorator = getattr(st, streamlit_name)
+        return streamlit_decorator(func, **kwargs) if func is not None else streamlit_decorator(**kwargs)
+
+    return _memoize(func) if func is not None else _memoize
+
+
+def cache_data(func=None, **kwargs):
+    """Caches data returned by a function like `st.cache_data`, but works without streamlit as well.
+
+    Args:
+        func (callable, optional): Function to decorate (can be used with or without parentheses).
+        **kwargs: Arguments passed to `st.cache_data` (ignored by the memory backend).
+
+    Returns:
+        callable: The decorated function.
+    """
+    return _decorator('cache_data', func, kwargs)
+
+
+def cache_resource(func=None, **kwargs):
+    """Caches global resources like `st.cache_resource`, but works without streamlit as well.
+
+    Args:
+        func (callable, optional): Function to decorate (can be used with or without parentheses).
+        **kwargs: Arguments passed to `st.cache_resource` (ignored by the memory backend).
+
+    Returns:
+        callable: The decorated function.
+    """
+    return _decorator('cache_resource', func, kwargs)
@@ -1,26 +1,15 @@
 import pandas as pd
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource, HoverTool
+from bokeh.layouts import column
+from bokeh.models import ColumnDataSource, CustomJS, HoverTool, Select
 from bokeh.transform import dodge
-import matplotlib.cm as colormaps
-from bokeh.colors.rgb import RGB
 
-def saved_emissions(predictions_df, date_choice):
-    """Generates a Bokeh stacked bar plot showing CO2 savings from renewable electricity production.
-
-    This function:
-    - Estimates CO2 emissions avoided by wind and solar electricity production for a specific day.
-    - Uses predefined emission factors for gas, coal, and lignite.
-    - Visualizes the CO2 savings as a stacked bar plot for each fossil fuel type.
+from modules.palette import WIND_COLOR, SOLAR_COLOR
+from modules.figure_cache import memoize_data
 
-    Args:
-        predictions_df (pd.DataFrame): DataFrame containing predicted wind and solar electricity production 
-                                       with 'windpower' and 'solar_pv' columns.
-        date_choice (str): Date string in the format '%d/%m/%y' representing the day for which CO2 savings are visualized.
-
-    Returns:
-        bokeh.plotting.figure: A Bokeh stacked bar plot showing CO2 savings in kilotons for different fossil fuels.
-    """
+@memoize_data()
+def _savings_data(predictions_df, date_choice, client_side=False):
+    """Returns the data source columns of the CO2 savings plot and the fossil fuel types."""
 
     # create co2 emission data per energy carrier (gas, coal, lignite)
     # source: Umweltbundesamt (sekundärquelle mit verlinkung zur primärdatei: https://www.volker-quaschning.de/datserv/CO2-spez/index.php)
@@ -67,19 +56,48 @@ def saved_emissions(predictions_df, date_choice):
     wind_savings = [predictions_df_adj.loc[day_to_plot, f'co2_saved_wind_{fossil}'] for fossil in fossil_types]
     solar_savings = [predictions_df_adj.loc[day_to_plot, f'co2_saved_solar_{fossil}'] for fossil in fossil_types]
 
-    # Creating the ColumnDataSource for stacked bar chart
-    source = ColumnDataSource(data={
+    data = {
         'fossil_types': fossil_labels,
         'wind_savings': wind_savings,
         'solar_savings': solar_savings
-    })
+    }
+
+    if client_side:
+        # savings of every day, the selector copies the chosen day into the plotted columns
+        for day in predictions_df_adj.index:
+            data[f'wind_savings|{day}'] = [predictions_df_adj.loc[day, f'co2_saved_wind_{fossil}'] for fossil in fossil_types]
+            data[f'solar_savings|{day}'] = [predictions_df_adj.loc[day, f'co2_saved_solar_{fossil}'] for fossil in fossil_types]
+
+    return data, fossil_labels
+
 
-    # Convert 'cividis' colormap to RGB colors for Bokeh usage
-    cividis_cmap = colormaps.get_cmap('cividis')
-    wind_color = cividis_cmap(0.2)  # Blueish tone
-    solar_color = cividis_cmap(0.8)  # Yellowish tone
-    bokeh_wind_color = RGB(int(wind_color[0] * 255), int(wind_color[1] * 255), int(wind_color[2] * 255))
-    bokeh_solar_color = RGB(int(solar_color[0] * 255), int(solar_color[1] * 255), int(solar_color[2] * 255))
+def saved_emissions(predictions_df, date_choice, client_side=False):
+    """Generates a Bokeh stacked bar plot showing CO2 savings from renewable electricity production.
+
+    This function:
+    - Estimates CO2 emissions avoided by wind and solar electricity production for a specific day.
+    - Uses predefined emission factors for gas, coal, and lignite.
+    - Visualizes the CO2 savings as a stacked bar plot for each fossil fuel type.
+    - With `client_side`, embeds the savings of all days in the data source and adds a selector
+      which switches the day in the browser (without rerunning the dashboard).
+
+    Args:
+        predictions_df (pd.DataFrame): DataFrame containing predicted wind and solar electricity production 
+                                       with 'windpower' and 'solar_pv' columns.
+        date_choice (str): Date string in the format '%d/%m/%y' representing the day for which CO2 savings are visualized.
+        client_side (bool): Whether to embed all days and return the plot together with a day selector.
+
+    Returns:
+        bokeh.plotting.figure: A Bokeh stacked bar plot showing CO2 savings in kilotons for different fossil fuels
+                               (a layout of selector and plot with `client_side`).
+    """
+
+    # savings of the selected day (and with `client_side` of all days), prepared once per forecast and selection, the figure is built per session
+    data, fossil_labels = _savings_data(predictions_df, date_choice, client_side)
+    day_to_plot = date_choice
+
+    # Creating the ColumnDataSource for stacked bar chart
+    source = ColumnDataSource(data=dict(data))
 
     # Creating the Bokeh plot
     p = figure(
@@ -94,8 +112,8 @@ def saved_emissions(predictions_df, date_choice):
     )
 
     # Adding stacked bar chart
-    p.hbar(y=dodge('fossil_types', 0, range=p.y_range), right='solar_savings', height=0.4, source=source, color=bokeh_solar_color, alpha = 0.8, legend_label="Solar CO2 Savings")
-    p.hbar(y=dodge('fossil_types', 0, range=p.y_range), right='wind_savings', height=0.4, source=source, color=bokeh_wind_color, alpha = 0.8, legend_label="Wind CO2 Savings", left='solar_savings')
+    p.hbar(y=dodge('fossil_types', 0, range=p.y_range), right='solar_savings', height=0.4, source=source, color=SOLAR_COLOR, alpha = 0.8, legend_label="Solar CO2 Savings")
+    p.hbar(y=dodge('fossil_types', 0, range=p.y_range), right='wind_savings', height=0.4, source=source, color=WIND_COLOR, alpha = 0.8, legend_label="Wind CO2 Savings", left='solar_savings')
 
     # Adding titles and labels with specified colors
     p.title.text_color = "white"
@@ -123,5 +141,16 @@ def saved_emissions(predictions_df, date_choice):
     ]
     p.add_tools(hover)
 
+    if client_side:
+        select = Select(title='Select a day', value=day_to_plot, options=list(predictions_df.index.strftime('%d/%m/%y')))
+        select.js_on_change('value', CustomJS(args=dict(source=source), code="""
+            const data = source.data;
+            source.data = Object.assign({}, data, {
+                wind_savings: data['wind_savings|' + cb_obj.value],
+                solar_savings: data['solar_savings|' + cb_obj.value],
+            });
+        """))
+        return column(select, p)
+
     return p
 
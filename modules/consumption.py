@@ -0,0 +1,63 @@
+## average electricity consumption per calendar day as reference value (not used for the predictions)
+
+# load packages
+import numpy as np
+import pandas as pd
+
+from modules.caching import cache_resource
+
+
+CONSUMPTION_PATH = 'data/consumption.csv'
+
+# columns of the lookup array
+WEEKDAY, WEEKEND = 0, 1
+
+
+def leap_day_index(dates):
+    """Returns the position of dates in a leap-year calendar (0 = 1st of january, 59 = 29th of february, 365 = 31st of december).
+
+    Args:
+        dates (array-like): Dates to look up.
+
+    Returns:
+        np.ndarray: Day index between 0 and 365 per date.
+    """
+    dates = pd.DatetimeIndex(dates)
+    day_of_year = dates.dayofyear.to_numpy() - 1
+    # in common years all days after february are shifted by the missing 29th of february
+    return day_of_year + ((~dates.is_leap_year) & (dates.month > 2))
+
+
+@cache_resource
+def load_consumption_lookup(path=CONSUMPTION_PATH):
+    """Loads the average daily consumption once into a (day of a leap year x weekday/weekend) array.
+
+    Args:
+        path (str): CSV with `calendar_day` ('%m-%d'), `avg_weekday_consumption` and `avg_weekend_consumption` in GWh.
+
+    Returns:
+        np.ndarray: Consumption with shape (366, 2), NaN for calendar days missing in the file.
+    """
+    consumption_df = pd.read_csv(path, sep=',')
+    # 2000 is a leap year, so the 29th of february has its own row
+    days = leap_day_index(pd.to_datetime('2000-' + consumption_df['calendar_day'], format='%Y-%m-%d'))
+
+    lookup = np.full((366, 2), np.nan)
+    lookup[days, WEEKDAY] = consumption_df['avg_weekday_consumption'].to_numpy()
+    lookup[days, WEEKEND] = consumption_df['avg_weekend_consumption'].to_numpy()
+
+    return lookup
+
+
+def consumption_for_dates(lookup, dates):
+    """Returns the average consumption of the calendar day and weekday/weekend type of each date in one vectorized gather.
+
+    Args:
+        lookup (np.ndarray): Consumption lookup array (see `load_consumption_lookup`).
+        dates (array-like): Dates to look up.
+
+    Returns:
+        np.ndarray: Average consumption in GWh per date.
+    """
+    dates = pd.DatetimeIndex(dates)
+    return lookup[leap_day_index(dates), (dates.weekday >= 5).astype(int)]
@@ -0,0 +1,382 @@
+## compiled flat-array inference for the stacked multivariate model
+#
+# All trees of the stack (random forest and xgboost of every target) are exported into one set of
+# contiguous node arrays and evaluated in blocks of trees, level by level, with numpy. The linear
+# base models and the ridge final estimators are applied as matrix products.
+
+# load packages
+import json
+import numpy as np
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.ensemble import StackingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+# functions
+from modules.native_stack import MultiOutputStack
+
+
+def _depth(left, right):
+    """Returns the maximum depth of a tree given by its child arrays (-1 for leaves)."""
+    depth = np.zeros(len(left), dtype=np.int64)
+    # parents always come before their children in sklearn and xgboost trees
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def export_sklearn_tree(estimator, output=0):
+    """Exports a fitted sklearn regression tree into node arrays.
+
+    sklearn compares the features as float32 with `x <= threshold`.
+
+    Args:
+        estimator (DecisionTreeRegressor): Fitted tree.
+        output (int): Output of a multi-output tree, whose values are exported.
+
+    Returns:
+        dict: `feature`, `threshold`, `left`, `right`, `nan_left`, `value` per node (-1 children for leaves) and the `depth`.
+    """
+    tree = estimator.tree_
+    if output >= tree.n_outputs:
+        raise ValueError(f"The tree has {tree.n_outputs} outputs, output {output} does not exist.")
+
+    left = tree.children_left.astype(np.int64)
+    right = tree.children_right.astype(np.int64)
+    return {
+        'feature': np.where(left == -1, 0, tree.feature).astype(np.int64),
+        'threshold': tree.threshold.astype(np.float64),
+        'left': left,
+        'right': right,
+        # missing values are supported by newer sklearn versions only
+        'nan_left': np.asarray(getattr(tree, 'missing_go_to_left', np.zeros(len(left))), dtype=bool),
+        'value': tree.value[:, output, 0].astype(np.float64),
+        'depth': int(tree.max_depth),
+    }
+
+
+def export_xgboost(estimator, target=0):
+    """Exports the trees of a fitted `XGBRegressor` for one target into node arrays.
+
+    xgboost compares the float32 features with `x < split`, which equals `x <= threshold` with the
+    next smaller float32 as threshold, so both tree types share one comparison. Multi-target
+    boosters either have one tree per target and round (`multi_strategy='one_output_per_tree'`) or
+    trees with a leaf vector (`'multi_output_tree'`), whose `target` entry is exported.
+
+    Args:
+        estimator (XGBRegressor): Fitted model.
+        target (int): Target of a multi-target booster.
+
+    Returns:
+        tuple: List of node array dicts (see `export_sklearn_tree`) and the `base_score` of the target.
+
+    Raises:
+        ValueError: If the booster is not a gbtree with a squared error objective or has no such target.
+    """
+    model = json.loads(estimator.get_booster().save_raw('json'))
+    learner = model['learner']
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Only gbtree boosters can be compiled, got {learner['gradient_booster']['name']}.")
+    if learner['objective']['name'] != 'reg:squarederror':
+        raise ValueError(f"Only the reg:squarederror objective can be compiled, got {learner['objective']['name']}.")
+    n_targets = int(learner['learner_model_param'].get('num_target', 1))
+    if target >= n_targets:
+        raise ValueError(f"The booster has {n_targets} targets, target {target} does not exist.")
+
+    # e.g. '3.6649704E2', '[3.6649704E2]' or '[3.6E2,-8.3E-2]' depending on the xgboost version and targets
+    base_scores = learner['learner_model_param']['base_score'].strip('[]').split(',')
+    base_score = float(base_scores[target] if len(base_scores) > 1 else base_scores[0])
+
+    model = learner['gradient_booster']['model']
+    tree_info = model.get('tree_info', [0] * len(model['trees']))
+    trees = []
+    for tree, tree_target in zip(model['trees'], tree_info):
+        leaf_size = int(tree['tree_param'].get('size_leaf_vector', 1))
+        if leaf_size <= 1 and tree_target != target:
+            continue
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        right = np.asarray(tree['right_children'], dtype=np.int64)
+        split = np.asarray(tree['split_conditions'], dtype=np.float32)
+        if leaf_size > 1:
+            # leaves point with their right child to their vector in leaf_weights
+            is_leaf = left == -1
+            value = np.zeros(len(left))
+            value[is_leaf] = np.asarray(tree['leaf_weights'], dtype=np.float32)[right[is_leaf] * leaf_size + target]
+            right = np.where(is_leaf, -1, right)
+        else:
+            # leaves store their value in split_conditions
+            value = split.astype(np.float64)
+        trees.append({
+            'feature': np.where(left == -1, 0, tree['split_indices']).astype(np.int64),
+            'threshold': np.nextafter(split, np.float32(-np.inf)),
+            'left': left,
+            'right': right,
+            'nan_left': np.asarray(tree['default_left'], dtype=bool),
+            'value': value,
+            'depth': _depth(left, right),
+        })
+
+    return trees, base_score
+
+
+def export_stack(model):
+    """Exports a fitted stacked model into flat arrays.
+
+    Args:
+        model (MultiOutputRegressor or MultiOutputStack): Fitted model with one `StackingRegressor`
+            per target or one `MultiOutputStack` (see native_stack.py) of random forest, xgboost
+            and linear regression base models.
+
+    Returns:
+        tuple: Dict of numpy arrays and dict of metadata (`n_targets`, `n_base`, `n_features`, `depth`,
+               `passthrough`, `shared_meta`), the input of `CompiledStack`.
+
+    Raises:
+        ValueError: If the model contains estimators which cannot be compiled.
+    """
+    # (target, base models, output of the base models, final estimator) per target, the final
+    # estimator of a multi-output stack sees the base predictions of all targets (shared_meta)
+    shared_meta = isinstance(model, MultiOutputStack)
+    if shared_meta:
+        units = [(target, model.estimators_, target, None) for target in range(model.n_outputs_)]
+    else:
+        stacks = model.estimators_ if isinstance(model, MultiOutputRegressor) else [model]
+        for stack in stacks:
+            if not isinstance(stack, StackingRegressor):
+                raise ValueError(f"Expected a StackingRegressor per target, got {type(stack).__name__}.")
+        units = [(target, stack.estimators_, 0, stack) for target, stack in enumerate(stacks)]
+
+    nodes, nan_left, value = [], [], []
+    roots, weights, slots = [], [], []
+    # bias of every (target, base model) slot and linear base models
+    bias, linear_slots, linear_coef, linear_intercept = [], [], [], []
+    final_coef, final_intercept, passthrough = [], [], set()
+    n_base = None
+    n_features = int(model.n_features_in_)
+    depth = 0
+    offset = 0
+
+    def add_trees(trees, weight, slot):
+        nonlocal offset, depth
+        for tree in trees:
+            n_nodes = len(tree['left'])
+            is_leaf = tree['left'] == -1
+            own = np.arange(n_nodes) + offset
+            # float32 thresholds rounded down, so `x <= threshold` is unchanged for float32 features
+            threshold = tree['threshold'].astype(np.float32)
+            rounded_up = threshold.astype(np.float64) > tree['threshold']
+            threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+
+            # one row of (feature, threshold bits, right, left) per node, children as positions in the
+            # flattened array, leaves point to themselves
+            tree_nodes = np.empty((n_nodes, 4), dtype=np.int32)
+            tree_nodes[:, 0] = tree['feature']
+            tree_nodes[:, 1] = threshold.view(np.int32)
+            tree_nodes[:, 2] = 4 * np.where(is_leaf, own, tree['right'] + offset)
+            tree_nodes[:, 3] = 4 * np.where(is_leaf, own, tree['left'] + offset)
+
+            nodes.append(tree_nodes)
+            nan_left.append(tree['nan_left'])
+            value.append(tree['value'])
+            roots.append(4 * offset)
+            weights.append(weight)
+            slots.append(slot)
+            depth = max(depth, tree['depth'])
+            offset += n_nodes
+
+    for target, estimators, output, stack in units:
+        estimators = [estimator for estimator in estimators if estimator != 'drop']
+        if n_base is None:
+            n_base = len(estimators)
+        for position, estimator in enumerate(estimators):
+            slot = target * n_base + position
+            if isinstance(estimator, RandomForestRegressor):
+                trees = [export_sklearn_tree(tree, output) for tree in estimator.estimators_]
+                add_trees(trees, 1 / len(trees), slot)
+                bias.append(0.0)
+            elif type(estimator).__name__ == 'XGBRegressor':
+                trees, base_score = export_xgboost(estimator, output)
+                add_trees(trees, 1.0, slot)
+                bias.append(base_score)
+            elif isinstance(estimator, LinearRegression):
+                linear_slots.append(slot)
+                linear_coef.append(np.atleast_2d(estimator.coef_)[output])
+                linear_intercept.append(float(np.ravel(estimator.intercept_)[output]))
+                bias.append(0.0)
+            else:
+                raise ValueError(f"Base estimator {type(estimator).__name__} cannot be compiled.")
+
+        if stack is not None:
+            final_coef.append(np.ravel(stack.final_estimator_.coef_))
+            final_intercept.append(float(np.ravel(stack.final_estimator_.intercept_)[0]))
+            passthrough.add(bool(stack.passthrough))
+
+    if shared_meta:
+        final_coef = np.atleast_2d(model.final_estimator_.coef_)
+        final_intercept = np.ravel(model.final_estimator_.intercept_)
+        passthrough.add(False)
+    if len(passthrough) > 1:
+        raise ValueError("All stacks must use the same passthrough setting.")
+
+    arrays = {
+        'nodes': np.concatenate(nodes).ravel(),
+        'nan_left': np.concatenate(nan_left),
+        'value': np.concatenate(value).astype(np.float64),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'weights': np.asarray(weights, dtype=np.float64),
+        'slots': np.asarray(slots, dtype=np.int32),
+        'bias': np.asarray(bias, dtype=np.float64),
+        'linear_slots': np.asarray(linear_slots, dtype=np.int64),
+        # (0, features) without linear base models
+        'linear_coef': np.asarray(linear_coef, dtype=np.float64).reshape(len(linear_coef), n_features),
+        'linear_intercept': np.asarray(linear_intercept, dtype=np.float64),
+        'final_coef': np.asarray(final_coef, dtype=np.float64),
+        'final_intercept': np.asarray(final_intercept, dtype=np.float64),
+    }
+    meta = {'n_targets': len(units), 'n_base': n_base, 'n_features': n_features, 'depth': depth, 'passthrough': passthrough.pop(), 'shared_meta': shared_meta}
+    return arrays, meta
+
+
+class CompiledStack:
+    """Flat-array version of the `MultiOutputRegressor(StackingRegressor)` or `MultiOutputStack` model.
+
+    The trees of all random forests and xgboost models (of all targets) are stored in shared node
+    arrays. One prediction walks blocks of trees for chunks of rows with numpy (one tree level per
+    step for all (tree, row) pairs of the block, finished paths are dropped), then applies the
+    linear base models and the ridge final estimators.
+    The trees of multi-output base models are stored once per target.
+    Predictions match the sklearn model up to float rounding (xgboost sums its trees in float32).
+
+    Args:
+        arrays (dict): Node and coefficient arrays (see `export_stack`), may be memory-mapped.
+        meta (dict): Metadata of the arrays (see `export_stack`).
+    """
+    # rows per chunk and (tree, row) pairs per block of trees, small enough for the nodes of a
+    # block and the features of a chunk to stay in the CPU cache
+    ROWS_PER_CHUNK = 8192
+    PATHS_PER_BLOCK = 131072
+    # levels walked between two removals of finished paths
+    COMPACT_EVERY = 2
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.n_targets = meta['n_targets']
+        self.n_base = meta['n_base']
+        # artifacts written before n_features was stored always have linear base models
+        self.n_features = meta.get('n_features', self.linear_coef.shape[1])
+        self.depth = meta['depth']
+        self.passthrough = meta['passthrough']
+        # artifacts written before multi-output stacks existed have no shared_meta
+        self.shared_meta = meta.get('shared_meta', False)
+
+        # first tree of every slot with trees (trees of a slot are contiguous)
+        self._slot_starts = np.flatnonzero(np.r_[True, self.slots[1:] != self.slots[:-1]])
+        self._tree_slots = self.slots[self._slot_starts]
+
+    @classmethod
+    def from_model(cls, model):
+        """Compiles a fitted stacked model (see `export_stack`)."""
+        return cls(*export_stack(model))
+
+    def _leaf_positions(self, x_flat, n_rows, roots, has_nan):
+        """Walks a block of trees for a chunk of rows and returns the leaf position per (tree, row)."""
+        n_features = self.n_features
+        nodes = self.nodes
+
+        # one path per (tree, row) pair, positions are 4 * node index
+        positions = np.repeat(roots, n_rows)
+        current = positions
+        row_offset = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, len(roots))
+        active = np.arange(len(positions))
+        for level in range(self.depth + 1):
+            x = x_flat.take(nodes.take(current) + row_offset)
+            go_left = x <= nodes.take(current + 1).view(np.float32)
+            if has_nan:
+                go_left |= np.isnan(x) & self.nan_left.take(current // 4)
+            following = nodes.take(current + 2 + go_left)
+
+            # leaves point to themselves, paths which reached one are removed every few levels
+            if level % self.COMPACT_EVERY == self.COMPACT_EVERY - 1 or level == self.depth:
+                moving = following != current
+                if not moving.all():
+                    finished = ~moving
+                    positions[active[finished]] = following[finished]
+                    active = active[moving]
+                    following = following[moving]
+                    row_offset = row_offset[moving]
+            current = following
+            if not len(active):
+                break
+        positions[active] = current
+        return positions
+
+    def _tree_sums(self, X_tree, has_nan):
+        """Sums the leaf values of all trees per (target, base model) slot for a chunk of rows.
+
+        The trees are walked in blocks, so the path arrays stay small and a block reads only its
+        own part of the node arrays, however many rows the chunk has.
+        """
+        n_rows = len(X_tree)
+        x_flat = X_tree.ravel()
+        trees_per_block = max(1, self.PATHS_PER_BLOCK // n_rows)
+
+        leaf_values = np.empty((len(self.roots), n_rows))
+        for start in range(0, len(self.roots), trees_per_block):
+            block = slice(start, start + trees_per_block)
+            positions = self._leaf_positions(x_flat, n_rows, self.roots[block], has_nan)
+            leaf_values[block] = self.value.take(positions // 4).reshape(-1, n_rows)
+        leaf_values *= self.weights[:, None]
+        return np.add.reduceat(leaf_values, self._slot_starts, axis=0)
+
+    def base_predictions(self, X):
+        """Predicts all base models of all targets.
+
+        Args:
+            X (array-like): Scaled features with shape (rows, features).
+
+        Returns:
+            np.ndarray: Predictions with shape (rows, targets, base models).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        # trees compare float32 features (like sklearn and xgboost)
+        X_tree = X.astype(np.float32)
+        has_nan = bool(np.isnan(X_tree).any())
+
+        slot_sums = np.zeros((self.n_targets * self.n_base, len(X)))
+        if len(self.roots):
+            for start in range(0, len(X), self.ROWS_PER_CHUNK):
+                chunk = slice(start, start + self.ROWS_PER_CHUNK)
+                slot_sums[self._tree_slots, chunk] = self._tree_sums(X_tree[chunk], has_nan)
+        slot_sums += self.bias[:, None]
+        if len(self.linear_slots):
+            slot_sums[self.linear_slots] = self.linear_coef @ X.T + self.linear_intercept[:, None]
+
+        return slot_sums.reshape(self.n_targets, self.n_base, len(X)).transpose(2, 0, 1)
+
+    def predict(self, X):
+        """Predicts all targets.
+
+        Args:
+            X (array-like): Scaled features with shape (rows, features).
+
+        Returns:
+            np.ndarray: Predictions with shape (rows, targets).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        base = self.base_predictions(X)
+        if self.shared_meta:
+            return base.reshape(len(X), -1) @ self.final_coef.T + self.final_intercept
+        if self.passthrough:
+            meta = np.concatenate([base, np.repeat(X[:, None, :], self.n_targets, axis=1)], axis=2)
+        else:
+            meta = base
+        return np.einsum('rtm,tm->rt', meta, self.final_coef) + self.final_intercept
+
+
+def compile_model(model):
+    """Compiles a fitted stacked model into a `CompiledStack`."""
+    return CompiledStack.from_model(model)
+
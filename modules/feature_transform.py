@@ -0,0 +1,181 @@
+## fused feature transform on a (locations x days x variables) weather cube
+#
+# Computes the daily model features (see COL_ORDER in preprocessing.py) followed by the
+# RobustScaler with numpy on one array: unit conversions, temperature differences and wind
+# vectors per location, the compensated mean over the locations (like pandas' groupby mean),
+# wind speed and direction of the mean vector and the scaling in place.
+
+# load packages
+import numpy as np
+import pandas as pd
+
+# functions
+from modules.openMeteo_API import DAILY_VARIABLES
+from modules.preprocessing import COL_ORDER
+
+
+def weather_cube(weather_data, variables=DAILY_VARIABLES):
+    """Converts the weather data of the API into a (locations x days x variables) array.
+
+    Args:
+        weather_data (pd.DataFrame): Weather data with one row per city and date (see `get_weather_forecast`).
+        variables (list): Daily variables in the order of the last axis.
+
+    Returns:
+        tuple: The cube (missing city/date combinations are NaN), the cities (order of appearance)
+               and the sorted dates.
+    """
+    city_codes, cities = pd.factorize(weather_data['city'])
+    date_codes, dates = pd.factorize(weather_data['date'], sort=True)
+
+    values = weather_data[variables].to_numpy()
+    cube = np.full((len(cities), len(dates), len(variables)), np.nan, dtype=values.dtype)
+    cube[city_codes, date_codes] = values
+    return cube, list(cities), pd.DatetimeIndex(dates, name='date')
+
+
+class FeatureTransform:
+    """Daily model features (and their scaling) from a weather cube in one vectorized pass.
+
+    The output matches the former pandas preprocessing (daily `groupby('date').mean()` of the
+    locations, then `scaler.transform`) bit for bit: every step uses the same floating point
+    operations in the same order, the mean over the locations uses the compensated (Kahan)
+    summation of pandas and skips missing values.
+
+    Args:
+        scaler (sklearn.preprocessing.RobustScaler, optional): Fitted scaler, None for unscaled features.
+        variables (list): Daily variables of the cube (last axis).
+        col_order (list): Features in the order used for training.
+
+    Raises:
+        ValueError: If a feature cannot be computed from the variables.
+    """
+    # features which are location means of a daily variable (and the factor applied per location)
+    DIRECT = {
+        'temperature_2m_max': None, 'temperature_2m_min': None,
+        'apparent_temperature_max': None, 'apparent_temperature_min': None,
+        'daylight_duration': 3600, 'sunshine_duration': 3600,
+        'precipitation_sum': None, 'precipitation_hours': None, 'snowfall_sum': None,
+        'shortwave_radiation_sum': None, 'wind_gusts_10m_max': None,
+    }
+    # features which are location means of a difference of two daily variables
+    DIFFERENCES = {
+        'temp_diff_2m': ('temperature_2m_max', 'temperature_2m_min'),
+        'apparent_temp_diff': ('apparent_temperature_max', 'apparent_temperature_min'),
+    }
+
+    def __init__(self, scaler=None, variables=DAILY_VARIABLES, col_order=COL_ORDER):
+        self.variables = list(variables)
+        self.col_order = list(col_order)
+        missing = set(self.col_order) - set(self.DIRECT) - set(self.DIFFERENCES) - {'wind_speed_10m', 'wind_direction_10m'}
+        if missing:
+            raise ValueError(f"Unknown features {sorted(missing)}.")
+
+        index = {name: i for i, name in enumerate(self.variables)}
+        self.speed = self.col_order.index('wind_speed_10m')
+        self.direction = self.col_order.index('wind_direction_10m')
+        self.direct = [(self.col_order.index(name), index[name], factor) for name, factor in self.DIRECT.items() if name in self.col_order]
+        self.differences = [
+            (self.col_order.index(name), index[first], index[second])
+            for name, (first, second) in self.DIFFERENCES.items() if name in self.col_order
+        ]
+        self.wind_speed = index['wind_speed_10m_max']
+        self.wind_direction = index['wind_direction_10m_dominant']
+
+        self.center = None
+        self.scale = None
+        if scaler is not None:
+            if getattr(scaler, 'n_features_in_', len(self.col_order)) != len(self.col_order):
+                raise ValueError(f"The scaler expects {scaler.n_features_in_} features, col_order has {len(self.col_order)}.")
+            self.center = getattr(scaler, 'center_', None)
+            self.scale = getattr(scaler, 'scale_', None)
+
+    def features(self, cube):
+        """Computes the unscaled daily features.
+
+        Args:
+            cube (np.ndarray): Weather data with shape (..., locations, days, variables), leading
+                               dimensions (e.g. scenarios) are kept.
+
+        Returns:
+            np.ndarray: Features with shape (..., days, features) in the order of `col_order`.
+        """
+        cube = np.asarray(cube)
+        # per location values, u and v wind components take the place of wind speed and direction
+        rows = np.empty(cube.shape[:-1] + (len(self.col_order),), dtype=cube.dtype)
+        for column, variable, factor in self.direct:
+            if factor is None:
+                rows[..., column] = cube[..., variable]
+            else:
+                np.divide(cube[..., variable], factor, out=rows[..., column])
+        for column, first, second in self.differences:
+            np.subtract(cube[..., first], cube[..., second], out=rows[..., column])
+        radians = np.deg2rad(cube[..., self.wind_direction])
+        negative_speed = -cube[..., self.wind_speed]
+        np.multiply(negative_speed, np.sin(radians), out=rows[..., self.speed])
+        np.multiply(negative_speed, np.cos(radians), out=rows[..., self.direction])
+
+        features = self._mean_over_locations(rows)
+
+        # wind speed and direction of the mean wind vector
+        u = features[..., self.speed].copy()
+        v = features[..., self.direction].copy()
+        np.sqrt(u ** 2 + v ** 2, out=features[..., self.speed])
+        direction = np.rad2deg(np.arctan2(-u, -v))
+        direction[direction < 0] += 360
+        features[..., self.direction] = direction
+        return features
+
+    @staticmethod
+    def _mean_over_locations(rows):
+        """Mean over the location axis (-3) with the compensated summation of pandas, NaN are skipped."""
+        total = np.zeros(rows.shape[:-3] + rows.shape[-2:], dtype=rows.dtype)
+        compensation = np.zeros_like(total)
+        count = np.zeros(total.shape, dtype=np.int64)
+        for location in range(rows.shape[-3]):
+            value = rows[..., location, :, :]
+            valid = ~np.isnan(value)
+            y = value - compensation
+            t = total + y
+            new_compensation = t - total - y
+            # infinite values would make the compensation NaN
+            new_compensation[np.isnan(new_compensation)] = 0
+            np.copyto(compensation, new_compensation, where=valid)
+            np.copyto(total, t, where=valid)
+            count += valid
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count.astype(total.dtype)
+        mean[count == 0] = np.nan
+        return mean
+
+    def scale_features(self, features):
+        """Scales features in place like `RobustScaler.transform`.
+
+        Args:
+            features (np.ndarray): Features with shape (..., features).
+
+        Returns:
+            np.ndarray: The scaled `features`.
+        """
+        if self.center is not None:
+            features -= self.center
+        if self.scale is not None:
+            features /= self.scale
+        return features
+
+    def transform(self, cube):
+        """Computes the scaled daily features (see `features` and `scale_features`)."""
+        return self.scale_features(self.features(cube))
+
+    def transform_frame(self, weather_data):
+        """Computes the scaled features of the API weather data as DataFrame.
+
+        Args:
+            weather_data (pd.DataFrame): Weather data with one row per city and date.
+
+        Returns:
+            pd.DataFrame: Daily features indexed by date in the order of `col_order`.
+        """
+        cube, _, dates = weather_cube(weather_data, self.variables)
+        return pd.DataFrame(self.transform(cube), columns=self.col_order, index=dates)
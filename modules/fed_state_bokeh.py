@@ -1,60 +1,94 @@
-import re
 from bokeh.plotting import figure
-from bokeh.colors import RGB
-import matplotlib.cm as colormaps
 from bokeh.transform import dodge
-from bokeh.models import ColumnDataSource, HoverTool, Span
+from bokeh.layouts import column
+from bokeh.models import ColumnDataSource, CustomJS, HoverTool, Select, Span
 
+from modules.palette import WIND_COLOR, SOLAR_COLOR
+from modules.figure_cache import memoize_data
+from modules.offshore import farm_names
 
-def create_fed_state_production_plot(geo_df, state_choice, df_offshore):
+
+def _region_contributions(contributions, state_choice, df_offshore):
+    """Returns the dates and the wind and solar contributions of a federal state or offshore region key."""
+    if state_choice in df_offshore['region'].values:
+        # Handle offshore regions
+        federal_state = df_offshore[df_offshore['region'] == state_choice]
+        dates = federal_state['date'].tolist()
+        wind_contributions = federal_state['calculated_windpower'].to_numpy()
+        solar_contributions = federal_state['solar_pv'].to_numpy()
+    else:
+        # indexed lookup of all days of the federal state
+        federal_state = contributions.loc[state_choice]
+        dates = federal_state.index.strftime('%d/%m/%y').tolist()
+        wind_contributions = federal_state['windpower'].to_numpy()
+        solar_contributions = federal_state['solar_pv'].to_numpy()
+
+    return dates, wind_contributions, solar_contributions
+
+
+def _label_columns(wind_contributions, solar_contributions):
+    """Returns the text and position of the value labels inside the bars."""
+    return {
+        'wind_labels': [f"{wind:.2f}" for wind in wind_contributions],
+        'wind_label_y': wind_contributions * 0.9,
+        'solar_labels': [f"{solar:.2f}" for solar in solar_contributions],
+        'solar_label_y': solar_contributions * 0.9,
+    }
+
+
+@memoize_data()
+def _production_data(contributions, state_choice, df_offshore, client_side=False):
+    """Returns the data source columns, the dates and (with `client_side`) the (key, label) options of the selector."""
+    dates, wind_contributions, solar_contributions = _region_contributions(contributions, state_choice, df_offshore)
+
+    data = {
+        'dates': dates,
+        'wind_contributions': wind_contributions,
+        'solar_contributions': solar_contributions,
+        **_label_columns(wind_contributions, solar_contributions)
+    }
+
+    regions = None
+    if client_side:
+        # contributions of every federal state and offshore region, the selector copies the chosen one into the plotted columns
+        states = contributions.index.get_level_values('region').unique().astype(str)
+        regions = [(state, state) for state in states] + list(farm_names(df_offshore).items())
+        for region, _ in regions:
+            _, wind, solar = _region_contributions(contributions, region, df_offshore)
+            data[f'wind_contributions|{region}'] = wind
+            data[f'solar_contributions|{region}'] = solar
+
+    return data, dates, regions
+
+
+def create_fed_state_production_plot(contributions, state_choice, df_offshore, client_side=False):
     """Generates a Bokeh bar plot showing wind and solar electricity production for a selected federal state or offshore region.
 
     This function:
     - Visualizes daily wind and solar electricity contributions for a selected German federal state or offshore region (North Sea or Baltic Sea).
-    - Handles data extraction and transformation for both onshore (from `geo_df`) and offshore (from `df_offshore`) production data.
+    - Handles data extraction for both onshore (from the `contributions` table) and offshore (from `df_offshore`) production data.
     - Creates a grouped bar plot using Bokeh, with wind and solar production displayed side-by-side for each day.
+    - With `client_side`, embeds the contributions of all regions in the data source and adds a selector
+      which switches the region in the browser (without rerunning the dashboard).
 
     Args:
-        geo_df (gpd.GeoDataFrame): GeoDataFrame containing wind and solar electricity contributions for German federal states.
-        state_choice (str): Name of the federal state (e.g., "Bavaria") or offshore region ("North Sea", "Baltic Sea") to visualize.
+        contributions (pd.DataFrame): Wind and solar electricity contributions for German federal states with a (`region`, `date`) index
+                                      (see `contribution_table` in geopredictions.py).
+        state_choice (str): Name of the federal state (e.g., "Bayern") or key of the offshore region (`region` of `df_offshore`,
+                            e.g. "north_sea", "baltic_sea") to visualize.
         df_offshore (pd.DataFrame): DataFrame containing daily offshore wind and solar electricity production data.
+        client_side (bool): Whether to embed all regions and return the plot together with a region selector.
 
     Returns:
-        bokeh.plotting.figure: A Bokeh bar plot comparing wind and solar electricity production for the selected state or region.
+        bokeh.plotting.figure: A Bokeh bar plot comparing wind and solar electricity production for the selected state or region
+                               (a layout of selector and plot with `client_side`).
     """
 
-    # Filter data for the specified federal state
-    if state_choice in ['North Sea', 'Baltic Sea']:
-        # Handle offshore regions
-        federal_state = df_offshore[df_offshore['region'] == state_choice.lower().replace(' ', '_')]
-        dates = federal_state['date'].tolist()
-        wind_contributions = federal_state['calculated_windpower'].tolist()
-        solar_contributions = federal_state['solar_pv'].tolist()
-    else:
-        federal_state = geo_df[geo_df['GEN'] == state_choice]
-  
-        # Extract all columns with wind and solar contributions
-        contribution_columns = [col for col in federal_state.columns if re.match(r'^(wind|solar)_contribution_\d{2}/\d{2}/\d{2}$', col)] #\d{2}-\d{2}$
-
-        # Extract dates and corresponding wind and solar contributions
-        dates = [col.split('_')[-1] for col in contribution_columns if 'solar' in col]
-        wind_contributions = federal_state[[col for col in contribution_columns if 'wind' in col]].values.flatten()
-        solar_contributions = federal_state[[col for col in contribution_columns if 'solar' in col]].values.flatten()
-
-
-    # Convert 'cividis' colormap to RGB colors for Bokeh usage
-    cividis_cmap = colormaps.get_cmap('cividis')
-    solar_color = cividis_cmap(0.8)  # Yellowish tone
-    wind_color = cividis_cmap(0.2)  # Blueish tone
-    bokeh_solar_color = RGB(int(solar_color[0] * 255), int(solar_color[1] * 255), int(solar_color[2] * 255))
-    bokeh_wind_color = RGB(int(wind_color[0] * 255), int(wind_color[1] * 255), int(wind_color[2] * 255))
+    # Filter data for the specified federal state (prepared once per forecast and selection, the figure is built per session)
+    data, dates, regions = _production_data(contributions, state_choice, df_offshore, client_side)
 
     # Creating the ColumnDataSource for stacked bar chart
-    source = ColumnDataSource(data={
-        'dates': dates,
-        'wind_contributions': wind_contributions,
-        'solar_contributions': solar_contributions
-    })
+    source = ColumnDataSource(data=dict(data))
 
     # Creating the Bokeh plot
     p = figure(
@@ -69,13 +103,12 @@ def create_fed_state_production_plot(geo_df, state_choice, df_offshore):
     )
 
     # Adding stacked bar chart
-    p.vbar(x=dodge('dates', -0.25, range=p.x_range), top='wind_contributions', width=0.4, source=source, color=bokeh_wind_color, alpha = 0.8, legend_label="Wind Contribution")
-    p.vbar(x=dodge('dates', 0.25, range=p.x_range), top='solar_contributions', width=0.4, source=source, color=bokeh_solar_color, alpha = 0.8, legend_label="Solar Contribution")
+    p.vbar(x=dodge('dates', -0.25, range=p.x_range), top='wind_contributions', width=0.4, source=source, color=WIND_COLOR, alpha = 0.8, legend_label="Wind Contribution")
+    p.vbar(x=dodge('dates', 0.25, range=p.x_range), top='solar_contributions', width=0.4, source=source, color=SOLAR_COLOR, alpha = 0.8, legend_label="Solar Contribution")
 
     # Adding value labels inside the bars for wind and solar contributions
-    for i, (date, wind, solar) in enumerate(zip(dates, wind_contributions, solar_contributions)):
-        p.text(x=date, y=wind - (wind * 0.1), text=[f"{wind:.2f}"], text_align="center", text_baseline="middle", text_color="white")
-        p.text(x=date, y=solar - (solar * 0.1), text=[f"{solar:.2f}"], text_align="center", text_baseline="middle", text_color="white")
+    p.text(x='dates', y='wind_label_y', text='wind_labels', source=source, text_align="center", text_baseline="middle", text_color="white")
+    p.text(x='dates', y='solar_label_y', text='solar_labels', source=source, text_align="center", text_baseline="middle", text_color="white")
 
     # adjust plot style and labels
     p.title.text_color = "white"
@@ -106,7 +139,24 @@ def create_fed_state_production_plot(geo_df, state_choice, df_offshore):
     vertical_line = Span(location=3, dimension='height', line_color='white', line_dash='dashed', line_width=1)
     p.add_layout(vertical_line)
 
+    if client_side:
+        select = Select(title='Select a federal state or offshore region', value=state_choice, options=regions)
+        select.js_on_change('value', CustomJS(args=dict(source=source), code="""
+            const data = source.data;
+            const wind = data['wind_contributions|' + cb_obj.value];
+            const solar = data['solar_contributions|' + cb_obj.value];
+            source.data = Object.assign({}, data, {
+                wind_contributions: wind,
+                solar_contributions: solar,
+                wind_labels: Array.from(wind, (value) => value.toFixed(2)),
+                wind_label_y: Array.from(wind, (value) => value * 0.9),
+                solar_labels: Array.from(solar, (value) => value.toFixed(2)),
+                solar_label_y: Array.from(solar, (value) => value * 0.9),
+            });
+        """))
+        return column(select, p)
+
     return p
 
 # Example usage:
-# create_fed_state_production_plot(gdf, predictions_df, federal_state_name='Bayern')
+# create_fed_state_production_plot(contribution_table(gdf, predictions_df), 'Bayern', df_offshore)
@@ -0,0 +1,77 @@
+## memoized figure data keyed on a fingerprint of the input data
+
+# load packages
+import hashlib
+import functools
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+
+def fingerprint(value):
+    """Returns a content hash of DataFrames, Series, arrays and plain values.
+
+    Args:
+        value (object): Input of a figure builder.
+
+    Returns:
+        str: Hex digest which only changes if the content changes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.shape, value.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    else:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def memoize_data(maxsize=32, key=None):
+    """Caches the results of a data preparation function with LRU eviction.
+
+    The key is the fingerprint of all arguments (or the result of `key`), so a rerun of the dashboard with unchanged data and
+    selection returns the already prepared data instead of computing it again. Only plain data
+    (e.g. the columns of a `ColumnDataSource`) is cached: Bokeh and Folium objects belong to one
+    document and are built per call, because the cache is shared by all sessions. Cached values
+    must not be modified.
+
+    Args:
+        maxsize (int): Maximum number of cached results per function.
+        key (callable, optional): Returns the cache key for the arguments of the function, e.g. a
+            snapshot version instead of fingerprinting large inputs like geometries.
+
+    Returns:
+        callable: Decorator for the data preparation function.
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                cache_key = key(*args, **kwargs)
+            else:
+                cache_key = (tuple(fingerprint(arg) for arg in args), tuple((name, fingerprint(arg)) for name, arg in sorted(kwargs.items())))
+            with lock:
+                if cache_key in cache:
+                    cache.move_to_end(cache_key)
+                    return cache[cache_key]
+
+            value = func(*args, **kwargs)
+
+            with lock:
+                cache[cache_key] = value
+                cache.move_to_end(cache_key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
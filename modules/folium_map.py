@@ -1,5 +1,6 @@
 ## folium-map electricity production per federal state
 
+import json
 import pandas as pd
 import folium
 from branca.colormap import linear
@@ -7,6 +8,10 @@ from branca.element import MacroElement
 from jinja2 import Template
 import os
 
+from modules.geopredictions import join_geometry
+from modules.figure_cache import memoize_data
+from modules.offshore import farm_names
+
 
 class BindColormap(MacroElement):
     """Binds a colormap legend to a specific GeoJson layer on a Folium map.
@@ -51,21 +56,130 @@ class BindColormap(MacroElement):
         """)
 
 
+class DaySwitcher(MacroElement):
+    """Switches day and technology of a choropleth layer in the browser.
+
+    The geometries are rendered once. The contributions of all days are embedded as compact arrays
+    (one value per day and region) and a map control restyles the layer, its tooltips, the legends
+    and the offshore popups in JavaScript, so changing the day needs no new map from the server.
+
+    Args:
+        geojson (folium.GeoJson): Layer of the federal state geometries (feature property `position`
+                                  is the index of the region in the value arrays).
+        colormaps (dict): Legends per technology ('windpower', 'solar_pv'), scaled to all days.
+        values (dict): `dates`, `regions`, per technology a (days x regions) list, and `offshore`
+                       (region names and a (days x farms) list of the wind contributions).
+        offshore_layer (folium.FeatureGroup): Layer of the offshore markers (in the order of `values['offshore']`).
+        markers (list): Offshore markers.
+        date_choice (str): Initially selected day in the format '%d/%m/%y', None for the current day
+                           in Germany (taken from the browser's clock) or the first day.
+
+    Inherits:
+        folium.elements.MacroElement: Extends Folium's MacroElement to embed custom JavaScript behavior.
+    """
+    def __init__(self, geojson, colormaps, values, offshore_layer, markers, date_choice):
+        super(DaySwitcher, self).__init__()
+        self.geojson = geojson
+        self.colormaps = colormaps
+        self.offshore_layer = offshore_layer
+        self.markers = markers
+        self.values = json.dumps(values, separators=(',', ':'))
+        self.scales = json.dumps({
+            field: {'colors': [list(color[:3]) for color in colormap.colors], 'index': list(colormap.index)}
+            for field, colormap in colormaps.items()
+        }, separators=(',', ':'))
+        # -1: chosen in the browser, so the same HTML fits every day
+        self.initial_day = values['dates'].index(date_choice) if date_choice in values['dates'] else -1
+        self._template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var values = {{this.values}};
+            var scales = {{this.scales}};
+            var legends = {
+                {% for field, colormap in this.colormaps.items() %}'{{field}}': {{colormap.get_name()}},{% endfor %}
+            };
+            var markers = [{% for marker in this.markers %}{{marker.get_name()}},{% endfor %}];
+            var names = {windpower: 'Wind', solar_pv: 'Solar'};
+            var map = {{this._parent.get_name()}};
+            var layer = {{this.geojson.get_name()}};
+            var offshore = {{this.offshore_layer.get_name()}};
+            var day = {{this.initial_day}};
+            var field = 'windpower';
+            if (day < 0) {
+                // the current day in Germany ('%d/%m/%y' like the dates), the first day if it is not part of the forecast
+                var today = new Intl.DateTimeFormat('en-GB', {timeZone: 'Europe/Berlin', day: '2-digit', month: '2-digit', year: '2-digit'}).format(new Date());
+                day = Math.max(values.dates.indexOf(today), 0);
+            }
+
+            // linear interpolation between the color stops of the legend
+            function color(scale, value) {
+                var index = scale.index, colors = scale.colors, i = 1;
+                while (i < index.length - 1 && value > index[i]) { i++; }
+                var f = (value - index[i - 1]) / ((index[i] - index[i - 1]) || 1);
+                f = Math.min(Math.max(f, 0), 1);
+                var rgb = [0, 1, 2].map(function (k) {
+                    return Math.round(255 * (colors[i - 1][k] + f * (colors[i][k] - colors[i - 1][k])));
+                });
+                return 'rgb(' + rgb.join(',') + ')';
+            }
+
+            function update() {
+                var date = values.dates[day];
+                var dayValues = values[field][day];
+                layer.eachLayer(function (region) {
+                    var position = region.feature.properties.position;
+                    region.setStyle({fillColor: color(scales[field], dayValues[position])});
+                    region.bindTooltip('Date: ' + date + ' / Region: ' + values.regions[position]
+                        + '<br>' + names[field] + ' Contribution [GWh]: ' + dayValues[position].toFixed(2), {sticky: true});
+                });
+                for (var name in legends) {
+                    legends[name].svg[0][0].style.display = (name === field) ? 'block' : 'none';
+                }
+                markers.forEach(function (marker, i) {
+                    marker.bindPopup('<b>Date:</b> ' + date + '<br><b>Region:</b> ' + values.offshore.regions[i]
+                        + '<br><b>Wind Contribution:</b> ' + values.offshore.windpower[day][i].toFixed(2) + ' GWh<br>');
+                });
+                // offshore wind farms are only shown with the wind contributions
+                if (field === 'windpower') { map.addLayer(offshore); } else { map.removeLayer(offshore); }
+            }
+
+            var control = L.control({position: 'topright'});
+            control.onAdd = function () {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '4px';
+                var dateSelect = L.DomUtil.create('select', '', div);
+                values.dates.forEach(function (date, i) { dateSelect.add(new Option(date, i, false, i === day)); });
+                var fieldSelect = L.DomUtil.create('select', '', div);
+                fieldSelect.add(new Option('Wind', 'windpower'));
+                fieldSelect.add(new Option('Solar', 'solar_pv'));
+                dateSelect.onchange = function () { day = parseInt(dateSelect.value); update(); };
+                fieldSelect.onchange = function () { field = fieldSelect.value; update(); };
+                L.DomEvent.disableClickPropagation(div);
+                return div;
+            };
+            control.addTo(map);
+            markers.forEach(function (marker) { marker.setIcon(markers[0].options.icon); });
+            update();
+        })();
+        {% endmacro %}
+        """)
 
 
-def create_map(data, date_choice, df_offshore):
+def create_map(gdf, contributions, date_choice, df_offshore):
     """Creates an interactive Folium map visualizing regional wind and solar electricity production.
 
     This function:
     - Generates a Folium map displaying wind and solar electricity production for a selected date.
     - Uses colormaps to represent regional production levels on a GeoJson layer.
-    - Adds custom turbine markers for offshore wind production (North Sea and Baltic Sea).
+    - Adds custom turbine markers for offshore wind production (North Sea and Baltic Sea or the configured wind farms).
     - Includes interactive layer switching and dynamic colormap legends.
 
     Args:
-        data (gpd.GeoDataFrame): GeoDataFrame containing regional wind and solar contributions with date-specific columns.
+        gdf (gpd.GeoDataFrame): GeoDataFrame containing the regional boundaries of the federal states.
+        contributions (pd.DataFrame): Wind and solar contributions with a (`region`, `date`) index (see `contribution_table`).
         date_choice (str): Date string in the format '%d/%m/%y' representing the selected date for visualization.
-        df_offshore (pd.DataFrame): DataFrame containing offshore wind production values for the selected date.
+        df_offshore (pd.DataFrame): DataFrame containing offshore wind production values and coordinates per region and date.
 
     Returns:
         folium.Map: An interactive Folium map object with wind and solar electricity visualizations.
@@ -79,14 +193,18 @@ def create_map(data, date_choice, df_offshore):
     if not os.path.exists(icon_path):
         raise FileNotFoundError(f"Turbine icon not found at {icon_path}")
 
+    # join the contributions of the selected day to the geometries
+    date = pd.to_datetime(date_choice, format='%d/%m/%y')
+    data = join_geometry(gdf, contributions, date)
+
     # Set initial map location and zoom level
     m = folium.Map(location=[53.1657, 10.4515], zoom_start=5, tiles='Cartodb Positron') # 'cartodbdark_matter'; 'Cartodb Positron', width='80%', height='80%'
 
     # Define base colormaps for both layers
-    solar_colormap = linear.YlOrRd_09.scale(data[f'solar_contribution_{date_choice}'].min(), data[f'solar_contribution_{date_choice}'].max())
+    solar_colormap = linear.YlOrRd_09.scale(data['solar_pv'].min(), data['solar_pv'].max())
     solar_colormap.caption = f"Solar Electricity Production [GWh]" # on {date_choice}
 
-    wind_colormap = linear.YlGnBu_09.scale(data[f'wind_contribution_{date_choice}'].min(), data[f'wind_contribution_{date_choice}'].max())
+    wind_colormap = linear.YlGnBu_09.scale(data['windpower'].min(), data['windpower'].max())
     wind_colormap.caption = f"Wind Electricity Production [GWh]"  # on {date_choice}
 
     # Add wind contribution layer (default active)
@@ -94,13 +212,13 @@ def create_map(data, date_choice, df_offshore):
     folium.GeoJson(
         data,
         style_function=lambda feature: {
-            'fillColor': wind_colormap(feature['properties'][f'wind_contribution_{date_choice}']),
+            'fillColor': wind_colormap(feature['properties']['windpower']),
             'color': 'black',
             'weight': 1,
             'fillOpacity': 0.7,
         },
         tooltip=folium.features.GeoJsonTooltip(
-            fields=['region', f'wind_contribution_{date_choice}'],
+            fields=['region', 'windpower'],
             aliases=[f'Date: {date_choice} / Region:', f'Wind Contribution [GWh]:'],
             localize=True
         ),
@@ -113,13 +231,13 @@ def create_map(data, date_choice, df_offshore):
     folium.GeoJson(
         data,
         style_function=lambda feature: {
-            'fillColor': solar_colormap(feature['properties'][f'solar_contribution_{date_choice}']),
+            'fillColor': solar_colormap(feature['properties']['solar_pv']),
             'color': 'black',
             'weight': 1,
             'fillOpacity': 0.7,
         },
         tooltip=folium.features.GeoJsonTooltip(
-            fields=['region', f'solar_contribution_{date_choice}'],
+            fields=['region', 'solar_pv'],
             aliases=[f'Date: {date_choice} / Region:', f'Solar Contribution [GWh]:'],
             localize=True
         ),
@@ -136,23 +254,18 @@ def create_map(data, date_choice, df_offshore):
     wind_colormap.position = 'bottomleft'
     m.add_child(BindColormap(solar_layer, solar_colormap)).add_child(BindColormap(wind_layer, wind_colormap))
 
-    # Approximate coordinates for North Sea and Baltic Sea
-    offshore_coordinates = {
-        'north_sea': [54.433, 6.317],  # 'Albatros' windpark coordinates for the north Sea
-        'baltic_sea': [54.834, 14.068], # 'Wikinger' windpark coordinates for the baltic Sea
-    }
-
     # ensure that date and date_choice are in correct format
-    formatted_date_choice = pd.to_datetime(date_choice).strftime('%d/%m/%y')
+    formatted_date_choice = date.strftime('%d/%m/%y')
     df_offshore_filtered = df_offshore[df_offshore['date'] == formatted_date_choice]
+    names = farm_names(df_offshore)
 
-    # Add markers for North Sea and Baltic Sea with dynamic values based on date_choice
+    # Add markers for the offshore regions / wind farms (standard: North Sea and Baltic Sea) with dynamic values based on date_choice
     for _, row in df_offshore_filtered.iterrows():
         folium.Marker(
-            location=offshore_coordinates[row['region']],
+            location=[row['latitude'], row['longitude']],
             popup=(
                 f"<b>Date:</b> {formatted_date_choice}<br>"
-                f"<b>Region:</b> {row['region'].replace('_', ' ').title()}<br>"
+                f"<b>Region:</b> {names[row['region']]}<br>"
                 f"<b>Wind Contribution:</b> {row['calculated_windpower']:.2f} GWh<br>"
                 # f"<b>Solar Contribution:</b> {row['calculated_solarpower']:.2f} GWh"
             ),
@@ -162,4 +275,114 @@ def create_map(data, date_choice, df_offshore):
             )
         ).add_to(wind_layer)
 
-    return m
\ No newline at end of file
+    return m
+
+def create_dynamic_map(gdf, contributions, df_offshore, date_choice=None):
+    """Creates a Folium map of the regional wind and solar electricity production for all days.
+
+    In contrast to `create_map`, the federal state geometries are serialized only once and the
+    contributions of all days are embedded as compact arrays. Day and technology are switched with
+    a control on the map (see `DaySwitcher`), so the map is built once per forecast. The colormaps
+    are scaled to the contributions of all days, so colors are comparable between days.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame containing the regional boundaries of the federal states.
+        contributions (pd.DataFrame): Wind and solar contributions with a (`region`, `date`) index (see `contribution_table`).
+        df_offshore (pd.DataFrame): DataFrame containing offshore wind production values and coordinates per region and date.
+        date_choice (str, optional): Initially shown day in the format '%d/%m/%y'. Defaults to the current day
+                                     in Germany (chosen in the browser) or the first day.
+
+    Returns:
+        folium.Map: An interactive Folium map object with a day and technology selector.
+    """
+    # Resolve the absolute path to the turbine icon
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    icon_path = os.path.join(script_dir, '../assets/turbine.png')
+
+    # Ensure the path works
+    if not os.path.exists(icon_path):
+        raise FileNotFoundError(f"Turbine icon not found at {icon_path}")
+
+    # (days x regions) arrays in the order of the geometries
+    regions = gdf['GEN'].astype(str)
+    table = contributions.copy()
+    table.index = table.index.set_levels(table.index.levels[0].astype(str), level='region')
+    dates = table.index.get_level_values('date').unique().sort_values()
+    values = {
+        'dates': list(dates.strftime('%d/%m/%y')),
+        'regions': list(regions),
+    }
+    for field in ['windpower', 'solar_pv']:
+        day_values = table[field].unstack('region').reindex(index=dates, columns=regions)
+        values[field] = day_values.round(3).to_numpy().tolist()
+
+    # offshore wind contributions (days x farms)
+    farms = df_offshore.drop_duplicates('region')
+    offshore = df_offshore.pivot(index='date', columns='region', values='calculated_windpower')
+    offshore = offshore.reindex(index=values['dates'], columns=farms['region'])
+    values['offshore'] = {
+        'regions': list(farm_names(df_offshore).values()),
+        'windpower': offshore.round(3).to_numpy().tolist(),
+    }
+
+    # Set initial map location and zoom level
+    m = folium.Map(location=[53.1657, 10.4515], zoom_start=5, tiles='Cartodb Positron')
+
+    # Define colormaps on a fixed scale across all days
+    wind_colormap = linear.YlGnBu_09.scale(table['windpower'].min(), table['windpower'].max())
+    wind_colormap.caption = "Wind Electricity Production [GWh]"
+    solar_colormap = linear.YlOrRd_09.scale(table['solar_pv'].min(), table['solar_pv'].max())
+    solar_colormap.caption = "Solar Electricity Production [GWh]"
+
+    # geometries only, colors and tooltips are set in the browser
+    geometry = gdf[['GEN', 'geometry']].assign(position=range(len(gdf)))
+    geojson = folium.GeoJson(
+        geometry,
+        style_function=lambda feature: {
+            'fillColor': 'grey',
+            'color': 'black',
+            'weight': 1,
+            'fillOpacity': 0.7,
+        },
+        highlight_function=lambda x: {'weight': 3, 'color': 'yellow'},
+        name="Contribution"
+    ).add_to(m)
+
+    # Add markers for the offshore regions / wind farms, popups are set in the browser
+    offshore_layer = folium.FeatureGroup(name='Offshore Wind Farms', control=False).add_to(m)
+    # the (large) turbine icon is embedded once and shared by all markers in the browser
+    markers = []
+    for _, row in farms.iterrows():
+        icon = folium.CustomIcon(icon_image=icon_path, icon_size=(35, 35)) if not markers else None
+        marker = folium.Marker(location=[row['latitude'], row['longitude']], icon=icon).add_to(offshore_layer)
+        markers.append(marker)
+
+    # Add colormap legends
+    m.add_child(solar_colormap).add_child(wind_colormap)
+    solar_colormap.position = 'bottomleft'
+    wind_colormap.position = 'bottomleft'
+
+    m.add_child(DaySwitcher(geojson, {'windpower': wind_colormap, 'solar_pv': solar_colormap}, values, offshore_layer, markers, date_choice))
+
+    return m
+
+
+@memoize_data(maxsize=4, key=lambda snapshot_version, gdf, contributions, df_offshore: snapshot_version)
+def render_dynamic_map(snapshot_version, gdf, contributions, df_offshore):
+    """Returns the HTML of the map of `create_dynamic_map`, rendered once per snapshot.
+
+    The cache is keyed on the snapshot version instead of the (large) inputs, the returned HTML
+    string can be shared by all sessions and reruns. The initial day is chosen in the browser, so
+    the HTML does not depend on the day selected in the dashboard and the map is not sent again
+    when it changes.
+
+    Args:
+        snapshot_version (str): Version of the snapshot the inputs belong to (see `write_snapshot` in pipeline.py).
+        gdf (gpd.GeoDataFrame): GeoDataFrame containing the regional boundaries of the federal states.
+        contributions (pd.DataFrame): Wind and solar contributions with a (`region`, `date`) index (see `contribution_table`).
+        df_offshore (pd.DataFrame): DataFrame containing offshore wind production values and coordinates per region and date.
+
+    Returns:
+        str: HTML document of the map.
+    """
+    return folium.Figure().add_child(create_dynamic_map(gdf, contributions, df_offshore)).render()
@@ -0,0 +1,121 @@
+## cached and simplified federal state geometries
+
+# load packages
+import os
+import pickle
+import threading
+import uuid
+import shapely
+import geopandas as gpd
+
+
+GEOJSON_PATH = 'data/nominal_production_geo.geojson'
+# folder of the binary geometry caches (rebuilt when the GeoJSON changes)
+GEOMETRY_CACHE_DIR = 'data/geometry_cache'
+# zoom level of the dashboard maps (see folium_map.py)
+MAP_ZOOM = 5
+# version of the simplified caches, increased when the simplification changes
+SIMPLIFY_VERSION = 2
+
+# loaded geometries of this process {(path, mtime, zoom): GeoDataFrame}
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def tolerance_for_zoom(zoom):
+    """Returns the simplification tolerance in degrees for a web map zoom level.
+
+    Half the size of a pixel at the equator (256 pixel tiles), so the simplification is invisible at this zoom.
+
+    Args:
+        zoom (int): Zoom level of the map.
+
+    Returns:
+        float: Tolerance in degrees.
+    """
+    return 360 / (256 * 2 ** zoom) / 2
+
+
+def simplify_geometries(gdf, zoom=MAP_ZOOM):
+    """Simplifies and quantizes the geometries for rendering at a zoom level.
+
+    The boundaries are simplified with the tolerance of the zoom level and the coordinates are
+    snapped to a grid of the same size, which removes duplicate points and shortens the coordinates
+    in the GeoJSON of the maps. The states are simplified together as coverage, so a border shared
+    by two states is simplified once and no gaps or overlaps open between neighbours. Geometries
+    which are no valid coverage (e.g. overlapping states) and shapely versions without
+    `coverage_simplify` (before 2.1) simplify every state on its own, which keeps each polygon
+    valid but not the shared borders.
+
+    Args:
+        gdf (gpd.GeoDataFrame): Federal state geometries.
+        zoom (int): Zoom level of the map.
+
+    Returns:
+        gpd.GeoDataFrame: Copy of `gdf` with the simplified geometries.
+    """
+    tolerance = tolerance_for_zoom(zoom)
+    simplified = gdf.copy()
+    geometries = gdf.geometry.to_numpy()
+    if hasattr(shapely, 'coverage_simplify') and shapely.coverage_is_valid(geometries):
+        geometry = gpd.GeoSeries(shapely.coverage_simplify(geometries, tolerance), index=gdf.index, crs=gdf.crs)
+    else:
+        geometry = gdf.geometry.simplify(tolerance, preserve_topology=True)
+    # identical shared vertices are snapped to the same grid point
+    simplified['geometry'] = geometry.set_precision(tolerance)
+    return simplified
+
+
+def _cache_path(path, zoom, cache_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    suffix = 'full' if zoom is None else f'z{zoom}_v{SIMPLIFY_VERSION}'
+    return os.path.join(cache_dir, f'{name}_{suffix}.pkl')
+
+
+def load_geometries(path=GEOJSON_PATH, zoom=None, cache_dir=GEOMETRY_CACHE_DIR):
+    """Loads the federal state geometries from a binary cache, which is rebuilt when the GeoJSON changes.
+
+    The GeoJSON is parsed only if the cache is missing or its recorded modification time differs.
+    Loaded geometries are additionally kept in memory per process.
+
+    Args:
+        path (str): GeoJSON with the nominal installed capacity per federal state.
+        zoom (int, optional): Zoom level of the simplified geometries (see `simplify_geometries`).
+            Defaults to the full resolution.
+        cache_dir (str): Folder of the binary caches.
+
+    Returns:
+        gpd.GeoDataFrame: The federal state geometries.
+    """
+    mtime = os.path.getmtime(path)
+    key = (os.path.abspath(path), mtime, zoom)
+
+    with _loaded_lock:
+        if key in _loaded:
+            return _loaded[key]
+
+        cache_path = _cache_path(path, zoom, cache_dir)
+        gdf = None
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_mtime, cached = pickle.load(f)
+            if cached_mtime == mtime:
+                gdf = cached
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+
+        if gdf is None:
+            gdf = gpd.read_file(path)
+            if zoom is not None:
+                gdf = simplify_geometries(gdf, zoom)
+
+            # write atomically, concurrent readers see the old or the new cache, concurrent writers
+            # (scheduler thread, batch CLI, dashboard) use their own temporary file
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{cache_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((mtime, gdf), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+
+        _loaded[key] = gdf
+        return gdf
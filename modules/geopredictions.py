@@ -1,18 +1,20 @@
 ## combine geodataframe with predictions and calculate partial contributin per federal state and per day
 
 # load libraries
+import numpy as np
 import pandas as pd
 
 
-def geo_pred(gdf, predictions_df):
+def contribution_table(gdf, predictions_df):
     """Calculates federal state contributions of wind and solar electricity based on predicted electricity production 
     and the nominal installed capacity of wind and pv power plants per federal state.
 
-    This function:
-    - Computes wind and solar electricity contributions per federal state for each day.
-    - Uses percentage-based distribution per federal state (as of november 2024) from `gdf` to allocate predicted wind and solar electricity.
-    - Transposes the data so that each row represents a day and each column represents a federal state.
-    - Merges the computed contributions back into the input GeoDataFrame.
+    The contributions are the outer product of the percentage-based distribution per federal state 
+    (as of november 2024) from `gdf` and the daily predictions, stored as compact long-format table 
+    without geometry. Every row is one federal state and day, the technologies are columns. Regions 
+    are stored as categorical index level, so lookups per state (`table.loc['Bayern']`) or per day 
+    (`table.xs(date, level='date')`) are indexed accesses instead of column scans. The geometry 
+    is joined only for rendering (see `join_geometry`).
 
     Args:
         gdf (gpd.GeoDataFrame): GeoDataFrame containing regional boundaries and percentage-based 
@@ -20,36 +22,29 @@ def geo_pred(gdf, predictions_df):
         predictions_df (pd.DataFrame): DataFrame containing daily predicted wind and solar electricity production.
 
     Returns:
-        gpd.GeoDataFrame: Updated GeoDataFrame with wind and solar contributions added for each day.
+        pd.DataFrame: Wind (`windpower`) and solar (`solar_pv`) contributions with a (`region`, `date`) index.
     """
-    # Create new DataFrames to store the contributions per day for each region for wind and solar
-    wind_contributions = pd.DataFrame()
-    solar_contributions = pd.DataFrame()
-
-    # Calculate wind contributions for each region per day
-    for day in range(len(predictions_df)):
-        wind_contributions_for_day = gdf['wind_percentage'] * predictions_df.iloc[day]['windpower']
-        wind_contributions[day] = wind_contributions_for_day
-
-    # Calculate solar contributions for each region per day
-    for day in range(len(predictions_df)):
-        solar_contributions_for_day = gdf['solar_percentage'] * predictions_df.iloc[day]['solar_pv']
-        solar_contributions[day] = solar_contributions_for_day
-
-    # Transpose the contributions DataFrames so that each row represents a day and each column represents a region
-    wind_contributions = wind_contributions.T
-    wind_contributions.columns = gdf['GEN']
-    wind_contributions.index = predictions_df.index.strftime('%d/%m/%y')#'%m-%d'
-
-    solar_contributions = solar_contributions.T
-    solar_contributions.columns = gdf['GEN']
-    solar_contributions.index = predictions_df.index.strftime('%d/%m/%y')#'%m-%d'
-
-    gdf_pred = gdf.copy()
-    
-    # Add wind and solar contributions for each day to the GeoDataFrame
-    for day in predictions_df.index.strftime('%d/%m/%y'):#'%m-%d'
-        gdf_pred[f'wind_contribution_{day}'] = wind_contributions.loc[day].values
-        gdf_pred[f'solar_contribution_{day}'] = solar_contributions.loc[day].values
-
-    return gdf_pred
\ No newline at end of file
+    regions = pd.CategoricalIndex(gdf['GEN'], categories=gdf['GEN'].unique(), ordered=True, name='region')
+    index = pd.MultiIndex.from_product([regions, predictions_df.index.rename('date')])
+
+    # contributions per region (rows) and day (columns) flattened in the order of the index
+    return pd.DataFrame({
+        'windpower': np.outer(gdf['wind_percentage'].to_numpy(), predictions_df['windpower'].to_numpy()).ravel(),
+        'solar_pv': np.outer(gdf['solar_percentage'].to_numpy(), predictions_df['solar_pv'].to_numpy()).ravel(),
+    }, index=index)
+
+
+def join_geometry(gdf, contributions, date):
+    """Joins the contributions of one day to the federal state geometries for rendering.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame with the regional boundaries (`GEN`, `region`, `geometry`).
+        contributions (pd.DataFrame): Contribution table (see `contribution_table`).
+        date (pd.Timestamp): Day to join.
+
+    Returns:
+        gpd.GeoDataFrame: `GEN`, `region` and `geometry` with the `windpower` and `solar_pv` contributions of the day.
+    """
+    day = contributions.xs(date, level='date')
+    day.index = day.index.astype(str)
+    return gdf[['GEN', 'region', 'geometry']].join(day, on='GEN')
@@ -0,0 +1,200 @@
+## historical re-prediction with the Open-Meteo archive
+#
+# usage: python -m modules.historical --start 2021-10-01 --end 2024-09-30 [--output history.csv] [--compare]
+#        [--url http://127.0.0.1:8765/v1/archive] (local stand-in server, see archive_stub.py)
+#
+# Years of daily weather for all `CITIES` are requested in date chunks (one request with all
+# locations per chunk), a bounded number of chunks in parallel. Every chunk is converted into
+# features (see feature_transform.py) as soon as it arrives and its response is dropped, the
+# features are predicted in large batches. `--compare` reports the errors against the actuals of
+# the modeling data (see backtest.py).
+
+# load packages
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from tabulate import tabulate
+
+# functions
+from modules.openMeteo_API import CITIES, create_session, fetch_locations_batched, range_params
+from modules.feature_transform import weather_cube
+from modules.model_registry import current_bundle
+
+
+# Open-Meteo historical weather endpoint
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+# days per request and parallel requests
+CHUNK_DAYS = 92
+MAX_WORKERS = 4
+# days predicted per model call
+BATCH_DAYS = 1000
+
+
+def date_chunks(start_date, end_date, chunk_days=CHUNK_DAYS):
+    """Splits a date range into consecutive chunks.
+
+    Args:
+        start_date (datetime.date): First day.
+        end_date (datetime.date): Last day (inclusive).
+        chunk_days (int): Maximum days per chunk.
+
+    Returns:
+        list: (first day, last day) per chunk.
+
+    Raises:
+        ValueError: If the range is empty.
+    """
+    if end_date < start_date:
+        raise ValueError(f"The end date {end_date} is before the start date {start_date}.")
+
+    chunks = []
+    while start_date <= end_date:
+        chunk_end = min(end_date, start_date + datetime.timedelta(days=chunk_days - 1))
+        chunks.append((start_date, chunk_end))
+        start_date = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+def iter_archive(start_date, end_date, cities=None, chunk_days=CHUNK_DAYS, max_workers=MAX_WORKERS, url=ARCHIVE_URL, session=None):
+    """Yields the archived daily weather of all locations chunk by chunk in date order.
+
+    At most `max_workers` chunks are requested at the same time and only finished chunks which
+    were not consumed yet are kept, so the memory does not grow with the length of the period.
+    Chunks which could not be loaded are reported and skipped.
+
+    Args:
+        start_date (datetime.date): First day.
+        end_date (datetime.date): Last day (inclusive).
+        cities (list, optional): Locations to request. Defaults to `CITIES`.
+        chunk_days (int): Days per request.
+        max_workers (int): Maximum number of parallel requests.
+        url (str): Open-Meteo archive endpoint.
+        session (requests.Session, optional): Session to use. Defaults to `create_session()`.
+
+    Yields:
+        pd.DataFrame: Daily weather data of one chunk (see `get_weather_forecast`).
+    """
+    if cities is None:
+        cities = CITIES
+    if session is None:
+        session = create_session()
+
+    chunks = iter(date_chunks(start_date, end_date, chunk_days))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = deque()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append((chunk, executor.submit(fetch_locations_batched, cities, range_params(*chunk), session, url)))
+
+        for _ in range(max(1, max_workers)):
+            submit_next()
+        while pending:
+            (first, last), future = pending.popleft()
+            submit_next()
+            weather_data, failed = future.result()
+            if weather_data.empty:
+                print(f"Error loading the archive from {first} to {last}: {next(iter(failed.values()), 'no data')}")
+                continue
+            yield weather_data
+
+
+def predict_history(start_date, end_date, bundle=None, cities=None, chunk_days=CHUNK_DAYS, max_workers=MAX_WORKERS,
+                    batch_days=BATCH_DAYS, url=ARCHIVE_URL):
+    """Predicts the daily wind and solar production of a historical period from archived weather.
+
+    Args:
+        start_date (datetime.date): First day.
+        end_date (datetime.date): Last day (inclusive).
+        bundle (ModelBundle, optional): Scaler and model (see model_registry.py), defaults to the current bundle.
+        cities (list, optional): Locations to request. Defaults to `CITIES`.
+        chunk_days (int): Days per request.
+        max_workers (int): Maximum number of parallel requests.
+        batch_days (int): Days predicted per model call.
+        url (str): Open-Meteo archive endpoint.
+
+    Returns:
+        pd.DataFrame: Predictions indexed by date with one column per target.
+
+    Raises:
+        ValueError: If no chunk could be loaded.
+    """
+    bundle = current_bundle() if bundle is None else bundle
+    transform = bundle.feature_transform
+
+    predictions, features, dates = [], [], []
+    n_buffered = 0
+
+    def predict_buffer():
+        if features:
+            predictions.append(bundle.predict(np.concatenate(features)))
+            features.clear()
+
+    for weather_data in iter_archive(start_date, end_date, cities, chunk_days, max_workers, url):
+        cube, _, chunk_dates = weather_cube(weather_data, transform.variables)
+        features.append(transform.transform(cube))
+        dates.append(chunk_dates)
+        n_buffered += len(chunk_dates)
+        if n_buffered >= batch_days:
+            predict_buffer()
+            n_buffered = 0
+    predict_buffer()
+
+    if not predictions:
+        raise ValueError("The weather archive could not be loaded for any date.")
+    return pd.DataFrame(np.concatenate(predictions), columns=bundle.target_columns, index=dates[0].append(dates[1:]))
+
+
+def compare_with_actuals(predictions, actuals):
+    """Joins the predictions with the actual production in the long format of the backtest.
+
+    Args:
+        predictions (pd.DataFrame): Predictions indexed by date (see `predict_history`).
+        actuals (pd.DataFrame): Daily data with `date` and the target columns (see `load_modeling_data`).
+
+    Returns:
+        pd.DataFrame: One row per day and target with `date`, `month`, `target`, `actual` and `predicted`.
+    """
+    actuals = actuals.set_index(pd.to_datetime(actuals['date']))
+    frames = []
+    for target in predictions.columns:
+        joined = pd.DataFrame({'actual': actuals[target], 'predicted': predictions[target]}).dropna()
+        frames.append(joined.rename_axis('date').reset_index().assign(target=target))
+    comparison = pd.concat(frames, ignore_index=True)
+    comparison['month'] = comparison['date'].dt.month
+    return comparison
+
+
+def main():
+    from modules.train import DATA_PATH, load_modeling_data
+    from modules.backtest import error_table
+
+    parser = argparse.ArgumentParser(description='Predict the production of a historical period from the Open-Meteo weather archive.')
+    parser.add_argument('--start', required=True, type=datetime.date.fromisoformat, help='first day (YYYY-MM-DD)')
+    parser.add_argument('--end', required=True, type=datetime.date.fromisoformat, help='last day (YYYY-MM-DD)')
+    parser.add_argument('--url', default=ARCHIVE_URL, help='archive endpoint (e.g. the local stand-in of archive_stub.py)')
+    parser.add_argument('--chunk-days', type=int, default=CHUNK_DAYS, help='days per request')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='parallel requests')
+    parser.add_argument('--output', help='CSV for the predictions')
+    parser.add_argument('--compare', action='store_true', help='report the errors against the actuals of the modeling data')
+    parser.add_argument('--data', default=DATA_PATH, help='CSV with the actual production (for --compare)')
+    args = parser.parse_args()
+
+    bundle = current_bundle()
+    predictions = predict_history(args.start, args.end, bundle, chunk_days=args.chunk_days, max_workers=args.workers, url=args.url)
+    print(f"Predicted {len(predictions)} days from {predictions.index.min().date()} to {predictions.index.max().date()} (model {bundle.version})")
+    if args.output:
+        predictions.to_csv(args.output)
+
+    if args.compare:
+        comparison = compare_with_actuals(predictions, load_modeling_data(args.data, [], bundle.target_columns))
+        print(tabulate(error_table(comparison, ['target', 'month']).reset_index(), headers='keys', tablefmt='simple', floatfmt='.2f', showindex=False))
+        print(tabulate(error_table(comparison, ['target']).reset_index(), headers='keys', tablefmt='simple', floatfmt='.2f', showindex=False))
+
+
+if __name__ == '__main__':
+    main()
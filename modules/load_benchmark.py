@@ -0,0 +1,144 @@
+## startup benchmark of the model formats
+#
+# usage: python -m modules.load_benchmark [--model models/stacked_multivariate_model.pkl] [--repeat 3]
+#
+# Every format is loaded in a fresh subprocess (like a new streamlit worker), which reports the load
+# time, the first prediction time and its resident memory (RSS) after imports, after loading and
+# after the first prediction. The memory-mapped artifact pages are shared with other processes
+# (compare the private memory). The current and private RSS are read from /proc (Linux), other
+# systems only report the peak RSS of the process instead.
+
+# load packages
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+
+# format: description
+FORMATS = {
+    'joblib': 'pickled sklearn model (joblib.load)',
+    'joblib-mmap': "pickled sklearn model (joblib.load with mmap_mode='r')",
+    'arrays': 'flat node arrays read into memory (see model_artifact.py)',
+    'arrays-mmap': 'flat node arrays memory-mapped (see model_artifact.py)',
+}
+
+
+def rss_mb(field='VmRSS'):
+    """Returns the resident memory of this process in MB, None without /proc/self/status (not Linux).
+
+    Args:
+        field (str): Field of /proc/self/status, e.g. 'VmRSS' (total) or 'RssAnon' (private, without mapped files).
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of this process in MB (available on all unix systems, inherited across exec on Linux)."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(file_format, model_path, artifact_dir):
+    """Loads the model in one format and predicts one row (runs inside the subprocess).
+
+    Returns:
+        dict: Load and first prediction time in seconds and RSS in MB (None if it cannot be measured).
+    """
+    import joblib
+    from modules.model_artifact import load_artifact
+
+    result = {'format': file_format, 'rss_imports_mb': rss_mb()}
+
+    start = time.perf_counter()
+    if file_format == 'joblib':
+        model = joblib.load(model_path)
+    elif file_format == 'joblib-mmap':
+        model = joblib.load(model_path, mmap_mode='r')
+    elif file_format == 'arrays':
+        model = load_artifact(artifact_dir, mmap=False)
+    elif file_format == 'arrays-mmap':
+        model = load_artifact(artifact_dir, mmap=True)
+    else:
+        raise ValueError(f"Unknown format '{file_format}', expected one of {list(FORMATS)}.")
+    result['load_s'] = time.perf_counter() - start
+    result['rss_loaded_mb'] = rss_mb()
+
+    n_features = model.n_features_in_ if hasattr(model, 'estimators_') else model.n_features
+    features = np.zeros((1, n_features))
+    start = time.perf_counter()
+    model.predict(features)
+    result['first_predict_s'] = time.perf_counter() - start
+    result['rss_predicted_mb'] = rss_mb()
+    # memory-mapped arrays are part of the RSS, but shared with all processes mapping the same files
+    result['rss_private_mb'] = rss_mb('RssAnon')
+    # only as replacement on systems without /proc, on Linux the peak also covers the parent process before exec
+    result['rss_peak_mb'] = peak_rss_mb() if result['rss_predicted_mb'] is None else None
+    return result
+
+
+def run_benchmark(model_path, artifact_dir, formats=FORMATS, repeat=3):
+    """Measures every format in fresh subprocesses and returns the median per format.
+
+    Returns:
+        list: One result dict per format (see `measure`).
+    """
+    results = []
+    for file_format in formats:
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-m', 'modules.load_benchmark', '--worker', file_format,
+                 '--model', model_path, '--artifact', artifact_dir],
+                check=True, capture_output=True, text=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results.append({
+            key: (runs[0][key] if key == 'format' or runs[0][key] is None else float(np.median([run[key] for run in runs])))
+            for key in runs[0]
+        })
+    return results
+
+
+def main():
+    from modules.model_artifact import MODEL_PATH, ARTIFACT_DIR, load_or_create_artifact
+
+    parser = argparse.ArgumentParser(description='Compare load time and memory of the model formats.')
+    parser.add_argument('--model', default=MODEL_PATH, help='pickled model (joblib)')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help='folder of the flat array artifact (created if missing)')
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=list(FORMATS), help='formats to compare')
+    parser.add_argument('--repeat', type=int, default=3, help='subprocesses per format (median is reported)')
+    parser.add_argument('--worker', choices=list(FORMATS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.model, args.artifact)))
+        return
+
+    load_or_create_artifact(args.model, args.artifact)
+    results = run_benchmark(args.model, args.artifact, args.formats, args.repeat)
+
+    def mb(value, width):
+        # RSS values which cannot be measured on this system
+        return f"{'n/a':>{width + 2}}" if value is None else f"{value:>{width}.0f}MB"
+
+    print(f"{'format':<12} {'load [s]':>9} {'1st predict [s]':>16} {'RSS imports':>12} {'RSS loaded':>11} {'RSS predicted':>14} {'private':>8} {'peak':>8}")
+    for result in results:
+        print(f"{result['format']:<12} {result['load_s']:>9.3f} {result['first_predict_s']:>16.4f} "
+              f"{mb(result['rss_imports_mb'], 10)} {mb(result['rss_loaded_mb'], 9)} {mb(result['rss_predicted_mb'], 12)} "
+              f"{mb(result['rss_private_mb'], 6)} {mb(result['rss_peak_mb'], 6)}")
+
+
+if __name__ == '__main__':
+    main()
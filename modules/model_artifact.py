@@ -0,0 +1,161 @@
+## memory-mappable model artifact (flat node arrays, see fast_inference.py)
+#
+# A directory with one uncompressed .npy file per array and a meta.json. Loaded with mmap_mode='r',
+# all worker processes share the page cache copy of the arrays and start without unpickling trees.
+# Every save writes a new build folder inside the artifact folder and switches the CURRENT pointer
+# to it, artifacts of the older flat layout (files directly in the folder) can still be read.
+
+# load packages
+import os
+import json
+import shutil
+import uuid
+import joblib
+import datetime
+import numpy as np
+
+# functions
+from modules.fast_inference import CompiledStack, export_stack
+from modules.caching import cache_resource
+
+
+MODEL_PATH = 'models/stacked_multivariate_model.pkl'
+ARTIFACT_DIR = 'models/stacked_multivariate_model_arrays'
+META_FILE = 'meta.json'
+CURRENT_FILE = 'CURRENT'
+# builds kept on disk (the current one and the previous one, which readers might just be loading)
+KEEP_BUILDS = 2
+
+
+def save_artifact(model, directory=ARTIFACT_DIR, source_mtime=None):
+    """Saves a fitted stacked model as directory of flat arrays.
+
+    The arrays and `meta.json` are written to a temporary folder, which is renamed to a new build
+    folder. Then the `CURRENT` pointer is replaced with `os.replace`, so readers see either the
+    complete previous or the complete new build. Older builds are removed, processes which have
+    their files memory-mapped keep reading them.
+
+    Args:
+        model (object): Fitted `MultiOutputRegressor(StackingRegressor)` or `CompiledStack`.
+        directory (str): Folder of the artifact.
+        source_mtime (float, optional): Modification time of the pickled model the artifact was created from.
+
+    Returns:
+        str: The artifact folder.
+    """
+    if isinstance(model, CompiledStack):
+        arrays, meta = model.arrays, model.meta
+    else:
+        arrays, meta = export_stack(model)
+
+    # the names sort by creation time, the random suffix keeps parallel saves (processes or threads) apart
+    build = f"build_{datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(directory, f'.{build}.tmp')
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        with open(os.path.join(tmp_dir, f'{name}.npy'), 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+        json.dump(dict(meta, arrays=sorted(arrays), source_mtime=source_mtime), f, indent=1)
+    os.replace(tmp_dir, os.path.join(directory, build))
+
+    current = os.path.join(directory, CURRENT_FILE)
+    tmp_path = f'{current}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(build)
+    os.replace(tmp_path, current)
+
+    # remove older builds and the files of the flat layout
+    builds = sorted(name for name in os.listdir(directory) if name.startswith('build_'))
+    for name in builds[:-KEEP_BUILDS]:
+        if name != build:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    for name in os.listdir(directory):
+        if name.endswith('.npy') or name == META_FILE:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    return directory
+
+
+def build_dir(directory=ARTIFACT_DIR):
+    """Returns the folder of the current build of an artifact (the artifact folder for the flat layout)."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return directory
+
+
+def read_meta(directory=ARTIFACT_DIR):
+    """Returns the metadata of the current build of an artifact or None if it does not exist."""
+    try:
+        with open(os.path.join(build_dir(directory), META_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_artifact(directory=ARTIFACT_DIR, mmap=True):
+    """Loads a model artifact as `CompiledStack`.
+
+    Args:
+        directory (str): Folder of the artifact.
+        mmap (bool): Whether to memory-map the arrays (read-only) instead of reading them into memory.
+
+    Returns:
+        CompiledStack: The compiled model.
+
+    Raises:
+        ValueError: If the folder contains no artifact.
+    """
+    while True:
+        # metadata and arrays of the same build
+        build = build_dir(directory)
+        meta = read_meta(build)
+        if meta is None:
+            raise ValueError(f"No model artifact found in {directory}.")
+
+        try:
+            arrays = {
+                name: np.load(os.path.join(build, f'{name}.npy'), mmap_mode='r' if mmap else None)
+                for name in meta.pop('arrays')
+            }
+        except FileNotFoundError:
+            # the build was removed by a newer save while loading, load the newer build
+            if build_dir(directory) == build:
+                raise
+            continue
+        meta.pop('source_mtime', None)
+        return CompiledStack(arrays, meta)
+
+
+def load_or_create_artifact(model_path=MODEL_PATH, directory=ARTIFACT_DIR, mmap=True):
+    """Loads the artifact of a pickled model, it is (re)created if missing or older than the pickle.
+
+    Args:
+        model_path (str): Pickled model (joblib).
+        directory (str): Folder of the artifact.
+        mmap (bool): Whether to memory-map the arrays.
+
+    Returns:
+        CompiledStack: The compiled model.
+    """
+    meta = read_meta(directory)
+    source_mtime = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+    if meta is None or (source_mtime is not None and meta.get('source_mtime') != source_mtime):
+        save_artifact(joblib.load(model_path), directory, source_mtime)
+
+    return load_artifact(directory, mmap)
+
+
+@cache_resource
+def load_compiled_model():
+    """Loads the pre-trained model as memory-mapped compiled model (see `load_or_create_artifact`).
+
+    Returns:
+        CompiledStack: The compiled model.
+    """
+    return load_or_create_artifact()
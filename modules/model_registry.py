@@ -0,0 +1,422 @@
+## versioned registry of scaler + model bundles with hot reload
+#
+# models/registry/<version>/   scaler.pkl, model.pkl, manifest.json (feature order, targets, sha256)
+#                              arrays/ (compiled model, created on first use, see model_artifact.py)
+# models/registry/CURRENT      version used by the forecast and the prediction service
+#
+# Without CURRENT the unversioned files models/robust_scaler_multivariate.pkl and
+# models/stacked_multivariate_model.pkl are used (version 'legacy').
+#
+# usage: python -m modules.model_registry list
+#        python -m modules.model_registry activate <version>
+
+# load packages
+import os
+import json
+import time
+import uuid
+import argparse
+import shutil
+import hashlib
+import datetime
+import threading
+import joblib
+import pandas as pd
+
+# functions
+from modules.preprocessing import COL_ORDER
+from modules.feature_transform import FeatureTransform
+from modules.model_artifact import MODEL_PATH, ARTIFACT_DIR, load_artifact, load_or_create_artifact, read_meta, save_artifact
+
+
+REGISTRY_DIR = 'models/registry'
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+LEGACY_VERSION = 'legacy'
+SCALER_PATH = 'models/robust_scaler_multivariate.pkl'
+TARGET_COLUMNS = ['windpower', 'solar_pv']
+# seconds between two checks of CURRENT
+CHECK_INTERVAL = 5.0
+# largest batch predicted with the compiled model by engine='auto', the sklearn model is faster
+# for larger batches (see fast_inference.py)
+COMPILED_MAX_ROWS = 500
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def content_hash(paths, col_order, target_columns):
+    """Returns the sha256 of the bundle files, the feature order and the target columns."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(json.dumps([list(col_order), list(target_columns)]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def check_compatibility(scaler, model, col_order, target_columns):
+    """Checks that scaler, model, feature order and targets belong together.
+
+    Raises:
+        ValueError: If the number or names of the features or the number of targets do not match.
+    """
+    if getattr(scaler, 'n_features_in_', len(col_order)) != len(col_order):
+        raise ValueError(f"The scaler expects {scaler.n_features_in_} features, col_order has {len(col_order)}.")
+    if hasattr(scaler, 'feature_names_in_') and list(scaler.feature_names_in_) != list(col_order):
+        raise ValueError(f"The scaler was fitted on the features {list(scaler.feature_names_in_)}, not {list(col_order)}.")
+    if getattr(model, 'n_features_in_', len(col_order)) != len(col_order):
+        raise ValueError(f"The model expects {model.n_features_in_} features, col_order has {len(col_order)}.")
+    if hasattr(model, 'estimators_') and type(model).__name__ == 'MultiOutputRegressor' and len(model.estimators_) != len(target_columns):
+        raise ValueError(f"The model predicts {len(model.estimators_)} targets, target_columns has {len(target_columns)}.")
+    if getattr(model, 'n_outputs_', len(target_columns)) != len(target_columns):
+        raise ValueError(f"The model predicts {model.n_outputs_} targets, target_columns has {len(target_columns)}.")
+
+
+class ModelBundle:
+    """Scaler, model, feature order and target columns of one model version.
+
+    Scaler, model and compiled model (see fast_inference.py) are loaded lazily and only once, so
+    the prediction service with the compiled engine never unpickles the sklearn model.
+
+    Args:
+        version (str): Version of the bundle (start of the content hash or 'legacy').
+        col_order (list): Features in the order used for training.
+        target_columns (list): Predicted targets.
+        scaler_path (str): Pickled scaler.
+        model_path (str): Pickled model.
+        artifact_dir (str): Folder of the compiled model artifact.
+        sha256 (str, optional): Content hash of the bundle.
+    """
+    def __init__(self, version, col_order, target_columns, scaler_path, model_path, artifact_dir, sha256=None):
+        self.version = version
+        self.col_order = list(col_order)
+        self.target_columns = list(target_columns)
+        self.scaler_path = scaler_path
+        self.model_path = model_path
+        self.artifact_dir = artifact_dir
+        self.sha256 = sha256
+        self._scaler = None
+        self._model = None
+        self._compiled = None
+        self._compile_error = None
+        self._feature_transform = None
+        self._lock = threading.Lock()
+
+    @property
+    def scaler(self):
+        with self._lock:
+            if self._scaler is None:
+                self._scaler = joblib.load(self.scaler_path)
+            return self._scaler
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = joblib.load(self.model_path)
+            return self._model
+
+    @property
+    def compiled(self):
+        """The memory-mapped compiled model (see model_artifact.py), created on first use."""
+        with self._lock:
+            if self._compiled is None:
+                if self.version == LEGACY_VERSION:
+                    self._compiled = load_or_create_artifact(self.model_path, self.artifact_dir)
+                else:
+                    # bundles are immutable, the artifact only has to be created once
+                    if read_meta(self.artifact_dir) is None:
+                        save_artifact(joblib.load(self.model_path), self.artifact_dir)
+                    self._compiled = load_artifact(self.artifact_dir)
+            return self._compiled
+
+    def compiles(self):
+        """Whether the model can be compiled (see fast_inference.py), tried once."""
+        if self._compile_error is None:
+            try:
+                self.compiled
+                self._compile_error = False
+            except ValueError as e:
+                print(f"Model version {self.version} cannot be compiled, the sklearn model is used: {e}")
+                self._compile_error = True
+        return not self._compile_error
+
+    @property
+    def feature_transform(self):
+        """The fused feature transform (see feature_transform.py) with the scaler of the bundle."""
+        scaler = self.scaler
+        with self._lock:
+            if self._feature_transform is None:
+                self._feature_transform = FeatureTransform(scaler, col_order=self.col_order)
+            return self._feature_transform
+
+    def transform(self, data):
+        """Scales preprocessed weather data with the scaler of the bundle.
+
+        Args:
+            data (pd.DataFrame): Daily weather features (see `FeatureTransform.features`) with the features of `col_order`.
+
+        Returns:
+            pd.DataFrame: Scaled features in the order of `col_order`.
+        """
+        data = data[self.col_order]
+        return pd.DataFrame(self.scaler.transform(data), columns=self.col_order, index=data.index)
+
+    def predict(self, features, engine='auto'):
+        """Predicts the targets for scaled features.
+
+        Args:
+            features (pd.DataFrame or np.ndarray): Scaled features in the order of `col_order`.
+            engine (str): 'sklearn' for the pickled model, 'compiled' for the compiled model or 'auto'
+                for the compiled model up to `COMPILED_MAX_ROWS` rows and the pickled model for larger
+                batches (or if the model cannot be compiled).
+
+        Returns:
+            np.ndarray: Predictions with shape (rows, targets).
+
+        Raises:
+            ValueError: If the predictions do not have one column per target.
+        """
+        if engine == 'auto':
+            engine = 'compiled' if len(features) <= COMPILED_MAX_ROWS and self.compiles() else 'sklearn'
+        model = self.compiled if engine == 'compiled' else self.model
+        predictions = model.predict(features)
+        if predictions.ndim != 2 or predictions.shape[1] != len(self.target_columns):
+            raise ValueError(f"Unexpected prediction shape: {predictions.shape}, expected (_, {len(self.target_columns)})")
+        return predictions
+
+
+def legacy_bundle():
+    """Returns the bundle of the unversioned model files."""
+    return ModelBundle(LEGACY_VERSION, COL_ORDER, TARGET_COLUMNS, SCALER_PATH, MODEL_PATH, ARTIFACT_DIR)
+
+
+def publish_bundle(scaler, model, col_order=COL_ORDER, target_columns=TARGET_COLUMNS, registry_dir=REGISTRY_DIR, activate=True):
+    """Adds a scaler + model bundle to the registry and optionally makes it the current version.
+
+    The bundle is written to a temporary folder and renamed to its version, so readers never see
+    a partial bundle. Publishing the same content again returns the existing version.
+
+    Args:
+        scaler (object): Fitted scaler.
+        model (object): Fitted model.
+        col_order (list): Features in the order used for training.
+        target_columns (list): Predicted targets.
+        registry_dir (str): Folder of the registry.
+        activate (bool): Whether to point CURRENT to the bundle.
+
+    Returns:
+        str: Version of the bundle.
+
+    Raises:
+        ValueError: If scaler, model, features and targets do not match.
+    """
+    check_compatibility(scaler, model, col_order, target_columns)
+
+    tmp_dir = os.path.join(registry_dir, f'.tmp-{uuid.uuid4().hex}')
+    os.makedirs(tmp_dir)
+    try:
+        joblib.dump(scaler, os.path.join(tmp_dir, 'scaler.pkl'))
+        joblib.dump(model, os.path.join(tmp_dir, 'model.pkl'))
+        sha256 = content_hash([os.path.join(tmp_dir, 'scaler.pkl'), os.path.join(tmp_dir, 'model.pkl')], col_order, target_columns)
+        version = sha256[:16]
+
+        manifest = {
+            'version': version,
+            'sha256': sha256,
+            'col_order': list(col_order),
+            'target_columns': list(target_columns),
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+        if not os.path.exists(os.path.join(registry_dir, version)):
+            os.replace(tmp_dir, os.path.join(registry_dir, version))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if activate:
+        set_current(version, registry_dir)
+    return version
+
+
+def set_current(version, registry_dir=REGISTRY_DIR):
+    """Atomically points CURRENT to a published version (e.g. for a rollback).
+
+    Raises:
+        ValueError: If the version does not exist.
+    """
+    if not os.path.exists(os.path.join(registry_dir, version, MANIFEST_FILE)):
+        raise ValueError(f"Model version {version} does not exist in {registry_dir}.")
+
+    current = os.path.join(registry_dir, CURRENT_FILE)
+    # unique temporary name, training and a rollback may switch at the same time
+    tmp_path = f'{current}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, current)
+
+
+def current_version(registry_dir=REGISTRY_DIR):
+    """Returns the current version, 'legacy' if no version was published."""
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return LEGACY_VERSION
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """Returns the manifests of all published versions, oldest first."""
+    if not os.path.isdir(registry_dir):
+        return []
+
+    manifests = []
+    for name in os.listdir(registry_dir):
+        path = os.path.join(registry_dir, name, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                manifests.append(json.load(f))
+    return sorted(manifests, key=lambda manifest: manifest['created'])
+
+
+def load_bundle(version, registry_dir=REGISTRY_DIR, verify=True):
+    """Returns the bundle of a version.
+
+    Args:
+        version (str): Published version or 'legacy'.
+        registry_dir (str): Folder of the registry.
+        verify (bool): Whether to check the content hash of the files.
+
+    Returns:
+        ModelBundle: The bundle (scaler and model are loaded on first use).
+
+    Raises:
+        ValueError: If the version does not exist or its files do not match the content hash.
+    """
+    if version == LEGACY_VERSION:
+        return legacy_bundle()
+
+    directory = os.path.join(registry_dir, version)
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Model version {version} does not exist in {registry_dir}.")
+
+    paths = [os.path.join(directory, 'scaler.pkl'), os.path.join(directory, 'model.pkl')]
+    if verify and content_hash(paths, manifest['col_order'], manifest['target_columns']) != manifest['sha256']:
+        raise ValueError(f"The files of model version {version} do not match its content hash.")
+
+    return ModelBundle(version, manifest['col_order'], manifest['target_columns'], paths[0], paths[1],
+                       os.path.join(directory, 'arrays'), manifest['sha256'])
+
+
+class ModelRegistry:
+    """Keeps the current bundle of a registry and switches to new versions without restart.
+
+    `current()` checks CURRENT at most every `check_interval` seconds. A new version is loaded by
+    one thread while the others keep using the previous bundle. Afterwards the reference is
+    swapped, requests which already hold the previous bundle finish with it. Only the current and
+    the previous bundle are kept in memory (a rollback to the previous version does not load it
+    again), older versions are dropped.
+
+    Args:
+        registry_dir (str): Folder of the registry.
+        check_interval (float): Seconds between two checks of CURRENT.
+        warm (callable, optional): Called with a new bundle before it is swapped in (e.g. to load
+            the model), so no request has to wait for the loading.
+    """
+    def __init__(self, registry_dir=REGISTRY_DIR, check_interval=CHECK_INTERVAL, warm=None):
+        self.registry_dir = registry_dir
+        self.check_interval = check_interval
+        self.warm = warm
+        self._bundle = None
+        self._bundles = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Returns the current bundle (see class description)."""
+        bundle = self._bundle
+        if bundle is not None and time.monotonic() - self._checked < self.check_interval:
+            return bundle
+
+        # only one thread checks and loads, the others continue with the previous bundle
+        if not self._lock.acquire(blocking=bundle is None):
+            return bundle
+        try:
+            if self._bundle is None or time.monotonic() - self._checked >= self.check_interval:
+                self._switch(current_version(self.registry_dir))
+            return self._bundle
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Checks CURRENT immediately and returns the current bundle."""
+        with self._lock:
+            self._switch(current_version(self.registry_dir))
+            return self._bundle
+
+    def _switch(self, version):
+        if self._bundle is None or self._bundle.version != version:
+            if version not in self._bundles:
+                try:
+                    bundle = load_bundle(version, self.registry_dir)
+                    if self.warm is not None:
+                        self.warm(bundle)
+                    self._bundles[version] = bundle
+                except Exception as e:
+                    if self._bundle is None:
+                        raise
+                    # keep serving the previous version
+                    print(f"Error loading model version {version}: {e}")
+                    self._checked = time.monotonic()
+                    return
+            previous, self._bundle = self._bundle, self._bundles[version]
+            # keep the previous bundle until its requests have finished, drop older ones
+            keep = {version} if previous is None else {version, previous.version}
+            self._bundles = {v: bundle for v, bundle in self._bundles.items() if v in keep}
+        self._checked = time.monotonic()
+
+
+def get_registry():
+    """Returns the `ModelRegistry` of this process."""
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
+
+
+def current_bundle():
+    """Returns the current bundle of the default registry."""
+    return get_registry().current()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List the model versions or switch the current version.')
+    parser.add_argument('command', choices=['list', 'activate'], help="'list' the versions or 'activate' one (e.g. for a rollback)")
+    parser.add_argument('version', nargs='?', help='version to activate')
+    parser.add_argument('--registry-dir', default=REGISTRY_DIR, help='folder of the registry')
+    args = parser.parse_args()
+
+    if args.command == 'activate':
+        if not args.version:
+            parser.error("activate needs a version")
+        set_current(args.version, args.registry_dir)
+
+    current = current_version(args.registry_dir)
+    for manifest in list_versions(args.registry_dir):
+        marker = '*' if manifest['version'] == current else ' '
+        print(f"{marker} {manifest['version']}  {manifest['created']}  targets: {', '.join(manifest['target_columns'])}")
+    if current == LEGACY_VERSION:
+        print(f"* {LEGACY_VERSION}  ({SCALER_PATH}, {MODEL_PATH})")
+
+
+if __name__ == '__main__':
+    main()
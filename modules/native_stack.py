@@ -0,0 +1,108 @@
+## stacked model with native multi-output base learners
+#
+# `MultiOutputRegressor(StackingRegressor)` fits a complete stack per target: every base model is
+# trained 6 times (5 folds + all rows) for windpower and again for solar_pv. RandomForestRegressor,
+# XGBRegressor and LinearRegression can fit both targets at once, so `MultiOutputStack` trains every
+# base model once per fold on the (rows x targets) matrix and combines all base predictions with
+# one multi-output Ridge.
+
+# load packages
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.utils import Bunch
+from sklearn.model_selection import KFold
+from sklearn.linear_model import Ridge
+
+
+def _fit_base(estimator, X, Y, train, test):
+    """Fits a base model on the training rows (None for all), returns the model or its predictions of the test rows."""
+    if train is None:
+        return clone(estimator).fit(X, Y)
+    return clone(estimator).fit(X[train], Y[train]).predict(X[test])
+
+
+class MultiOutputStack(RegressorMixin, BaseEstimator):
+    """Stacking regressor for several targets with multi-output base models.
+
+    Like `StackingRegressor`, the base models are fitted on all rows (used for predictions) and on
+    the cross-validation folds (out-of-fold predictions as features of the final estimator). The
+    final estimator sees the predictions of all base models for all targets.
+
+    Args:
+        estimators (list): (name, estimator) of base models which support 2D targets.
+        final_estimator (object, optional): Multi-output meta-learner, defaults to `Ridge(alpha=0.1)`.
+        cv (int): Number of (unshuffled) folds for the out-of-fold predictions.
+        n_jobs (int, optional): Parallel base model fits (-1 for all cores).
+    """
+    def __init__(self, estimators, final_estimator=None, cv=5, n_jobs=None):
+        self.estimators = estimators
+        self.final_estimator = final_estimator
+        self.cv = cv
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y):
+        """Fits the base models and the final estimator.
+
+        Args:
+            X (array-like): Features with shape (rows, features).
+            y (array-like): Targets with shape (rows, targets).
+
+        Returns:
+            MultiOutputStack: The fitted model.
+
+        Raises:
+            ValueError: If y is not two-dimensional.
+        """
+        X = np.asarray(X)
+        Y = np.asarray(y)
+        if Y.ndim != 2:
+            raise ValueError(f"MultiOutputStack expects targets with shape (rows, targets), got {Y.shape}.")
+
+        folds = list(KFold(self.cv).split(X))
+        # fold None is the fit on all rows
+        tasks = [(estimator, fold) for _, estimator in self.estimators for fold in [None] + list(range(self.cv))]
+        results = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_base)(estimator, X, Y, *((None, None) if fold is None else folds[fold]))
+            for estimator, fold in tasks
+        )
+
+        n_fits = self.cv + 1
+        self.estimators_ = results[::n_fits]
+        self.named_estimators_ = Bunch(**{name: estimator for (name, _), estimator in zip(self.estimators, self.estimators_)})
+
+        # out-of-fold predictions in the row order of X, like `cross_val_predict`
+        predictions = np.empty((len(X), Y.shape[1], len(self.estimators)))
+        for position in range(len(self.estimators)):
+            for fold, (_, test) in enumerate(folds):
+                predictions[test, :, position] = np.asarray(results[position * n_fits + 1 + fold]).reshape(len(test), -1)
+
+        final_estimator = Ridge(alpha=0.1) if self.final_estimator is None else self.final_estimator
+        self.final_estimator_ = clone(final_estimator).fit(predictions.reshape(len(X), -1), Y)
+        self.n_features_in_ = X.shape[1]
+        self.n_outputs_ = Y.shape[1]
+        return self
+
+    def transform(self, X):
+        """Returns the base model predictions, the features of the final estimator.
+
+        Args:
+            X (array-like): Features with shape (rows, features).
+
+        Returns:
+            np.ndarray: Predictions with shape (rows, targets * base models), ordered by target, then base model.
+        """
+        X = np.asarray(X)
+        predictions = np.stack([np.asarray(estimator.predict(X)).reshape(len(X), -1) for estimator in self.estimators_], axis=2)
+        return predictions.reshape(len(X), -1)
+
+    def predict(self, X):
+        """Predicts all targets.
+
+        Args:
+            X (array-like): Features with shape (rows, features).
+
+        Returns:
+            np.ndarray: Predictions with shape (rows, targets).
+        """
+        return self.final_estimator_.predict(self.transform(X))
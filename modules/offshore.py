@@ -1,61 +1,93 @@
-# create dataframe for north sea and baltic sea
-import streamlit as st
+# create dataframe for north sea and baltic sea (or any other table of offshore wind farms)
+import numpy as np
 import pandas as pd
 
+from modules.caching import cache_data
+
+
+# this data needed to be added manually since it wasn't referenced to in the nominal capacity geo_df 
+# source: Bundesnetzagentur as of november 2024)
+# coordinates are the 'Albatros' (north sea) and 'Wikinger' (baltic sea) windparks
+OFFSHORE_FARMS = pd.DataFrame({
+    'region': ['north_sea', 'baltic_sea'],
+    'name': ['North Sea', 'Baltic Sea'],
+    'latitude': [54.433, 54.834],
+    'longitude': [6.317, 14.068],
+    'solar_pv': [0, 0],
+    'windpower': [6882, 1047],
+    'solar_percentage': [0, 0],
+    'wind_percentage': [0.099816, 0.015186],
+})
+
+# nominal installed wind capacity in germany (MW) the percentages refer to
+NATIONAL_WIND_CAPACITY = 6882 / 0.099816
+
+
+def default_name(region):
+    """Returns the display name of an offshore region key without `name` (e.g. 'north_sea' -> 'North Sea', 'DanTysk' stays)."""
+    name = region.replace('_', ' ')
+    # only lowercase keys are title-cased, names like 'DanTysk' or 'Baltic 2' keep their spelling
+    return name.title() if region.islower() else name
+
+
+def farm_names(df_offshore):
+    """Returns the display name per offshore region key in the order of the farms.
+
+    Args:
+        df_offshore (pd.DataFrame): Offshore contributions (see `create_offshore_dataframe`). Tables of
+            older snapshots without `name` get the `default_name` of their keys.
+
+    Returns:
+        dict: `region` key -> display name.
+    """
+    farms = df_offshore.drop_duplicates('region')
+    names = farms['name'] if 'name' in farms else farms['region'].map(default_name)
+    return dict(zip(farms['region'], names))
+
+
 # External script to create the offshore dataframe
-@st.cache_data
-def create_offshore_dataframe(predictions_df):
+@cache_data
+def create_offshore_dataframe(predictions_df, farms=None):
     """Generates a DataFrame with offshore wind (and solar) electricity contributions per day.
 
     This function:
-    - Creates a base DataFrame for offshore wind and solar production of electricity in the North Sea and Baltic Sea.
-    - Iterates through the provided `predictions_df` to compute offshore wind and solar contributions for each date.
-    - Combines all calculated contributions into a final DataFrame.
+    - Uses a table of offshore regions or individual wind farms (standard: North Sea and Baltic Sea).
+    - Computes the contributions of all farms and days at once as outer product of the daily predictions 
+      and the share of each farm in the installed capacity.
+    - Returns one row per day and farm (ordered by day).
 
     Args:
         predictions_df (pd.DataFrame): DataFrame containing daily predicted wind and solar electricity production.
+        farms (pd.DataFrame, optional): Offshore farms with a unique key `region`, `latitude`, `longitude` and the installed 
+            capacity `windpower` in MW. The display `name` defaults to the key (see `default_name`), `wind_percentage` 
+            (share of the national wind production) is derived from the capacity if missing, `solar_pv` and 
+            `solar_percentage` default to 0. Defaults to `OFFSHORE_FARMS`.
 
     Returns:
-        pd.DataFrame: Offshore electricity contributions per region (`north_sea`, `baltic_sea`) with calculated 
-                      daily values for wind and solar electricity.
+        pd.DataFrame: Offshore electricity contributions per region (e.g. `north_sea`, `baltic_sea`) with calculated 
+                      daily values for wind and solar electricity: the columns of the farm table (including the 
+                      display `name` and the `latitude` and `longitude` of the map markers), `date`, `calculated_windpower` 
+                      and `calculated_solarpower`.
     """
+    if farms is None:
+        farms = OFFSHORE_FARMS
+
+    farms = farms.reset_index(drop=True)
+    if 'name' not in farms:
+        farms = farms.assign(name=farms['region'].map(default_name))
+    if 'wind_percentage' not in farms:
+        farms = farms.assign(wind_percentage=farms['windpower'] / NATIONAL_WIND_CAPACITY)
+    for column in ['solar_pv', 'solar_percentage']:
+        if column not in farms:
+            farms = farms.assign(**{column: 0})
+
+    dates = predictions_df.index.strftime('%d/%m/%y')
+    n_days = len(dates)
+
+    # repeat the farm table once per day and calculate the contributions of all days and farms in one step
+    df_offshore = farms.iloc[np.tile(np.arange(len(farms)), n_days)].reset_index(drop=True)
+    df_offshore['date'] = np.repeat(dates, len(farms))
+    df_offshore['calculated_windpower'] = np.outer(predictions_df['windpower'].to_numpy(), farms['wind_percentage'].to_numpy()).ravel()
+    df_offshore['calculated_solarpower'] = np.outer(predictions_df['solar_pv'].to_numpy(), farms['solar_percentage'].to_numpy()).ravel()
 
-    # this data needed to be added manually since it wasn't referenced to in the nominal capacity geo_df 
-    # source: Bundesnetzagentur as of november 2024)
-    offshore = {
-        'region': ['north_sea', 'baltic_sea'],
-        'solar_pv': [0, 0],
-        'windpower': [6882, 1047],
-        'solar_percentage': [0, 0],
-        'wind_percentage': [0.099816, 0.015186],
-    }
-    
-    # Create the initial offshore dataframe
-    df_offshore = pd.DataFrame(offshore)
-
-    # Reset the index and ensure date is a column
-    predictions_df = predictions_df.reset_index()
-    predictions_df['date'] = predictions_df['date'].dt.strftime('%d/%m/%y')
-
-    # Initialize a list to hold offshore contributions for each date
-    offshore_data = []
-
-    # Iterate over each date in the predictions_df
-    for _, row in predictions_df.iterrows():
-        wind_prediction = row['windpower']
-        solar_prediction = row['solar_pv']
-        date = row['date']
-
-        # Calculate offshore wind contributions for the current date
-        df_offshore_copy = df_offshore.copy()
-        df_offshore_copy['date'] = date
-        df_offshore_copy['calculated_windpower'] = df_offshore_copy['wind_percentage'] * wind_prediction
-        df_offshore_copy['calculated_solarpower'] = df_offshore_copy['solar_percentage'] * solar_prediction
-
-        # Append the calculated contributions to the list
-        offshore_data.append(df_offshore_copy)
-
-    # Concatenate all the offshore contributions into a single DataFrame
-    df_offshore_final = pd.concat(offshore_data, ignore_index=True)
-
-    return df_offshore_final
+    return df_offshore
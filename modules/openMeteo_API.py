@@ -6,121 +6,442 @@ import requests_cache
 import requests
 from retry_requests import retry
 
+import numpy as np
 import pandas as pd
 import datetime
-import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.weather_store import TIMEZONE, WeatherStore, local_today
+
+# Open-Meteo forecast endpoint
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+# List of cities (and offshore windfarms) which are averaged to one daily value for germany
+CITIES = [
+    {"city": "Emden", "latitude": 53.367, "longitude": 7.207},
+    {"city": "Hamburg", "latitude": 53.551, "longitude": 9.993},
+    {"city": "Greifswald", "latitude": 54.093, "longitude": 13.387},
+    {"city": "Braunschweig", "latitude": 52.268, "longitude": 10.526},
+    {"city": "Köln", "latitude": 50.937, "longitude": 6.960},
+    {"city": "Kassel", "latitude": 51.316, "longitude": 9.498},
+    {"city": "Dresden", "latitude": 51.050, "longitude": 13.738},
+    {"city": "Freiburg", "latitude": 47.999, "longitude": 7.842},
+    {"city": "Würzburg", "latitude": 49.791, "longitude": 9.953},
+    {"city": "Augsburg", "latitude": 48.370, "longitude": 10.897},
+    {"city": "Passau", "latitude": 48.574, "longitude": 13.460},
+    {"city": "Albatros", "latitude": 54.433, "longitude": 6.317}, # Windfarm northsea
+    {"city": "Wikinger", "latitude": 54.834, "longitude": 14.068} # Windfarm baltic sea
+]
+
+# Daily meteorological variables requested for each location (same order as in the API response)
+DAILY_VARIABLES = [
+    "temperature_2m_max", "temperature_2m_min", 
+    "apparent_temperature_max", "apparent_temperature_min",
+    "daylight_duration", "sunshine_duration", "precipitation_sum", 
+    "precipitation_hours", "snowfall_sum",
+    "wind_speed_10m_max", "wind_gusts_10m_max", "wind_direction_10m_dominant",
+    "shortwave_radiation_sum"
+]
+
+# Retry settings and number of parallel requests
+RETRIES = 5
+BACKOFF_FACTOR = 0.2
+# requests keeps at most 10 connections per host alive, more workers would not reuse them
+MAX_WORKERS = 8
+TIMEOUT = 30
+
+
+def create_session(retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """Creates a cached requests session which retries failed requests with an exponential backoff.
+
+    Args:
+        retries (int): Number of retries for a failed request.
+        backoff_factor (float): Backoff factor between the retries.
+
+    Returns:
+        requests.Session: Session with sqlite cache (`.cache.sqlite`) and retry adapter.
+    """
+    cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
+    return retry(cache_session, retries=retries, backoff_factor=backoff_factor)
+
+
+def daily_params(days, past_days):
+    """Builds the request parameters shared by all locations.
+
+    Args:
+        days (int): Number of future days to retrieve weather data for.
+        past_days (int): Number of past days to retrieve historical weather data.
+
+    Returns:
+        dict: Open-Meteo request parameters without coordinates.
+    """
+    return {
+        "daily": DAILY_VARIABLES,
+        "timezone": TIMEZONE,
+        "forecast_days": days,
+        "past_days": past_days
+    }
+
+
+def range_params(start_date, end_date):
+    """Builds the request parameters for a fixed date range instead of relative forecast and past days.
+
+    Args:
+        start_date (datetime.date): First day to retrieve weather data for.
+        end_date (datetime.date): Last day to retrieve weather data for (inclusive).
+
+    Returns:
+        dict: Open-Meteo request parameters without coordinates.
+    """
+    return {
+        "daily": DAILY_VARIABLES,
+        "timezone": TIMEZONE,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat()
+    }
+
+
+def fetch_location(session, city, params, url=OPEN_METEO_URL):
+    """Requests the daily weather data of a single location.
+
+    Args:
+        session (requests.Session): Session used for the request (keep-alive, cache and retries).
+        city (dict): Location with `city`, `latitude` and `longitude`.
+        params (dict): Request parameters without coordinates (see `daily_params`).
+        url (str): Open-Meteo endpoint.
+
+    Returns:
+        pd.DataFrame: Daily weather data of the location with `time`, the weather variables, `date` and `city`.
+
+    Raises:
+        ValueError: If the response lacks expected weather data.
+        requests.RequestException: For network-related issues and HTTP errors.
+    """
+    # Prepare parameters for the city
+    params = dict(params, latitude=city["latitude"], longitude=city["longitude"])
+
+    response = session.get(url, params=params, timeout=TIMEOUT)
+    response.raise_for_status()
+
+    daily_data = response.json().get('daily', {})
+    if not daily_data:
+        raise ValueError("Daily weather data not found in the response.")
+
+    daily_dataframe = pd.DataFrame(daily_data)
+    daily_dataframe["date"] = pd.to_datetime(daily_dataframe["time"])
+    daily_dataframe["city"] = city["city"]
+
+    return daily_dataframe
+
+
+def fetch_locations_concurrently(cities, params, session=None, max_workers=MAX_WORKERS, url=OPEN_METEO_URL):
+    """Requests the daily weather data of all locations in parallel with a bounded thread pool.
+
+    All requests share one session, so connections are kept alive and the configured retries 
+    and backoff apply to every location. Failing locations are skipped and reported.
+
+    Args:
+        cities (list): Locations with `city`, `latitude` and `longitude`.
+        params (dict): Request parameters without coordinates (see `daily_params`).
+        session (requests.Session, optional): Session to use. Defaults to `create_session()`.
+        max_workers (int): Maximum number of parallel requests.
+        url (str): Open-Meteo endpoint.
+
+    Returns:
+        tuple: 
+            - pd.DataFrame: Long-format daily weather data of all loaded locations (in the order of `cities`).
+            - dict: Error message per failed location (empty if all locations were loaded).
+    """
+    if session is None:
+        session = create_session()
+
+    frames = {}
+    failed = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(cities)))) as executor:
+        futures = {executor.submit(fetch_location, session, city, params, url): city for city in cities}
+        for future in as_completed(futures):
+            name = futures[future]["city"]
+            try:
+                frames[name] = future.result()
+            except requests.RequestException as e:
+                failed[name] = f"Network error - {e}"
+            except ValueError as e:
+                failed[name] = f"Data error - {e}"
+            except Exception as e:
+                failed[name] = str(e)
+
+    # keep the order of the cities list independent of the order the requests finished
+    ordered = [frames[city["city"]] for city in cities if city["city"] in frames]
+    weather_data = pd.concat(ordered, ignore_index=True) if ordered else pd.DataFrame()
+
+    return weather_data, failed
+
+
+def fetch_locations_batched(cities, params, session=None, url=OPEN_METEO_URL):
+    """Requests the daily weather data of all locations in one single API call.
+
+    Open-Meteo accepts comma-separated coordinate lists and answers with one result per location. 
+    The per-location arrays are concatenated column by column into one long-format DataFrame, 
+    so only one round trip and one DataFrame construction are needed.
+
+    Args:
+        cities (list): Locations with `city`, `latitude` and `longitude`.
+        params (dict): Request parameters without coordinates (see `daily_params`).
+        session (requests.Session, optional): Session to use. Defaults to `create_session()`.
+        url (str): Open-Meteo endpoint.
+
+    Returns:
+        tuple: 
+            - pd.DataFrame: Long-format daily weather data of all locations (in the order of `cities`).
+            - dict: Error message per failed location (all locations if the request failed).
+    """
+    if session is None:
+        session = create_session()
+
+    params = dict(
+        params,
+        latitude=",".join(str(city["latitude"]) for city in cities),
+        longitude=",".join(str(city["longitude"]) for city in cities)
+    )
+
+    try:
+        response = session.get(url, params=params, timeout=TIMEOUT)
+        response.raise_for_status()
+        results = response.json()
+        # a single location is answered with an object instead of a list
+        if isinstance(results, dict):
+            results = [results]
+        if len(results) != len(cities):
+            raise ValueError(f"Expected {len(cities)} locations in the response, got {len(results)}.")
+
+        daily = [result.get('daily', {}) for result in results]
+        if not all(daily):
+            raise ValueError("Daily weather data not found in the response.")
+    except requests.RequestException as e:
+        return pd.DataFrame(), {city["city"]: f"Network error - {e}" for city in cities}
+    except ValueError as e:
+        return pd.DataFrame(), {city["city"]: f"Data error - {e}" for city in cities}
+
+    # concatenate the arrays of all locations per column (time first, then the variables in request order)
+    columns = {'time': np.concatenate([np.asarray(location['time']) for location in daily])}
+    for variable in params["daily"]:
+        columns[variable] = np.concatenate([np.asarray(location[variable], dtype=float) for location in daily])
+
+    weather_data = pd.DataFrame(columns)
+    weather_data["date"] = pd.to_datetime(weather_data["time"])
+    weather_data["city"] = np.repeat([city["city"] for city in cities], [len(location['time']) for location in daily])
+
+    return weather_data, {}
+
+
+def fetch_locations_flatbuffers(cities, params, session=None, url=OPEN_METEO_URL):
+    """Requests the daily weather data of all locations in one call and decodes the FlatBuffers response.
+
+    Uses `openmeteo_requests.Client.weather_api`, which returns the values of every variable as 
+    a binary buffer. The buffers are copied straight into preallocated NumPy columns, so no JSON 
+    decoding and no Python float objects are involved. Values are kept as float32 like in the response.
+
+    Args:
+        cities (list): Locations with `city`, `latitude` and `longitude`.
+        params (dict): Request parameters without coordinates (see `daily_params`).
+        session (requests.Session, optional): Session to use. Defaults to `create_session()`.
+        url (str): Open-Meteo endpoint.
+
+    Returns:
+        tuple: 
+            - pd.DataFrame: Long-format daily weather data of all locations (in the order of `cities`).
+            - dict: Error message per failed location (all locations if the request failed).
+    """
+    if session is None:
+        session = create_session()
+    openmeteo = openmeteo_requests.Client(session=session)
+
+    params = dict(
+        params,
+        latitude=[city["latitude"] for city in cities],
+        longitude=[city["longitude"] for city in cities]
+    )
+
+    try:
+        responses = openmeteo.weather_api(url, params=params)
+        if len(responses) != len(cities):
+            raise ValueError(f"Expected {len(cities)} locations in the response, got {len(responses)}.")
+        weather_data = flatbuffers_to_frame(responses, cities, params["daily"])
+    except ValueError as e:
+        return pd.DataFrame(), {city["city"]: f"Data error - {e}" for city in cities}
+    except Exception as e:
+        return pd.DataFrame(), {city["city"]: str(e) for city in cities}
+
+    return weather_data, {}
+
+
+def flatbuffers_to_frame(responses, cities, variables):
+    """Converts decoded Open-Meteo FlatBuffers responses into a long-format DataFrame.
+
+    The float32 values of the responses are converted to the float64 values of the JSON responses.
+
+    Args:
+        responses (list): `WeatherApiResponse` objects, one per location.
+        cities (list): Locations with `city`, `latitude` and `longitude` (same order as `responses`).
+        variables (list): Requested daily variables (same order as in the request).
+
+    Returns:
+        pd.DataFrame: Daily weather data with `time`, the weather variables, `date` and `city`.
+
+    Raises:
+        ValueError: If a response lacks daily data or the expected variables.
+    """
+    dailies = [response.Daily() for response in responses]
+    if any(daily is None or daily.VariablesLength() != len(variables) for daily in dailies):
+        raise ValueError("Daily weather data not found in the response.")
+
+    # daily timestamps are local midnights given in UTC, shift them by the utc offset to get the local dates
+    dates = [
+        np.arange(
+            daily.Time() + response.UtcOffsetSeconds(),
+            daily.TimeEnd() + response.UtcOffsetSeconds(),
+            daily.Interval()
+        ).astype('datetime64[s]')
+        for response, daily in zip(responses, dailies)
+    ]
+    lengths = [len(location_dates) for location_dates in dates]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    # copy the value buffers of each location into one preallocated column per variable
+    columns = {'time': np.datetime_as_string(np.concatenate(dates), unit='D')}
+    for i, variable in enumerate(variables):
+        column = np.empty(offsets[-1], dtype=np.float32)
+        for j, daily in enumerate(dailies):
+            column[offsets[j]:offsets[j + 1]] = daily.Variables(i).ValuesAsNumpy()
+        # float64 with the shortest decimal of every float32 value (12.3 instead of 12.300000190734863),
+        # the values of the JSON responses, so all fetch modes give the same features
+        columns[variable] = column.astype(str).astype(np.float64)
+
+    weather_data = pd.DataFrame(columns)
+    weather_data["date"] = np.concatenate(dates).astype('datetime64[ns]')
+    weather_data["city"] = np.repeat([city["city"] for city in cities], lengths)
+
+    return weather_data
+
+
+def fetch_weather(params, cities, max_workers=MAX_WORKERS, mode='concurrent'):
+    """Requests the daily weather data of all locations with the chosen fetch mode.
+
+    Args:
+        params (dict): Request parameters without coordinates (see `daily_params` and `range_params`).
+        cities (list): Locations with `city`, `latitude` and `longitude`.
+        max_workers (int): Maximum number of parallel requests (only used for `mode='concurrent'`).
+        mode (str): `'concurrent'`, `'batched'` or `'flatbuffers'` (see `get_weather_forecast`).
+
+    Returns:
+        tuple: 
+            - pd.DataFrame: Long-format daily weather data of all loaded locations.
+            - dict: Error message per failed location.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode == 'concurrent':
+        return fetch_locations_concurrently(cities, params, max_workers=max_workers)
+    elif mode == 'batched':
+        return fetch_locations_batched(cities, params)
+    elif mode == 'flatbuffers':
+        return fetch_locations_flatbuffers(cities, params)
+    raise ValueError(f"Unknown mode '{mode}', expected 'concurrent', 'batched' or 'flatbuffers'.")
+
 
 # Function to fetch weather forecast data from OpenMeteo API
-def get_weather_forecast(days, past_days):
+def get_weather_forecast(days, past_days, cities=None, max_workers=MAX_WORKERS, mode='concurrent'):
     """Fetches daily weather forecasts for multiple cities and offshore locations from the Open-Meteo API.
 
     Retrieves temperature, wind, precipitation, and solar radiation data for a set of predefined cities.
     Supports both historical (`past_days`) and future (`days`) forecasts. Uses caching and retries to 
-    handle API failures.
+    handle API failures. Locations are either requested in parallel (`mode='concurrent'`) or all together 
+    in a single API call, either decoded from JSON (`mode='batched'`) or from the FlatBuffers 
+    format of the `openmeteo_requests` client (`mode='flatbuffers'`).
 
     Args:
         days (int): Number of future days to retrieve weather data for.
         past_days (int): Number of past days to retrieve historical weather data.
+        cities (list, optional): Locations to request. Defaults to `CITIES`.
+        max_workers (int): Maximum number of parallel requests (only used for `mode='concurrent'`).
+        mode (str): `'concurrent'` for one request per location, `'batched'` or `'flatbuffers'` for one request for all locations.
 
     Returns:
-        pd.DataFrame: Daily weather data with city names, dates, and meteorological variables.
+        pd.DataFrame: Daily weather data with city names, dates, and meteorological variables. 
+            Locations which could not be loaded are listed in `weather_data.attrs['failed_locations']`.
 
     Raises:
-        ValueError: If the response lacks expected weather data.
-        requests.RequestException: For network-related issues.
-        Exception: For unexpected errors during data retrieval.
+        ValueError: If no location could be loaded or the mode is unknown.
     """
+    if cities is None:
+        cities = CITIES
 
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-    openmeteo = openmeteo_requests.Client(session=retry_session)
-
-    # List of cities
-    cities = [
-        {"city": "Emden", "latitude": 53.367, "longitude": 7.207},
-        {"city": "Hamburg", "latitude": 53.551, "longitude": 9.993},
-        {"city": "Greifswald", "latitude": 54.093, "longitude": 13.387},
-        {"city": "Braunschweig", "latitude": 52.268, "longitude": 10.526},
-        {"city": "Köln", "latitude": 50.937, "longitude": 6.960},
-        {"city": "Kassel", "latitude": 51.316, "longitude": 9.498},
-        {"city": "Dresden", "latitude": 51.050, "longitude": 13.738},
-        {"city": "Freiburg", "latitude": 47.999, "longitude": 7.842},
-        {"city": "Würzburg", "latitude": 49.791, "longitude": 9.953},
-        {"city": "Augsburg", "latitude": 48.370, "longitude": 10.897},
-        {"city": "Passau", "latitude": 48.574, "longitude": 13.460},
-        {"city": "Albatros", "latitude": 54.433, "longitude": 6.317}, # Windfarm northsea
-        {"city": "Wikinger", "latitude": 54.834, "longitude": 14.068} # Windfarm baltic sea
-    ]
+    weather_data, failed = fetch_weather(daily_params(days, past_days), cities, max_workers, mode)
+
+    for city, error in failed.items():
+        print(f"Error loading data for city {city}: {error}")
+
+    if weather_data.empty:
+        raise ValueError("Weather forecast data could not be loaded for any location.")
 
-    # Initialize an empty DataFrame to collect all the data
-    df = pd.DataFrame()
-
-    # Iterate over each city and request weather data
-    for city in cities:
-        try:
-            # Prepare parameters for each city
-            params = {
-                "latitude": city["latitude"],
-                "longitude": city["longitude"],
-                "daily": [
-                    "temperature_2m_max", "temperature_2m_min", 
-                    "apparent_temperature_max", "apparent_temperature_min",
-                    "daylight_duration", "sunshine_duration", "precipitation_sum", 
-                    "precipitation_hours", "snowfall_sum",
-                    "wind_speed_10m_max", "wind_gusts_10m_max", "wind_direction_10m_dominant",
-                    "shortwave_radiation_sum"
-                ],
-                "timezone": "Europe/Berlin",
-                "forecast_days": days,
-                "past_days": past_days
-            }
-
-            # Make the API request for each city
-            response = requests.get("https://api.open-meteo.com/v1/forecast", params=params)
-            if response.status_code == 200:
-                data = response.json()
-                daily_data = data.get('daily', {})
-                if not daily_data:
-                    raise ValueError("Daily weather data not found in the response.")
-
-                daily_dataframe = pd.DataFrame(daily_data)
-                daily_dataframe["date"] = pd.to_datetime(daily_dataframe["time"])
-                daily_dataframe["city"] = city["city"]
-
-                # Append city data to the complete DataFrame
-                weather_data = pd.concat([df, daily_dataframe], ignore_index=True)
-            else:
-                print(f"Failed to load weather forecast data for city {city['city']}. HTTP status code: {response.status_code}")
-        except requests.RequestException as e:
-            print(f"Error loading data for city {city['city']}: Network error - {e}")
-        except ValueError as e:
-            print(f"Error loading data for city {city['city']}: Data error - {e}")
-        except Exception as e:
-            print(f"Error loading data for city {city['city']}: {e}")
+    weather_data.attrs['failed_locations'] = failed
 
     return weather_data
 
 
 
-# Function to determine if data needs to be updated
-def refresh_data_if_needed():
-    """Ensures that weather data is updated once per day.
+# Function to fetch only the weather data which is not stored locally yet
+def get_weather_forecast_incremental(days, past_days, store=None, cities=None, max_workers=MAX_WORKERS, mode='concurrent'):
+    """Fetches daily weather forecasts like `get_weather_forecast`, but only for dates missing in the local store.
 
-    Checks if new weather data needs to be fetched based on the current date. If an 
-    update is required, it retrieves new data using `get_weather_forecast` and updates 
-    Streamlit's session state.
+    Past days which were already fetched after they were over are read from the `WeatherStore`, 
+    forecast days are fetched again once per day. Only the date range which covers the missing or 
+    stale dates is requested, the response is merged into the store and the complete window is read back.
 
-    Modifies:
-        - `st.session_state.weather_data`: Stores the latest weather data.
-        - `st.session_state.last_fetch_date`: Stores the last data retrieval date.
+    Args:
+        days (int): Number of future days to retrieve weather data for.
+        past_days (int): Number of past days to retrieve historical weather data.
+        store (WeatherStore, optional): Local weather store. Defaults to `WeatherStore()`.
+        cities (list, optional): Locations to request. Defaults to `CITIES`.
+        max_workers (int): Maximum number of parallel requests (only used for `mode='concurrent'`).
+        mode (str): Fetch mode (see `get_weather_forecast`).
+
+    Returns:
+        pd.DataFrame: Daily weather data with city names, dates, and meteorological variables. 
+            Locations which could not be loaded are listed in `weather_data.attrs['failed_locations']`.
+
+    Raises:
+        ValueError: If the missing dates could not be loaded for any location.
     """
-    
-    current_date = datetime.datetime.now().date()
-
-    # Check if 'last_fetch_date' is in session_state
-    if 'last_fetch_date' not in st.session_state or st.session_state.last_fetch_date != current_date:
-        # If date has changed or data not fetched yet, load new data
-        # standard setting is to get 7 predicted and 3 past days
-        st.session_state.weather_data = get_weather_forecast(7,3)
-        st.session_state.last_fetch_date = current_date
+    if store is None:
+        store = WeatherStore()
+    if cities is None:
+        cities = CITIES
+
+    # dates of the requested time zone, not of the server
+    today = local_today()
+    start_date = today - datetime.timedelta(days=past_days)
+    end_date = today + datetime.timedelta(days=days - 1)
+    dates = [start_date + datetime.timedelta(days=i) for i in range(past_days + days)]
+    names = [city["city"] for city in cities]
+
+    failed = {}
+    missing = store.missing_dates(names, dates, DAILY_VARIABLES, today)
+    if missing:
+        # request one contiguous range covering all missing dates
+        fetched, failed = fetch_weather(range_params(missing[0], missing[-1]), cities, max_workers, mode)
+
+        for city, error in failed.items():
+            print(f"Error loading data for city {city}: {error}")
+
+        if fetched.empty:
+            raise ValueError("Weather forecast data could not be loaded for any location.")
+
+        store.write(fetched, DAILY_VARIABLES, today)
+
+    weather_data = store.read(names, start_date, end_date, DAILY_VARIABLES)
+    weather_data.attrs['failed_locations'] = failed
+
+    return weather_data
@@ -0,0 +1,8 @@
+## precomputed plot colors, so the plots don't need matplotlib at runtime
+
+from bokeh.colors import RGB
+
+
+# matplotlib 'cividis' colormap at 0.2 (blueish tone) and 0.8 (yellowish tone), converted with int(value * 255)
+WIND_COLOR = RGB(53, 69, 108)
+SOLAR_COLOR = RGB(200, 183, 101)
@@ -0,0 +1,163 @@
+## forecast pipeline and versioned result snapshots
+
+# load packages
+import os
+import pickle
+import datetime
+import threading
+import uuid
+import pandas as pd
+
+# functions
+from modules.openMeteo_API import get_weather_forecast_incremental
+from modules.feature_transform import weather_cube
+from modules.scenarios import perturbed_scenarios, predict_scenarios
+from modules.model_registry import TARGET_COLUMNS, current_bundle
+from modules.geopredictions import contribution_table
+from modules.offshore import create_offshore_dataframe
+from modules.geometry import GEOJSON_PATH, MAP_ZOOM, load_geometries
+from modules.weather_store import local_today
+
+
+# folder of the result snapshots and the file pointing to the latest one
+SNAPSHOT_DIR = 'data/snapshots'
+LATEST_FILE = 'LATEST'
+# number of snapshots kept on disk
+KEEP_SNAPSHOTS = 5
+
+# latest snapshot loaded by this process (version, snapshot)
+_loaded = (None, None)
+_loaded_lock = threading.Lock()
+
+
+def run_pipeline(days=7, past_days=3, geojson_path=GEOJSON_PATH, offshore_farms=None):
+    """Runs the complete forecast chain from the weather data to the regional contributions.
+
+    This function:
+    - Fetches the weather data (only missing dates, see `get_weather_forecast_incremental`).
+    - Preprocesses and scales the weather data and predicts wind and solar electricity with the
+      current scaler + model bundle of the registry (see model_registry.py).
+    - Predicts quantiles of perturbed weather scenarios (see scenarios.py).
+    - Distributes the predictions to the federal states and offshore regions.
+
+    Args:
+        days (int): Number of future days to predict.
+        past_days (int): Number of past days to predict.
+        geojson_path (str): GeoJSON with the nominal installed capacity per federal state.
+        offshore_farms (pd.DataFrame, optional): Offshore wind farms (see `create_offshore_dataframe`). 
+            Defaults to North Sea and Baltic Sea.
+
+    Returns:
+        dict: Pipeline results (`weather_data`, `prep`, `predictions_df`, `scenario_quantiles`, the federal state geometries `gdf`, 
+              their simplified version for the maps `map_gdf`, their `contributions` and `df_offshore`), 
+              the `issue_date` of the run and the `model_version`.
+    """
+    weather_data = get_weather_forecast_incremental(days, past_days)
+
+    # scaler and model of the same bundle, even if a new version is published meanwhile
+    bundle = current_bundle()
+    # daily features + scaling in one pass over the (cities x days x variables) cube
+    transform = bundle.feature_transform
+    cube, _, dates = weather_cube(weather_data, transform.variables)
+    features = transform.features(cube)
+    prep = pd.DataFrame(features, columns=transform.col_order, index=dates)
+    prep_data = pd.DataFrame(transform.scale_features(features.copy()), columns=transform.col_order, index=dates)
+    predictions = bundle.predict(prep_data)
+    predictions_df = pd.DataFrame(predictions, columns=bundle.target_columns, index=prep_data.index)
+    # uncertainty bands from perturbed wind and radiation forecasts (see scenarios.py)
+    scenario_quantiles = predict_scenarios(perturbed_scenarios(cube, variables=transform.variables), dates, bundle)
+
+    gdf = load_geometries(geojson_path)
+    map_gdf = load_geometries(geojson_path, zoom=MAP_ZOOM)
+    contributions = contribution_table(gdf, predictions_df)
+    df_offshore = create_offshore_dataframe(predictions_df, offshore_farms)
+
+    return {
+        'issue_date': local_today(),
+        'model_version': bundle.version,
+        'weather_data': weather_data,
+        'prep': prep,
+        'predictions_df': predictions_df,
+        'scenario_quantiles': scenario_quantiles,
+        'gdf': gdf,
+        'map_gdf': map_gdf,
+        'contributions': contributions,
+        'df_offshore': df_offshore,
+    }
+
+
+def write_snapshot(result, snapshot_dir=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS):
+    """Writes pipeline results as a new snapshot version and atomically points `LATEST` to it.
+
+    The snapshot and the pointer are first written to temporary files and then moved into place
+    with `os.replace`, so readers either see the previous or the new version, never a partial file.
+
+    Args:
+        result (dict): Pipeline results (see `run_pipeline`).
+        snapshot_dir (str): Folder of the snapshots.
+        keep (int): Number of snapshot versions kept on disk.
+
+    Returns:
+        str: Version of the written snapshot.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    result = dict(result, version=version)
+
+    # unique temporary names, the scheduler and the batch CLI may write at the same time
+    path = os.path.join(snapshot_dir, f'snapshot_{version}.pkl')
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    latest = os.path.join(snapshot_dir, LATEST_FILE)
+    tmp_latest = f'{latest}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_latest, 'w') as f:
+        f.write(version)
+    os.replace(tmp_latest, latest)
+
+    # remove old versions (the names sort by creation time)
+    snapshots = sorted(name for name in os.listdir(snapshot_dir) if name.startswith('snapshot_') and name.endswith('.pkl'))
+    for name in snapshots[:-keep]:
+        os.remove(os.path.join(snapshot_dir, name))
+
+    return version
+
+
+def load_latest_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Loads the latest snapshot. It is unpickled only once per version and process.
+
+    Args:
+        snapshot_dir (str): Folder of the snapshots.
+
+    Returns:
+        dict or None: Pipeline results of the latest snapshot with its `version`, None if no snapshot exists.
+    """
+    global _loaded
+
+    try:
+        with open(os.path.join(snapshot_dir, LATEST_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    with _loaded_lock:
+        if _loaded[0] != version:
+            with open(os.path.join(snapshot_dir, f'snapshot_{version}.pkl'), 'rb') as f:
+                _loaded = (version, pickle.load(f))
+        return _loaded[1]
+
+
+def refresh_snapshot(snapshot_dir=SNAPSHOT_DIR, **kwargs):
+    """Runs the pipeline and publishes the results as the latest snapshot.
+
+    Args:
+        snapshot_dir (str): Folder of the snapshots.
+        **kwargs: Arguments passed to `run_pipeline`.
+
+    Returns:
+        dict: The newly published snapshot.
+    """
+    write_snapshot(run_pipeline(**kwargs), snapshot_dir)
+    return load_latest_snapshot(snapshot_dir)
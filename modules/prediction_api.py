@@ -0,0 +1,375 @@
+## lightweight HTTP prediction service with a warm-loaded model
+#
+# usage: python -m modules.prediction_api --port 8000
+#
+# GET  /predictions                    national wind and solar predictions of the current forecast
+# GET  /federal-states[?state=Bayern]  contributions per federal state (see contribution_table in geopredictions.py)
+# GET  /offshore[?region=north_sea]    offshore contributions (see offshore.py)
+# GET  /model                          version, features and targets of the current model bundle (see model_registry.py)
+# POST /predict                        predictions for own weather features
+#      {"features": [{"temperature_2m_max": ..., ...}, ...], "scaled": false}
+
+# load packages
+import json
+import queue
+import time
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# functions
+from modules.model_registry import ModelRegistry
+from modules.pipeline import load_latest_snapshot, run_pipeline
+from modules.offshore import farm_names
+from modules.shared_cache import DailyCache
+from modules.weather_store import local_today
+
+
+class MicroBatcher:
+    """Collects concurrent prediction requests and runs them as one `predict` call.
+
+    The worker thread takes the first waiting request, waits up to `max_wait` seconds for more
+    requests (up to `max_rows` feature rows in total), predicts all rows at once and hands every
+    request its slice of the result. After `stop()` the queued requests are finished, the worker
+    ends and later requests are predicted in the calling thread.
+
+    Args:
+        model (object): Trained model with a `predict` method.
+        max_wait (float): Maximum time in seconds a request waits for others to join its batch.
+        max_rows (int): Maximum number of feature rows per `predict` call.
+    """
+    def __init__(self, model, max_wait=0.002, max_rows=4096):
+        self.model = model
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, features):
+        """Queues a feature array for prediction.
+
+        Args:
+            features (np.ndarray): Scaled features with shape (rows, features).
+
+        Returns:
+            concurrent.futures.Future: Resolves to the predictions with shape (rows, targets).
+        """
+        future = Future()
+        with self._stop_lock:
+            if not self._stopped:
+                self._queue.put((features, future))
+                return future
+
+        try:
+            future.set_result(self.model.predict(features))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def predict(self, features):
+        """Predicts a feature array through the batcher and waits for the result."""
+        return self.submit(features).result()
+
+    def stop(self):
+        """Ends the worker thread after the queued requests."""
+        with self._stop_lock:
+            if not self._stopped:
+                self._stopped = True
+                # marks the end of the queue
+                self._queue.put(None)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            rows = len(batch[0][0])
+            # monotonic clock, the wall clock may jump
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            try:
+                predictions = self.model.predict(np.vstack([features for features, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for features, future in batch:
+                future.set_result(predictions[start:start + len(features)])
+                start += len(features)
+
+
+class PredictionService:
+    """Holds the warm model bundle and today's forecast of the HTTP service.
+
+    The current model bundle of the registry (see model_registry.py) is loaded at startup. When a
+    new version is published, it is loaded in the background of the next request and swapped in,
+    requests which already started finish with the previous bundle, the batcher of the previous
+    bundle is stopped afterwards. The forecast is taken from today's latest snapshot of the scheduler
+    (see scheduler.py) if it was made with the current model version, otherwise it is computed once
+    per model version. The JSON responses are cached per model version and snapshot, so repeated
+    GET requests only cost a dictionary lookup.
+
+    Args:
+        max_wait (float): Maximum batching delay of POST /predict in seconds (see `MicroBatcher`).
+        engine (str): 'compiled' for the flat-array model (see fast_inference.py), 'sklearn' or 'auto'
+            to choose one of them per batch by its size (see `ModelBundle.predict`).
+    """
+    def __init__(self, max_wait=0.002, engine='auto'):
+        self.max_wait = max_wait
+        self.engine = engine
+        self.cache = DailyCache()
+        self._forecast_key = None
+        # one batcher per model version, so a batch never mixes two models
+        self._batchers = {}
+        self._batchers_lock = threading.Lock()
+        # new versions are warmed up before they are swapped in
+        self.registry = ModelRegistry(warm=self.batcher)
+        self.registry.current()
+
+    def batcher(self, bundle):
+        """Returns the `MicroBatcher` of a bundle, scaler and model are loaded when it is created."""
+        with self._batchers_lock:
+            batcher = self._batchers.get(bundle.version)
+        if batcher is None:
+            if self.engine == 'auto':
+                # the bundle chooses the engine per batch, both models are loaded up front
+                bundle.compiles()
+                bundle.model
+                model = bundle
+            else:
+                model = bundle.compiled if self.engine == 'compiled' else bundle.model
+            # load the scaler as well
+            bundle.scaler
+            with self._batchers_lock:
+                if bundle.version not in self._batchers:
+                    self._batchers[bundle.version] = MicroBatcher(model, max_wait=self.max_wait)
+                batcher = self._batchers[bundle.version]
+        return batcher
+
+    def retire_batchers(self, version):
+        """Stops and drops the batchers of all versions except `version` (replaced bundles)."""
+        with self._batchers_lock:
+            replaced = [v for v in self._batchers if v != version]
+            batchers = [self._batchers.pop(v) for v in replaced]
+        for batcher in batchers:
+            batcher.stop()
+
+    def model_info(self):
+        bundle = self.registry.current()
+        return {
+            'version': bundle.version,
+            'sha256': bundle.sha256,
+            'col_order': bundle.col_order,
+            'target_columns': bundle.target_columns,
+            'engine': self.engine,
+        }
+
+    def forecast(self):
+        """Returns today's pipeline results and their cache key.
+
+        Returns:
+            tuple: Pipeline results (latest snapshot or own run) and the key (model version, snapshot version),
+                   the snapshot version is None for an own run.
+        """
+        bundle = self.registry.current()
+        snapshot = load_latest_snapshot()
+        if (snapshot is not None and snapshot['issue_date'] == local_today()
+                and snapshot.get('model_version') == bundle.version):
+            key = (bundle.version, snapshot['version'])
+        else:
+            key = (bundle.version, None)
+
+        if key != self._forecast_key:
+            # drop the responses (and the own run) of the replaced forecast, every cache key ends with its forecast key
+            self._forecast_key = key
+            self.cache.retain(lambda cache_key: cache_key[-1] == key)
+        if key[1] is not None:
+            return snapshot, key
+        return self.cache.get_or_compute(('forecast', key), run_pipeline), key
+
+    def national(self, forecast):
+        predictions_df = forecast['predictions_df']
+        return [
+            {'date': date.strftime('%Y-%m-%d'), **{target: float(row[target]) for target in predictions_df.columns}}
+            for date, row in predictions_df.iterrows()
+        ]
+
+    def federal_states(self, forecast, state=None):
+        contributions = forecast['contributions']
+        if state is not None:
+            # unknown states return an empty list
+            contributions = contributions[contributions.index.get_level_values(0) == state]
+
+        return [
+            {'state': str(region), 'date': date.strftime('%Y-%m-%d'), 'windpower': float(wind), 'solar_pv': float(solar)}
+            for (region, date), wind, solar in zip(contributions.index, contributions['windpower'], contributions['solar_pv'])
+        ]
+
+    def offshore(self, forecast, region=None):
+        df_offshore = forecast['df_offshore']
+        names = farm_names(df_offshore)
+        if region is not None:
+            df_offshore = df_offshore[df_offshore['region'] == region]
+
+        return [
+            {
+                'region': row['region'],
+                'name': names[row['region']],
+                'date': pd.to_datetime(row['date'], format='%d/%m/%y').strftime('%Y-%m-%d'),
+                'windpower': float(row['calculated_windpower']),
+                'solar_pv': float(row['calculated_solarpower']),
+            }
+            for _, row in df_offshore.iterrows()
+        ]
+
+    def cached_response(self, path, query):
+        """Returns the encoded JSON body of a GET endpoint (computed once per forecast and query).
+
+        Query parameters which the endpoint does not accept are ignored, so they do not create cache entries.
+        """
+        # path: (response function, accepted query parameters)
+        endpoints = {
+            '/predictions': (lambda forecast, params: self.national(forecast), ()),
+            '/federal-states': (lambda forecast, params: self.federal_states(forecast, params.get('state')), ('state',)),
+            '/offshore': (lambda forecast, params: self.offshore(forecast, params.get('region')), ('region',)),
+        }
+        if path not in endpoints:
+            return None
+        response, accepted = endpoints[path]
+        params = {name: query[name] for name in accepted if name in query}
+
+        forecast, forecast_key = self.forecast()
+        key = (path, tuple(sorted(params.items())), forecast_key)
+        return self.cache.get_or_compute(key, lambda: json.dumps(response(forecast, params)).encode('utf-8'))
+
+    def predict(self, payload):
+        """Predicts wind and solar electricity for the weather features of a POST /predict request.
+
+        Args:
+            payload (dict): `features` as list of dicts (keys of the model's `col_order`) or list of lists
+                            (values in the order of `col_order`), `scaled` if they are already scaled.
+
+        Returns:
+            list: One dict with the predicted targets per feature row.
+
+        Raises:
+            ValueError: If the features are missing or have the wrong shape.
+        """
+        # the whole request uses one bundle, even if a new version is swapped in meanwhile
+        bundle = self.registry.current()
+        col_order = bundle.col_order
+
+        rows = payload.get('features')
+        if not rows:
+            raise ValueError("'features' is missing or empty.")
+        if isinstance(rows[0], dict):
+            rows = [[row[column] for column in col_order] for row in rows]
+
+        features = np.asarray(rows, dtype=float)
+        if features.ndim != 2 or features.shape[1] != len(col_order):
+            raise ValueError(f"Expected {len(col_order)} features per row in the order {col_order}.")
+        if not payload.get('scaled', False):
+            features = bundle.scaler.transform(pd.DataFrame(features, columns=col_order))
+
+        predictions = self.batcher(bundle).predict(features)
+        if bundle is self.registry.current():
+            self.retire_batchers(bundle.version)
+        return [dict(zip(bundle.target_columns, map(float, row))) for row in predictions]
+
+
+def make_handler(service):
+    """Creates the request handler class bound to a `PredictionService`."""
+
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status, message):
+            self._send(status, json.dumps({'error': message}).encode('utf-8'))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path.rstrip('/') == '/model':
+                    body = json.dumps(service.model_info()).encode('utf-8')
+                else:
+                    body = service.cached_response(url.path.rstrip('/'), query)
+            except Exception as e:
+                self._send_error(500, str(e))
+                return
+            if body is None:
+                self._send_error(404, f"Unknown endpoint {url.path}")
+            else:
+                self._send(200, body)
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip('/') != '/predict':
+                self._send_error(404, f"Unknown endpoint {self.path}")
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                result = service.predict(payload)
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_error(400, str(e))
+                return
+            except Exception as e:
+                self._send_error(500, str(e))
+                return
+            self._send(200, json.dumps(result).encode('utf-8'))
+
+        def log_message(self, format, *args):
+            # keep the console quiet, errors are returned to the client
+            pass
+
+    return PredictionHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP service for wind and solar electricity predictions.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    parser.add_argument('--max-wait', type=float, default=0.002, help='maximum batching delay of POST /predict in seconds')
+    parser.add_argument('--engine', choices=['auto', 'compiled', 'sklearn'], default='auto', help="inference engine of POST /predict, 'auto' chooses it by the batch size")
+    args = parser.parse_args()
+
+    service = PredictionService(max_wait=args.max_wait, engine=args.engine)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving predictions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
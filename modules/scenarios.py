@@ -0,0 +1,127 @@
+## scenario (ensemble) predictions with quantile bands
+#
+# Many weather scenarios (perturbed forecasts or ensemble members) are stacked into one
+# (scenarios x cities x days x variables) array. The features (see feature_transform.py), the
+# scaling and the prediction run once over the whole batch, the quantiles of the scenario
+# predictions give the uncertainty bands per day and target.
+
+# load packages
+import numpy as np
+import pandas as pd
+
+# functions
+from modules.openMeteo_API import DAILY_VARIABLES
+from modules.feature_transform import weather_cube
+from modules.model_registry import current_bundle
+
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# perturbation: daily variables scaled by the same factor (1 + relative error)
+PERTURBATIONS = {
+    'wind': ['wind_speed_10m_max', 'wind_gusts_10m_max'],
+    'radiation': ['shortwave_radiation_sum', 'sunshine_duration'],
+}
+# standard deviation of the relative error per perturbation
+SPREAD = {'wind': 0.15, 'radiation': 0.15}
+N_SCENARIOS = 200
+
+
+def quantile_column(target, quantile):
+    """Returns the column name of a quantile, e.g. 'windpower_p05' for the 5 % quantile of windpower."""
+    return f'{target}_p{round(quantile * 100):02d}'
+
+
+def perturbed_scenarios(cube, n_scenarios=N_SCENARIOS, spread=SPREAD, variables=DAILY_VARIABLES, seed=0):
+    """Creates weather scenarios by scaling the wind and radiation variables of a forecast.
+
+    Every scenario draws one relative error per day and perturbation (normal distribution with the
+    given standard deviation), which is applied to all cities, because forecast errors are mostly
+    large-scale. Scaled values stay non-negative and the sunshine duration stays within the
+    daylight duration.
+
+    Args:
+        cube (np.ndarray): Forecast with shape (cities, days, variables) (see `weather_cube`).
+        n_scenarios (int): Number of scenarios.
+        spread (dict): Standard deviation of the relative error per perturbation of `PERTURBATIONS`.
+        variables (list): Daily variables of the cube (last axis).
+        seed (int, optional): Seed of the random numbers.
+
+    Returns:
+        np.ndarray: Scenarios with shape (scenarios, cities, days, variables).
+
+    Raises:
+        ValueError: If a perturbation is unknown.
+    """
+    unknown = set(spread) - set(PERTURBATIONS)
+    if unknown:
+        raise ValueError(f"Unknown perturbations {sorted(unknown)}, expected {list(PERTURBATIONS)}.")
+
+    rng = np.random.default_rng(seed)
+    index = {name: i for i, name in enumerate(variables)}
+    scenarios = np.repeat(cube[np.newaxis], n_scenarios, axis=0)
+    for perturbation, sigma in spread.items():
+        # one factor per scenario and day, shared by all cities
+        factor = np.clip(1 + sigma * rng.standard_normal((n_scenarios, 1, cube.shape[1])), 0, None).astype(cube.dtype)
+        for name in PERTURBATIONS[perturbation]:
+            if name in index:
+                scenarios[..., index[name]] *= factor
+
+    if 'sunshine_duration' in index and 'daylight_duration' in index:
+        np.minimum(scenarios[..., index['sunshine_duration']], scenarios[..., index['daylight_duration']],
+                   out=scenarios[..., index['sunshine_duration']])
+    return scenarios
+
+
+def member_scenarios(members, variables=DAILY_VARIABLES):
+    """Stacks the weather data of ensemble members into one scenario array.
+
+    Args:
+        members (list): Weather data per member with one row per city and date (see `get_weather_forecast`).
+        variables (list): Daily variables in the order of the last axis.
+
+    Returns:
+        tuple: Scenarios with shape (members, cities, days, variables) and the dates.
+
+    Raises:
+        ValueError: If the members do not have the same cities and dates.
+    """
+    cubes, reference = [], None
+    for member in members:
+        cube, cities, dates = weather_cube(member, variables)
+        if reference is None:
+            reference = (cities, dates)
+        elif cities != reference[0] or not dates.equals(reference[1]):
+            raise ValueError("All ensemble members must have the same cities and dates.")
+        cubes.append(cube)
+    return np.stack(cubes), reference[1]
+
+
+def predict_scenarios(scenarios, dates, bundle=None, quantiles=QUANTILES, engine='auto'):
+    """Predicts all scenarios in one batch and returns the quantiles per day and target.
+
+    Args:
+        scenarios (np.ndarray): Weather scenarios with shape (scenarios, cities, days, variables).
+        dates (pd.DatetimeIndex): Dates of the days axis.
+        bundle (ModelBundle, optional): Scaler and model (see model_registry.py), defaults to the current bundle.
+        quantiles (tuple): Quantiles between 0 and 1.
+        engine (str): Prediction engine of the bundle (see `ModelBundle.predict`), 'auto' chooses it by the batch size.
+
+    Returns:
+        pd.DataFrame: Quantiles indexed by date, one column per target (and the `total_renewable` sum) and
+                      quantile (see `quantile_column`).
+    """
+    bundle = current_bundle() if bundle is None else bundle
+    transform = bundle.feature_transform
+    features = transform.transform(scenarios)
+    n_scenarios, n_days, n_features = features.shape
+
+    predictions = bundle.predict(features.reshape(-1, n_features), engine=engine).reshape(n_scenarios, n_days, -1)
+    # quantiles of the sum per scenario, not the sum of the quantiles
+    targets = list(bundle.target_columns) + ['total_renewable']
+    predictions = np.concatenate([predictions, predictions.sum(axis=2, keepdims=True)], axis=2)
+
+    values = np.quantile(predictions, quantiles, axis=0)
+    return pd.DataFrame(
+        {quantile_column(target, q): values[i, :, j] for j, target in enumerate(targets) for i, q in enumerate(quantiles)},
+        index=pd.DatetimeIndex(dates, name='date')
+    )
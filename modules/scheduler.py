@@ -0,0 +1,130 @@
+## background scheduler which pre-warms the forecast pipeline
+#
+# run standalone:   python -m modules.scheduler --times 00:05 06:05 12:05 18:05
+# run once (cron):  python -m modules.scheduler --once
+
+# load packages
+import argparse
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+# functions
+from modules.pipeline import SNAPSHOT_DIR, load_latest_snapshot, refresh_snapshot
+from modules.weather_store import TIMEZONE, local_today
+
+
+# standard refresh times in Europe/Berlin (shortly after midnight and whenever new forecast runs are available)
+REFRESH_TIMES = ('00:05', '06:05', '12:05', '18:05')
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def next_run(times, now=None):
+    """Returns the next point in time of a daily schedule.
+
+    Args:
+        times (iterable): Daily refresh times as 'HH:MM' strings.
+        now (datetime.datetime, optional): Reference time. Defaults to the current time in Europe/Berlin.
+
+    Returns:
+        datetime.datetime: The next scheduled refresh after `now`.
+    """
+    if now is None:
+        now = datetime.datetime.now(ZoneInfo(TIMEZONE))
+
+    candidates = []
+    for time in times:
+        hour, minute = map(int, time.split(':'))
+        run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run <= now:
+            run += datetime.timedelta(days=1)
+        candidates.append(run)
+
+    return min(candidates)
+
+
+class ForecastScheduler(threading.Thread):
+    """Daemon thread which runs the forecast pipeline on a daily schedule and publishes snapshots.
+
+    On start the pipeline runs immediately if there is no snapshot from today. Afterwards it
+    runs at every refresh time. Errors are printed and the previous snapshot stays in place.
+
+    Args:
+        times (iterable): Daily refresh times as 'HH:MM' strings (Europe/Berlin).
+        snapshot_dir (str): Folder of the snapshots.
+        **kwargs: Arguments passed to `run_pipeline` (e.g. `days`, `past_days`).
+    """
+    def __init__(self, times=REFRESH_TIMES, snapshot_dir=SNAPSHOT_DIR, **kwargs):
+        super(ForecastScheduler, self).__init__(name='forecast-scheduler', daemon=True)
+        self.times = times
+        self.snapshot_dir = snapshot_dir
+        self.pipeline_kwargs = kwargs
+        self._stop_event = threading.Event()
+        # set once the startup check (and refresh if needed) is done
+        self.ready = threading.Event()
+
+    def refresh(self):
+        """Runs the pipeline once and publishes the snapshot, errors are printed."""
+        try:
+            snapshot = refresh_snapshot(self.snapshot_dir, **self.pipeline_kwargs)
+            print(f"Forecast snapshot {snapshot['version']} published.")
+        except Exception as e:
+            print(f"Error refreshing the forecast snapshot: {e}")
+
+    def run(self):
+        snapshot = load_latest_snapshot(self.snapshot_dir)
+        if snapshot is None or snapshot['issue_date'] != local_today():
+            self.refresh()
+        self.ready.set()
+
+        while not self._stop_event.is_set():
+            # timestamps, the difference of two local times is off by an hour across a DST change
+            wait = next_run(self.times).timestamp() - datetime.datetime.now().timestamp()
+            if self._stop_event.wait(max(wait, 0)):
+                break
+            self.refresh()
+
+    def stop(self):
+        """Stops the scheduler after the current run."""
+        self._stop_event.set()
+
+
+def start_background_scheduler(**kwargs):
+    """Starts one `ForecastScheduler` per process (further calls return the running one).
+
+    Args:
+        **kwargs: Arguments passed to `ForecastScheduler`.
+
+    Returns:
+        ForecastScheduler: The running scheduler.
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = ForecastScheduler(**kwargs)
+            _scheduler.start()
+        return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-compute the wind and solar forecast snapshot for the dashboard.')
+    parser.add_argument('--times', nargs='+', default=list(REFRESH_TIMES), help="daily refresh times as 'HH:MM' (Europe/Berlin)")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR, help='folder of the snapshots')
+    parser.add_argument('--days', type=int, default=7, help='number of forecast days')
+    parser.add_argument('--past-days', type=int, default=3, help='number of past days')
+    parser.add_argument('--once', action='store_true', help='refresh the snapshot once and exit')
+    args = parser.parse_args()
+
+    scheduler = ForecastScheduler(args.times, args.snapshot_dir, days=args.days, past_days=args.past_days)
+    if args.once:
+        scheduler.refresh()
+    else:
+        # run in the foreground
+        scheduler.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+## process-wide daily cache shared by all threads (e.g. the requests of prediction_api.py)
+
+# load packages
+import threading
+
+# functions
+from modules.weather_store import local_today
+
+
+class DailyCache:
+    """Thread-safe in-memory cache whose entries expire at the next day boundary.
+
+    The request threads of the prediction service (see prediction_api.py) run in the same
+    process, so one instance of this class lets them share a response instead of computing it
+    once per request. Computations are single-flight: if several threads ask for the same missing
+    key at the same time, only the first one computes the value and the others wait for its
+    result. The lock of a key is kept while threads wait for it and dropped by the last one.
+
+    Cached values are shared between threads and must not be modified in place.
+    """
+    def __init__(self):
+        self._entries = {}
+        # [lock, number of threads holding or waiting for it] per key
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute, today=None):
+        """Returns the cached value of `key` for today or computes and stores it.
+
+        Args:
+            key (hashable): Cache key.
+            compute (callable): Function without arguments which creates the value.
+            today (datetime.date, optional): Current day. Defaults to the current date in Europe/Berlin (see weather_store.py).
+
+        Returns:
+            object: The cached or newly computed value.
+        """
+        if today is None:
+            today = local_today()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == today:
+            return entry[1]
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+
+        try:
+            with key_lock[0]:
+                # another thread might have computed the value while this one was waiting
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == today:
+                    return entry[1]
+
+                value = compute()
+
+                with self._lock:
+                    # drop the entries of previous days
+                    self._entries = {k: v for k, v in self._entries.items() if v[0] == today}
+                    self._entries[key] = (today, value)
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[key]
+
+        return value
+
+    def retain(self, keep):
+        """Removes all cached values whose key does not satisfy `keep(key)`."""
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if keep(k)}
+
+    def clear(self):
+        """Removes all cached values."""
+        with self._lock:
+            self._entries = {}
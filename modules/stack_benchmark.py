@@ -0,0 +1,134 @@
+## benchmark of the per-target stack against the native multi-output stack
+#
+# usage: python -m modules.stack_benchmark [--n-jobs 1] [--multi-strategy one_output_per_tree] [--repeat 50]
+#
+# The hyperparameters of the base models are taken from the current model of the registry. Both
+# variants are trained on the training split of the notebook and compared with the current model
+# by training wall time, inference latency (sklearn and compiled, one row and the test set), model
+# file size (pickle and flat arrays) and R² on the test split.
+
+# load packages
+import io
+import time
+import argparse
+import joblib
+import numpy as np
+from tabulate import tabulate
+from sklearn.base import clone
+from sklearn.ensemble import StackingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.preprocessing import RobustScaler
+from sklearn.metrics import r2_score
+
+# functions
+from modules.fast_inference import export_stack, compile_model
+from modules.model_registry import TARGET_COLUMNS, current_bundle
+from modules.native_stack import MultiOutputStack
+from modules.train import DATA_PATH, NATIVE_MULTI_STRATEGY, RIDGE_ALPHA, load_training_data
+
+
+def base_models_of(model):
+    """Returns unfitted copies of the base models of a stacked model as (name, estimator) list."""
+    stack = model.estimators_[0] if isinstance(model, MultiOutputRegressor) else model
+    return [(name, clone(estimator)) for name, estimator in stack.named_estimators_.items() if estimator != 'drop']
+
+
+def latency(predict, X, repeat):
+    """Returns the median time of `predict(X)` in seconds."""
+    predict(X)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(X)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def measure(name, model, X_test, y_test, train_s=None, repeat=50):
+    """Measures latency, size and test R² of a fitted model.
+
+    Returns:
+        dict: Result row of the benchmark.
+    """
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    arrays, _ = export_stack(model)
+    compiled = compile_model(model)
+    prediction = model.predict(X_test)
+
+    result = {
+        'model': name,
+        'train_s': train_s,
+        'sklearn_1_row_ms': 1000 * latency(model.predict, X_test[:1], repeat),
+        'sklearn_test_ms': 1000 * latency(model.predict, X_test, max(1, repeat // 10)),
+        'compiled_1_row_ms': 1000 * latency(compiled.predict, X_test[:1], repeat),
+        'compiled_test_ms': 1000 * latency(compiled.predict, X_test, max(1, repeat // 10)),
+        'pickle_mb': buffer.getbuffer().nbytes / 1e6,
+        'arrays_mb': sum(array.nbytes for array in arrays.values()) / 1e6,
+        'r2_test': r2_score(y_test, prediction),
+    }
+    for i, target in enumerate(TARGET_COLUMNS):
+        result[f'r2_{target}'] = r2_score(y_test[:, i], prediction[:, i])
+    return result
+
+
+def run_benchmark(data_path=DATA_PATH, n_jobs=1, multi_strategy=NATIVE_MULTI_STRATEGY, repeat=50):
+    """Trains both stack variants with the hyperparameters of the current model and measures them.
+
+    Args:
+        data_path (str): CSV with the features and targets.
+        n_jobs (int): Parallel base model fits of both variants (every base model uses one core).
+        multi_strategy (str): xgboost `multi_strategy` of the native variant.
+        repeat (int): Repetitions of the latency measurements.
+
+    Returns:
+        list: Result rows of the current, the per-target and the native model (see `measure`).
+    """
+    X_train, X_test, y_train, y_test = load_training_data(data_path)
+    scaler = RobustScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_test = scaler.transform(X_test)
+    y_train = y_train.to_numpy()
+    y_test = y_test.to_numpy()
+
+    bundle = current_bundle()
+    base_models = base_models_of(bundle.model)
+    for _, estimator in base_models:
+        if 'n_jobs' in estimator.get_params():
+            estimator.set_params(n_jobs=1)
+    results = [measure(f'current ({bundle.version})', bundle.model, X_test, y_test, repeat=repeat)]
+
+    per_target = MultiOutputRegressor(StackingRegressor(base_models, final_estimator=Ridge(alpha=RIDGE_ALPHA), n_jobs=n_jobs))
+    start = time.perf_counter()
+    per_target.fit(X_train, y_train)
+    results.append(measure('per-target stack', per_target, X_test, y_test, time.perf_counter() - start, repeat))
+
+    native_models = [
+        (name, clone(estimator).set_params(multi_strategy=multi_strategy, tree_method='hist')
+         if type(estimator).__name__ == 'XGBRegressor' else clone(estimator))
+        for name, estimator in base_models
+    ]
+    native = MultiOutputStack(native_models, final_estimator=Ridge(alpha=RIDGE_ALPHA), n_jobs=n_jobs)
+    start = time.perf_counter()
+    native.fit(X_train, y_train)
+    results.append(measure(f'native stack ({multi_strategy})', native, X_test, y_test, time.perf_counter() - start, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the per-target stack with the native multi-output stack.')
+    parser.add_argument('--data', default=DATA_PATH, help='CSV with the features and targets')
+    parser.add_argument('--n-jobs', type=int, default=1, help='parallel base model fits of both variants')
+    parser.add_argument('--multi-strategy', default=NATIVE_MULTI_STRATEGY, choices=['multi_output_tree', 'one_output_per_tree'],
+                        help='xgboost multi_strategy of the native stack')
+    parser.add_argument('--repeat', type=int, default=50, help='repetitions of the latency measurements (median is reported)')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.data, args.n_jobs, args.multi_strategy, args.repeat)
+    headers = list(results[0])
+    print(tabulate([[result[key] for key in headers] for result in results], headers=headers, tablefmt='simple', floatfmt='.4g'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+## scripted, resumable training of the stacked multi-output model (see model_training.ipynb)
+#
+# usage: python -m modules.train [--n-jobs -1] [--activate] [--fresh]
+#
+# Same workflow as the notebook: 80/20 split, RobustScaler, randomized search (20 candidates x
+# 3 folds) for RandomForest and XGB, StackingRegressor(RF, XGB, LinearRegression -> Ridge) per
+# target in a MultiOutputRegressor. Differences:
+# - both searches run at the same time as (candidate, fold) tasks on one joblib pool of `--n-jobs`
+#   workers (every estimator uses one core, so the budget is never oversubscribed)
+# - every finished task is appended to search.jsonl, an interrupted run resumes where it stopped
+# - the out-of-fold base predictions (5 folds, like StackingRegressor) and the base models fitted
+#   on the full training data are cached per target, the Ridge meta-learner is fitted on the cache
+#   and the fitted StackingRegressor is assembled without training any base model again
+# With --native every base model is fitted once for both targets instead (see native_stack.py).
+# The result is published to the model registry (see model_registry.py).
+#
+# models/training/<run>/   search.jsonl, stack/ (out-of-fold predictions and fitted base models)
+# <run> is a hash of the training data and the search settings.
+
+# load packages
+import os
+import json
+import time
+import hashlib
+import uuid
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from tabulate import tabulate
+from sklearn.base import clone
+from sklearn.utils import Bunch
+from sklearn.model_selection import KFold, ParameterSampler, train_test_split
+from sklearn.preprocessing import RobustScaler
+from sklearn.ensemble import RandomForestRegressor, StackingRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from xgboost import XGBRegressor
+
+# functions
+from modules.preprocessing import COL_ORDER
+from modules.native_stack import MultiOutputStack
+from modules.model_registry import REGISTRY_DIR, TARGET_COLUMNS, publish_bundle
+
+
+DATA_PATH = 'data/df_clean_for_modeling_with_offshore_3y.csv'
+TRAINING_DIR = 'models/training'
+SEARCH_FILE = 'search.jsonl'
+RANDOM_STATE = 42
+TEST_SIZE = 0.2
+N_ITER = 20
+SEARCH_CV = 3
+STACK_CV = 5
+RIDGE_ALPHA = 0.1
+# xgboost multi_strategy of the native multi-output stack (see native_stack.py)
+NATIVE_MULTI_STRATEGY = 'one_output_per_tree'
+
+# name: (estimator, parameter distributions) of the searched base models
+SEARCHES = {
+    'random_forest': (
+        RandomForestRegressor(random_state=RANDOM_STATE, n_jobs=1),
+        {
+            'n_estimators': [100, 200, 500, 1000],
+            'max_depth': [10, 15, 20, None],
+            'min_samples_split': [2, 5, 10],
+            'min_samples_leaf': [1, 2, 4],
+            'bootstrap': [True, False]
+        }
+    ),
+    'xgboost': (
+        XGBRegressor(random_state=RANDOM_STATE, n_jobs=1),
+        {
+            'n_estimators': [100, 200, 500],
+            'learning_rate': [0.01, 0.05, 0.1, 0.2],
+            'max_depth': [3, 5, 7, 10],
+            'subsample': [0.6, 0.8, 1.0],
+            'colsample_bytree': [0.6, 0.8, 1.0]
+        }
+    ),
+}
+
+
+def load_modeling_data(data_path=DATA_PATH, features=COL_ORDER, targets=TARGET_COLUMNS):
+    """Loads the daily modeling data (features and targets).
+
+    Args:
+        data_path (str): CSV with a `date` column, the features and the electricity production.
+        features (list): Feature columns.
+        targets (list): Target columns (`windpower` is the sum of offshore and onshore wind).
+
+    Returns:
+        pd.DataFrame: Features and targets in the order of the CSV, the dates parsed.
+
+    Raises:
+        ValueError: If features or targets are missing.
+    """
+    df_wind_solar = pd.read_csv(data_path, sep=',', parse_dates=['date'])
+    # combine offshore and onshore wind contribution (needed for this model)
+    df_wind_solar['windpower'] = df_wind_solar.offshore_wind + df_wind_solar.onshore_wind
+
+    missing = (set(features) | set(targets)) - set(df_wind_solar.columns)
+    if missing:
+        raise ValueError(f"Columns {sorted(missing)} are missing in {data_path}.")
+    return df_wind_solar[['date'] + list(features) + list(targets)]
+
+
+def load_training_data(data_path=DATA_PATH, features=COL_ORDER, targets=TARGET_COLUMNS):
+    """Loads the modeling data and splits it into training and test set like the notebook.
+
+    Returns:
+        tuple: X_train, X_test, y_train, y_test (DataFrames).
+    """
+    df_wind_solar = load_modeling_data(data_path, features, targets)
+    return train_test_split(df_wind_solar[features], df_wind_solar[targets], test_size=TEST_SIZE, random_state=RANDOM_STATE)
+
+
+def run_id(X, y, searches=SEARCHES, n_iter=N_ITER):
+    """Returns a hash of the training data and the search settings (folder name of the checkpoints)."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    settings = {
+        name: [repr(estimator), distributions] for name, (estimator, distributions) in searches.items()
+    }
+    digest.update(json.dumps([settings, n_iter, SEARCH_CV, STACK_CV, RANDOM_STATE], sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def read_checkpoint(path):
+    """Reads the finished search tasks of a checkpoint file.
+
+    Returns:
+        dict: Score per (model, candidate, fold), an incomplete last line (interrupted write) is ignored.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[(record['model'], record['candidate'], record['fold'])] = record['score']
+    return done
+
+
+def _fit_and_score(task, estimator, params, X, y, train, test):
+    """Fits one candidate on one fold and returns the task, the R² on the held-out part (like `RandomizedSearchCV`) and the time."""
+    start = time.perf_counter()
+    estimator = clone(estimator).set_params(**params)
+    estimator.fit(X[train], y[train])
+    return task, estimator.score(X[test], y[test]), time.perf_counter() - start
+
+
+def parallel_search(X, y, checkpoint_path, searches=SEARCHES, n_iter=N_ITER, n_jobs=-1, verbose=True):
+    """Randomized search of all base models at the same time on one pool of workers.
+
+    The candidates and folds are the ones of `RandomizedSearchCV(n_iter, cv=3, random_state=42)`,
+    so the selected parameters are the same. Finished (candidate, fold) tasks are appended to the
+    checkpoint file and skipped when the search is started again.
+
+    Args:
+        X (np.ndarray): Scaled training features.
+        y (np.ndarray): Training targets with shape (rows, targets).
+        checkpoint_path (str): JSON lines file with the finished tasks.
+        searches (dict): name: (estimator, parameter distributions).
+        n_iter (int): Candidates per model.
+        n_jobs (int): Workers shared by all searches (-1 for all cores).
+        verbose (bool): Whether to print the finished tasks.
+
+    Returns:
+        dict: Best parameters and their mean score per model.
+    """
+    candidates = {
+        name: list(ParameterSampler(distributions, n_iter, random_state=RANDOM_STATE))
+        for name, (_, distributions) in searches.items()
+    }
+    folds = list(KFold(SEARCH_CV).split(X))
+
+    scores = read_checkpoint(checkpoint_path)
+    # interleave the models, so both searches progress at the same time
+    tasks = [
+        (name, candidate, fold)
+        for candidate in range(n_iter)
+        for name in searches
+        for fold in range(SEARCH_CV)
+        if (name, candidate, fold) not in scores
+    ]
+    if verbose:
+        print(f"Search: {len(scores)} of {len(scores) + len(tasks)} tasks done, running {len(tasks)}.")
+
+    results = Parallel(n_jobs=n_jobs, return_as='generator_unordered')(
+        delayed(_fit_and_score)(task, searches[task[0]][0], candidates[task[0]][task[1]], X, y, *folds[task[2]])
+        for task in tasks
+    )
+    with open(checkpoint_path, 'a+') as f:
+        # terminate a line cut off by an interruption
+        if f.tell() > 0:
+            f.seek(f.tell() - 1)
+            if f.read(1) != '\n':
+                f.write('\n')
+        for (name, candidate, fold), score, fit_time in results:
+            scores[(name, candidate, fold)] = score
+            record = {
+                'model': name, 'candidate': candidate, 'fold': fold, 'params': candidates[name][candidate],
+                'score': score, 'fit_time': fit_time,
+            }
+            f.write(json.dumps(record, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            if verbose:
+                print(f"[{len(scores)}] {name} candidate {candidate} fold {fold}: R² {score:.4f} ({fit_time:.1f}s)")
+
+    best = {}
+    for name in searches:
+        mean_scores = [np.mean([scores[(name, candidate, fold)] for fold in range(SEARCH_CV)]) for candidate in range(n_iter)]
+        # first of the best candidates, like the rank of RandomizedSearchCV
+        candidate = int(np.argmax(mean_scores))
+        best[name] = {'params': candidates[name][candidate], 'score': float(mean_scores[candidate])}
+    return best
+
+
+def _fit_base(task, estimator, X, y, train, test):
+    """Fits a base model on the training rows (None for all), returns the task and the model (no test rows) or its predictions of the test rows."""
+    if train is None:
+        # the unindexed arrays, the memory layout changes the last bits of LinearRegression
+        return task, clone(estimator).fit(X, y)
+    estimator = clone(estimator).fit(X[train], y[train])
+    return task, estimator.predict(X[test])
+
+
+def fit_stack(base_models, X, y, cache_dir, final_estimator=None, n_jobs=-1, verbose=True):
+    """Fits `MultiOutputRegressor(StackingRegressor(base_models, final_estimator))` from cached base models.
+
+    Every base model is fitted per target on the 5 cross-validation folds (out-of-fold predictions
+    for the meta-learner) and on all rows (used for the predictions), exactly like
+    `StackingRegressor.fit`. All fits run on one pool of workers and are cached, the meta-learner is
+    fitted on the cached out-of-fold predictions.
+
+    Args:
+        base_models (list): (name, estimator) of the base models.
+        X (np.ndarray): Scaled training features.
+        y (np.ndarray): Training targets with shape (rows, targets).
+        cache_dir (str): Folder of the cached predictions and models (must be specific to X, y and the base models).
+        final_estimator (object, optional): Meta-learner, defaults to `Ridge(alpha=0.1)`.
+        n_jobs (int): Workers (-1 for all cores).
+        verbose (bool): Whether to print the progress.
+
+    Returns:
+        MultiOutputRegressor: The fitted model.
+    """
+    if final_estimator is None:
+        final_estimator = Ridge(alpha=RIDGE_ALPHA)
+    os.makedirs(cache_dir, exist_ok=True)
+    folds = list(KFold(STACK_CV).split(X))
+
+    def cache_path(target, name, fold):
+        return os.path.join(cache_dir, f'{target}-{name}-' + (f'fold{fold}.npy' if fold is not None else 'full.pkl'))
+
+    # (target, base model, fold), fold None is the fit on all rows
+    tasks = [
+        (target, name, fold)
+        for target in range(y.shape[1])
+        for name, _ in base_models
+        for fold in [None] + list(range(STACK_CV))
+        if not os.path.exists(cache_path(target, name, fold))
+    ]
+    if verbose:
+        print(f"Stacking: {len(tasks)} base model fits to run.")
+
+    estimators = dict(base_models)
+    results = Parallel(n_jobs=n_jobs, return_as='generator_unordered')(
+        delayed(_fit_base)(task, estimators[task[1]], X, y[:, task[0]], *((None, None) if task[2] is None else folds[task[2]]))
+        for task in tasks
+    )
+    for (target, name, fold), result in results:
+        path = cache_path(target, name, fold)
+        # unique temporary name, two runs with the same checkpoints may write at the same time
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        if fold is None:
+            joblib.dump(result, tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, result)
+        os.replace(tmp_path, path)
+        if verbose:
+            print(f"{TARGET_COLUMNS[target] if target < len(TARGET_COLUMNS) else target} {name} "
+                  f"{'all rows' if fold is None else f'fold {fold}'} done")
+
+    stacks = []
+    for target in range(y.shape[1]):
+        # out-of-fold predictions in the row order of X, like `cross_val_predict`
+        X_meta = np.empty((len(X), len(base_models)))
+        for column, (name, _) in enumerate(base_models):
+            for fold, (_, test) in enumerate(folds):
+                X_meta[test, column] = np.load(cache_path(target, name, fold))
+
+        stack = StackingRegressor(estimators=base_models, final_estimator=final_estimator, cv=STACK_CV)
+        stack.estimators_ = [joblib.load(cache_path(target, name, None)) for name, _ in base_models]
+        stack.named_estimators_ = Bunch(**{name: estimator for (name, _), estimator in zip(base_models, stack.estimators_)})
+        stack.stack_method_ = ['predict'] * len(base_models)
+        stack.final_estimator_ = clone(final_estimator).fit(X_meta, y[:, target])
+        stacks.append(stack)
+
+    model = MultiOutputRegressor(StackingRegressor(estimators=base_models, final_estimator=final_estimator))
+    model.estimators_ = stacks
+    model.n_features_in_ = X.shape[1]
+    return model
+
+
+def evaluate(model, X_train, y_train, X_test, y_test, targets=TARGET_COLUMNS):
+    """Prints MSE, R² and adjusted R² of the training and test set per target (like the notebook).
+
+    Returns:
+        list: One row per target (target, MSE train/test, R² train/test, adjusted R² train/test).
+    """
+    def metrics(X, y):
+        prediction = model.predict(X)
+        r2 = r2_score(y, prediction, multioutput='raw_values')
+        n, p = X.shape
+        return mean_squared_error(y, prediction, multioutput='raw_values'), r2, 1 - (1 - r2) * ((n - 1) / (n - p - 1))
+
+    train_mse, train_r2, train_adj_r2 = metrics(X_train, y_train)
+    test_mse, test_r2, test_adj_r2 = metrics(X_test, y_test)
+    rows = [
+        [target, train_mse[i], test_mse[i], train_r2[i], test_r2[i], train_adj_r2[i], test_adj_r2[i]]
+        for i, target in enumerate(targets)
+    ]
+    headers = [
+        "Target", "MSE (Train)", "MSE (Test)", "R^2 (Train)", "R^2 (Test)", "Adjusted R^2 (Train)", "Adjusted R^2 (Test)"
+    ]
+    print("\n" + tabulate(rows, headers=headers, tablefmt="simple"))
+    return rows
+
+
+def train(data_path=DATA_PATH, training_dir=TRAINING_DIR, registry_dir=REGISTRY_DIR, n_iter=N_ITER, n_jobs=-1, native=False,
+          activate=False, verbose=True):
+    """Runs the complete training (search, stacking, evaluation) and publishes the model.
+
+    Args:
+        data_path (str): CSV with the features and targets.
+        training_dir (str): Folder of the checkpoints, every run resumes its own subfolder.
+        registry_dir (str): Folder of the model registry.
+        n_iter (int): Candidates per searched model.
+        n_jobs (int): Workers shared by all fits (-1 for all cores).
+        native (bool): Whether to fit a `MultiOutputStack` (every base model once for all targets, not cached)
+            instead of one stack per target.
+        activate (bool): Whether to make the new model the current version of the registry.
+        verbose (bool): Whether to print the progress.
+
+    Returns:
+        str: Version of the published bundle.
+    """
+    X_train, X_test, y_train, y_test = load_training_data(data_path)
+
+    # fit the scaler on training data only and apply it on test data
+    scaler = RobustScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    y_train = y_train.to_numpy()
+    y_test = y_test.to_numpy()
+
+    run_dir = os.path.join(training_dir, run_id(X_train_scaled, y_train, n_iter=n_iter))
+    os.makedirs(run_dir, exist_ok=True)
+    if verbose:
+        print(f"Checkpoints in {run_dir}")
+
+    best = parallel_search(X_train_scaled, y_train, os.path.join(run_dir, SEARCH_FILE), n_iter=n_iter, n_jobs=n_jobs, verbose=verbose)
+    for name, result in best.items():
+        print(f"Best Parameters for {name} (R² {result['score']:.4f}):", result['params'])
+
+    # the tuned models keep a single core each, the pool provides the parallelism
+    base_models = [
+        (name, clone(SEARCHES[name][0]).set_params(**best[name]['params'])) for name in SEARCHES
+    ] + [('linear_regression', LinearRegression())]
+    if native:
+        base_models = [
+            (name, estimator.set_params(multi_strategy=NATIVE_MULTI_STRATEGY, tree_method='hist')
+             if isinstance(estimator, XGBRegressor) else estimator)
+            for name, estimator in base_models
+        ]
+        model = MultiOutputStack(base_models, final_estimator=Ridge(alpha=RIDGE_ALPHA), cv=STACK_CV, n_jobs=n_jobs)
+        model.fit(X_train_scaled, y_train)
+    else:
+        params_hash = hashlib.sha256(json.dumps({name: best[name]['params'] for name in best}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        model = fit_stack(base_models, X_train_scaled, y_train, os.path.join(run_dir, 'stack', params_hash), n_jobs=n_jobs, verbose=verbose)
+
+    evaluate(model, X_train_scaled, y_train, X_test_scaled, y_test)
+
+    version = publish_bundle(scaler, model, list(X_train.columns), TARGET_COLUMNS, registry_dir, activate=activate)
+    print(f"Published model version {version}" + (" (current)" if activate else ""))
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the stacked multi-output model and publish it to the model registry.')
+    parser.add_argument('--data', default=DATA_PATH, help='CSV with the features and targets')
+    parser.add_argument('--training-dir', default=TRAINING_DIR, help='folder of the checkpoints')
+    parser.add_argument('--registry-dir', default=REGISTRY_DIR, help='folder of the model registry')
+    parser.add_argument('--n-iter', type=int, default=N_ITER, help='candidates per searched model')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='workers shared by both searches and the stacking (-1 for all cores)')
+    parser.add_argument('--native', action='store_true', help='fit every base model once for all targets (see native_stack.py)')
+    parser.add_argument('--activate', action='store_true', help='make the new model the current version')
+    parser.add_argument('--fresh', action='store_true', help='ignore the checkpoints of a previous run')
+    parser.add_argument('--quiet', action='store_true', help='only print the results')
+    args = parser.parse_args()
+
+    training_dir = args.training_dir
+    if args.fresh:
+        training_dir = os.path.join(training_dir, time.strftime('fresh-%Y%m%d-%H%M%S'))
+
+    train(args.data, training_dir, args.registry_dir, args.n_iter, args.n_jobs, args.native, args.activate, not args.quiet)
+
+
+if __name__ == '__main__':
+    main()
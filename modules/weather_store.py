@@ -0,0 +1,156 @@
+## persistent local store for the fetched daily weather data
+
+# load packages
+import sqlite3
+import datetime
+import contextlib
+import pandas as pd
+from zoneinfo import ZoneInfo
+
+
+# standard location of the store (next to the other data of the dashboard)
+STORE_PATH = 'data/weather_store.sqlite'
+# time zone of the requested daily values (see openMeteo_API.py)
+TIMEZONE = 'Europe/Berlin'
+
+
+def local_today(timezone=TIMEZONE):
+    """Returns the current date in the time zone of the daily weather values (independent of the server's time zone)."""
+    return datetime.datetime.now(ZoneInfo(timezone)).date()
+
+
+class WeatherStore:
+    """SQLite store of daily weather values keyed by (location, date, variable, issue date).
+
+    Every fetch is saved with the day it was issued, so older forecasts are kept as an archive
+    and the latest issue of each value is used for the predictions. A day is complete once it was
+    fetched after it was over (the past days hardly change anymore); forecast days are only
+    complete if they were fetched today.
+
+    Args:
+        path (str): Path of the SQLite database file. Created if it does not exist.
+    """
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        with self._connect() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS daily_weather (
+                    city TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    variable TEXT NOT NULL,
+                    issue_date TEXT NOT NULL,
+                    value REAL,
+                    PRIMARY KEY (city, date, variable, issue_date)
+                )
+            """)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # commits (or rolls back on errors) and closes the connection, `with sqlite3.connect()` only commits
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as con:
+            with con:
+                yield con
+
+    def missing_dates(self, cities, dates, variables, today=None):
+        """Returns the dates which are not stored yet or whose forecast is stale for at least one location.
+
+        Args:
+            cities (list): Location names.
+            dates (list): `datetime.date` objects to check.
+            variables (list): Daily variables which need to be complete.
+            today (datetime.date, optional): Issue date of a fetch today. Defaults to the current date in `TIMEZONE`.
+
+        Returns:
+            list: Sorted `datetime.date` objects which need to be fetched.
+        """
+        if today is None:
+            today = local_today()
+
+        query = f"""
+            SELECT city, date, variable, MAX(issue_date) AS issue_date
+            FROM daily_weather
+            WHERE date BETWEEN ? AND ?
+              AND city IN ({','.join('?' * len(cities))})
+              AND variable IN ({','.join('?' * len(variables))})
+            GROUP BY city, date, variable
+        """
+        with self._connect() as con:
+            stored = pd.read_sql_query(
+                query, con, params=[min(dates).isoformat(), max(dates).isoformat(), *cities, *variables]
+            )
+
+        missing = []
+        for date in dates:
+            # past days are final once issued after the day, forecast days need an issue from today
+            required_issue = min(date + datetime.timedelta(days=1), today).isoformat()
+            fresh = stored[(stored['date'] == date.isoformat()) & (stored['issue_date'] >= required_issue)]
+            if len(fresh) < len(cities) * len(variables):
+                missing.append(date)
+
+        return sorted(missing)
+
+    def write(self, weather_data, variables, issue_date=None):
+        """Saves fetched long-format weather data with its issue date (replacing a fetch of the same day).
+
+        Args:
+            weather_data (pd.DataFrame): Daily weather data with `date`, `city` and the weather variables.
+            variables (list): Daily variables to store.
+            issue_date (datetime.date, optional): Day the data was fetched. Defaults to the current date in `TIMEZONE`.
+        """
+        if issue_date is None:
+            issue_date = local_today()
+
+        long = weather_data.melt(id_vars=['city', 'date'], value_vars=variables, var_name='variable')
+        long['date'] = long['date'].dt.strftime('%Y-%m-%d')
+        long['issue_date'] = issue_date.isoformat()
+        # sqlite stores missing values as NULL
+        long['value'] = long['value'].astype(object).where(long['value'].notna(), None)
+
+        with self._connect() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO daily_weather (city, date, variable, issue_date, value) VALUES (?, ?, ?, ?, ?)",
+                long[['city', 'date', 'variable', 'issue_date', 'value']].itertuples(index=False, name=None)
+            )
+
+    def read(self, cities, start_date, end_date, variables):
+        """Reads the latest issue of every value in the same long format as `get_weather_forecast`.
+
+        Args:
+            cities (list): Location names (defines the order of the rows).
+            start_date (datetime.date): First day to read.
+            end_date (datetime.date): Last day to read (inclusive).
+            variables (list): Daily variables (defines the order of the columns).
+
+        Returns:
+            pd.DataFrame: Daily weather data with `time`, the weather variables, `date` and `city`.
+        """
+        query = f"""
+            SELECT w.city, w.date, w.variable, w.value
+            FROM daily_weather w
+            JOIN (
+                SELECT city, date, variable, MAX(issue_date) AS issue_date
+                FROM daily_weather
+                WHERE date BETWEEN ? AND ?
+                  AND city IN ({','.join('?' * len(cities))})
+                GROUP BY city, date, variable
+            ) latest USING (city, date, variable, issue_date)
+        """
+        with self._connect() as con:
+            stored = pd.read_sql_query(
+                query, con, params=[start_date.isoformat(), end_date.isoformat(), *cities]
+            )
+
+        weather_data = stored.pivot(index=['city', 'date'], columns='variable', values='value')
+        weather_data = weather_data.reindex(columns=variables).astype(float).reset_index()
+
+        # restore the order of the locations and dates
+        weather_data['city'] = pd.Categorical(weather_data['city'], categories=cities, ordered=True)
+        weather_data = weather_data.sort_values(['city', 'date'], ignore_index=True)
+        weather_data['city'] = weather_data['city'].astype(str)
+
+        weather_data.insert(0, 'time', weather_data.pop('date'))
+        weather_data['date'] = pd.to_datetime(weather_data['time'])
+        weather_data['city'] = weather_data.pop('city')
+        weather_data.columns.name = None
+
+        return weather_data
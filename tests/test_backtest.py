@@ -0,0 +1,74 @@
+## tests of the walk-forward backtest folds (run with: python -m pytest tests)
+
+# load packages
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+
+# functions
+from modules.backtest import rolling_origin_folds, unfitted_copy
+from modules.fast_inference import compile_model
+from modules.native_stack import MultiOutputStack
+from tests.test_fast_inference import stacked_model, training_data, tree_models
+
+
+def days(n_days, start='2021-10-01'):
+    """Returns consecutive days."""
+    return pd.Series(pd.date_range(start, periods=n_days, freq='D'))
+
+
+def test_expanding_folds():
+    dates = days(400)
+    folds = rolling_origin_folds(dates, initial_days=300, horizon_days=30)
+
+    assert [len(test_idx) for _, _, test_idx in folds] == [30, 30, 30, 10]
+    for origin, train_idx, test_idx in folds:
+        # training starts at the first day and ends right before the origin, the test days follow
+        assert train_idx[0] == 0
+        assert dates[train_idx[-1]] < origin == dates[test_idx[0]]
+    # the test periods cover every day after the initial period exactly once
+    np.testing.assert_array_equal(np.concatenate([test_idx for _, _, test_idx in folds]), np.arange(300, 400))
+
+
+def test_sliding_window():
+    dates = days(400)
+    folds = rolling_origin_folds(dates, initial_days=300, horizon_days=30, window='sliding', window_days=100)
+
+    for origin, train_idx, _ in folds:
+        assert len(train_idx) == 100
+        assert dates[train_idx[-1]] == origin - pd.Timedelta(days=1)
+    # without window_days the window has the length of the initial period
+    folds = rolling_origin_folds(dates, initial_days=300, horizon_days=30, window='sliding')
+    assert {len(train_idx) for _, train_idx, _ in folds} == {300}
+
+
+def test_step_days():
+    dates = days(400)
+    folds = rolling_origin_folds(dates, initial_days=300, horizon_days=30, step_days=10)
+
+    origins = [origin for origin, _, _ in folds]
+    assert all(later - earlier == pd.Timedelta(days=10) for earlier, later in zip(origins, origins[1:]))
+    # shorter steps than the horizon overlap the test periods
+    assert len(np.intersect1d(folds[0][2], folds[1][2])) == 20
+
+
+def test_invalid_folds():
+    with pytest.raises(ValueError):
+        rolling_origin_folds(days(300), initial_days=300, horizon_days=30)
+    with pytest.raises(ValueError):
+        rolling_origin_folds(days(400), initial_days=300, window='growing')
+
+
+def test_unfitted_copy():
+    X, y = training_data()
+    model = MultiOutputStack(tree_models(), final_estimator=Ridge(alpha=0.1), cv=3).fit(X, y)
+
+    copy = unfitted_copy(model)
+    assert type(copy) is MultiOutputStack and not hasattr(copy, 'estimators_')
+    assert dict(copy.estimators)['rf'].max_depth == 4 and not hasattr(dict(copy.estimators)['rf'], 'estimators_')
+    # the compiled model has no hyperparameters to refit it
+    with pytest.raises(ValueError):
+        unfitted_copy(compile_model(model))
+    # the sklearn stack with xgboost (missing=nan) is copied as well
+    assert not hasattr(unfitted_copy(stacked_model(X, y)), 'estimators_')
@@ -0,0 +1,102 @@
+## tests of the compiled flat-array inference (run with: python -m pytest tests)
+
+# load packages
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor, StackingRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.preprocessing import StandardScaler
+from xgboost import XGBRegressor
+
+# functions
+from modules.fast_inference import CompiledStack, compile_model
+from modules.model_registry import COMPILED_MAX_ROWS, load_bundle, publish_bundle
+from modules.native_stack import MultiOutputStack
+
+
+def training_data(n_rows=200, n_features=6, n_targets=2, seed=0):
+    """Returns random features and targets which depend on them."""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_rows, n_features))
+    y = X[:, :n_targets] * 3 + np.sin(X[:, 1:n_targets + 1]) + 0.1 * rng.standard_normal((n_rows, n_targets))
+    return X, y
+
+
+def tree_models():
+    """Returns random forest and xgboost base models without a linear model."""
+    return [
+        ('rf', RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0)),
+        ('xgb', XGBRegressor(n_estimators=5, max_depth=3, random_state=0)),
+    ]
+
+
+def test_stack_without_linear_model():
+    X, y = training_data()
+    model = MultiOutputRegressor(StackingRegressor(tree_models(), final_estimator=Ridge(alpha=0.1), cv=3)).fit(X, y)
+
+    compiled = compile_model(model)
+    assert compiled.linear_coef.shape == (0, X.shape[1])
+    assert compiled.n_features == X.shape[1]
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=1e-5, atol=1e-4)
+
+
+@pytest.mark.parametrize('multi_strategy', ['one_output_per_tree', 'multi_output_tree'])
+def test_native_stack_without_linear_model(multi_strategy):
+    X, y = training_data()
+    estimators = [
+        (name, estimator.set_params(multi_strategy=multi_strategy, tree_method='hist') if name == 'xgb' else estimator)
+        for name, estimator in tree_models()
+    ]
+    model = MultiOutputStack(estimators, final_estimator=Ridge(alpha=0.1), cv=3).fit(X, y)
+
+    compiled = compile_model(model)
+    assert compiled.linear_coef.shape == (0, X.shape[1])
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=1e-5, atol=1e-4)
+
+
+def stacked_model(X, y):
+    """Returns a fitted stack of random forest, xgboost and linear regression per target."""
+    models = tree_models() + [('lr', LinearRegression())]
+    return MultiOutputRegressor(StackingRegressor(models, final_estimator=Ridge(alpha=0.1), cv=3)).fit(X, y)
+
+
+def test_large_batch_in_blocks(monkeypatch):
+    X, y = training_data()
+    model = stacked_model(X, y)
+    compiled = compile_model(model)
+    X_large = np.random.default_rng(1).standard_normal((5000, X.shape[1]))
+
+    # small chunks and blocks, so the batch is walked in many (row chunk, tree block) parts
+    monkeypatch.setattr(CompiledStack, 'ROWS_PER_CHUNK', 1024)
+    monkeypatch.setattr(CompiledStack, 'PATHS_PER_BLOCK', 4096)
+    walked = []
+    leaf_positions = CompiledStack._leaf_positions
+
+    def counted(self, x_flat, n_rows, roots, has_nan):
+        walked.append(n_rows * len(roots))
+        return leaf_positions(self, x_flat, n_rows, roots, has_nan)
+
+    monkeypatch.setattr(CompiledStack, '_leaf_positions', counted)
+    predictions = compiled.predict(X_large)
+
+    # the path arrays do not grow with the batch
+    assert max(walked) <= 4096
+    assert sum(walked) == len(X_large) * len(compiled.roots)
+    np.testing.assert_allclose(predictions, model.predict(X_large), rtol=1e-5, atol=1e-4)
+    np.testing.assert_array_equal(predictions[:10], compiled.predict(X_large[:10]))
+
+
+def test_engine_chosen_by_batch_size(tmp_path, monkeypatch):
+    X, y = training_data()
+    version = publish_bundle(StandardScaler().fit(X), stacked_model(X, y), col_order=[f'f{i}' for i in range(X.shape[1])],
+                             target_columns=['a', 'b'], registry_dir=str(tmp_path))
+    bundle = load_bundle(version, registry_dir=str(tmp_path))
+
+    engines = []
+    monkeypatch.setattr(bundle.compiled, 'predict', lambda features: engines.append('compiled') or np.zeros((len(features), 2)))
+    monkeypatch.setattr(bundle.model, 'predict', lambda features: engines.append('sklearn') or np.zeros((len(features), 2)))
+    bundle.predict(X[:COMPILED_MAX_ROWS // 2])
+    bundle.predict(np.zeros((COMPILED_MAX_ROWS + 1, X.shape[1])))
+    bundle.predict(X[:5], engine='sklearn')
+    assert engines == ['compiled', 'sklearn', 'sklearn']